@@ -0,0 +1,154 @@
+"""Content-addressed cache of invoice analyses
+
+Entries are keyed by a SHA-256 of the uploaded bytes together with the prompt
+and model, so re-uploads of the same invoice skip the Claude call while any
+prompt or model change naturally invalidates old entries.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+from app.models import InvoiceAnalysisResult
+
+
+def make_cache_key(content_hash: str, prompt: str, model: str) -> str:
+    """Build the cache key for an upload analyzed with a given prompt/model
+
+    Args:
+        content_hash: Hex SHA-256 of the uploaded file
+    """
+    digest = hashlib.sha256()
+    digest.update(content_hash.encode("ascii"))
+    digest.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    digest.update(model.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """LRU + TTL cache of InvoiceAnalysisResult with optional disk persistence
+
+    Network signals are not cached - they depend on the threat database at
+    lookup time, so callers recompute them on every hit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 86400.0,
+        persist_dir: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries: "OrderedDict[str, Tuple[float, InvoiceAnalysisResult]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        """Create a cache configured from ANALYSIS_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "512")),
+            ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL", "86400")),
+            persist_dir=os.getenv("ANALYSIS_CACHE_DIR") or None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[InvoiceAnalysisResult]:
+        """Return the cached result for a key, or None on miss/expiry"""
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                self._insert(key, entry)
+
+        if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1].model_copy(deep=True)
+
+    def set(self, key: str, result: InvoiceAnalysisResult) -> None:
+        """Store a result, dropping its network signals"""
+        if not self.enabled:
+            return
+
+        stored = result.model_copy(update={"networkSignals": []}, deep=True)
+        entry = (time.time(), stored)
+        self._insert(key, entry)
+        self._save(key, entry)
+
+    def stats(self) -> dict:
+        """Hit/miss counters for the metrics endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "persistent": self.persist_dir is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _insert(self, key: str, entry: Tuple[float, InvoiceAnalysisResult]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._delete_file(evicted)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._delete_file(key)
+
+    def _path(self, key: str) -> Path:
+        return self.persist_dir / f"{key}.json"
+
+    def _load(self, key: str) -> Optional[Tuple[float, InvoiceAnalysisResult]]:
+        if not self.persist_dir:
+            return None
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text())
+            return data["storedAt"], InvoiceAnalysisResult(**data["result"])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Discarding unreadable cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def _save(self, key: str, entry: Tuple[float, InvoiceAnalysisResult]) -> None:
+        if not self.persist_dir:
+            return
+        stored_at, result = entry
+        tmp_path = self._path(key).with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"storedAt": stored_at, "result": result.model_dump()}))
+        tmp_path.replace(self._path(key))
+
+    def _delete_file(self, key: str) -> None:
+        if self.persist_dir:
+            self._path(key).unlink(missing_ok=True)
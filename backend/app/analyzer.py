@@ -1,54 +1,45 @@
 """Claude SDK Invoice Analyzer - Uses Claude's vision API to analyze invoices"""
 import os
+import asyncio
 import base64
+import hashlib
+import json
+import re
+import time
 from pathlib import Path
-from typing import List
-from anthropic import Anthropic
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from anthropic import AsyncAnthropic
+from pydantic import ValidationError
 from app.models import (
     InvoiceAnalysisResult,
     LocalCheck,
-    NetworkSignal
+    NetworkSignal,
+    ThreatRecord
 )
-from app.storage import get_all_threats, update_threat_seen_count
-
-
-def encode_image(image_path: str) -> str:
-    """Encode image to base64"""
-    with open(image_path, "rb") as image_file:
-        return base64.standard_b64encode(image_file.read()).decode("utf-8")
-
-
-def get_file_media_type(file_path: str) -> str:
-    """Get media type from file extension"""
-    ext = Path(file_path).suffix.lower()
-    media_types = {
-        ".pdf": "application/pdf",
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-    }
-    return media_types.get(ext, "application/pdf")
-
-
-class InvoiceAnalyzer:
-    """Analyzes invoices using Claude SDK"""
+from app.storage import (
+    find_similar_threats,
+    find_threat_by_vendor,
+    find_threats_by_template,
+    update_threat_seen_count
+)
+from app.template_hash import HASH_BITS
+from app.vendor_match import VENDOR_MATCH_LIMIT
+from app.analysis_cache import AnalysisCache, make_cache_key
+from app.pdf_text import InvoiceTextLayer, build_text_prompt
+from app.image_preprocess import preprocess_image_async
+from app.json_stream import IncrementalJSONParser
+from app.deferred import DeferredBatcher
+from app.rate_limit import AnthropicRateLimiter
 
-    def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+ANALYSIS_MODEL = "claude-sonnet-4-5-20250929"
 
-    def analyze_invoice_streaming(self, file_path: str):
-        """Analyze invoice with streaming progress updates
+# Cheaper first-pass model; borderline results are escalated to ANALYSIS_MODEL
+FAST_ANALYSIS_MODEL = "claude-haiku-4-5-20251001"
 
-        Yields progress updates as the analysis happens
-        """
-        # Read and encode the file
-        image_data = encode_image(file_path)
-        media_type = get_file_media_type(file_path)
+# Fields that must have streamed before a BLOCKED verdict can end generation
+EARLY_STOP_REQUIRED_FIELDS = ("invoiceId", "vendor", "amount", "fraudScore", "confidence")
 
-        yield {"type": "progress", "message": "File uploaded successfully", "step": 1}
-
-        # Construct the prompt
-        prompt = """You are an AI fraud detection agent for ShieldNet, analyzing invoices for potential fraud.
+ANALYSIS_PROMPT = """You are an AI fraud detection agent for ShieldNet, analyzing invoices for potential fraud.
 
 **IMPORTANT: This system is in testing mode. Low amounts (under $1) are acceptable for mainnet testing and should NOT be flagged as fraud simply because they are low. Focus on actual fraud indicators like suspicious vendor names, duplicate charges, or inflated quantities - not the amount itself.**
 
@@ -87,252 +78,539 @@ Analyze this invoice thoroughly and extract the following information:
 
    **Note: Low amounts alone are NOT a reason to block or hold. Approve low-amount invoices if they otherwise look legitimate.**
 
-Return your analysis in this EXACT JSON format:
-{
-  "invoiceId": "extracted invoice number",
-  "vendor": "vendor name",
-  "amount": total_amount_as_number,
-  "walletAddress": "0x...",
-  "fraudScore": score_0_to_100,
-  "confidence": confidence_0_to_100,
-  "status": "approved|hold|blocked",
-  "explanation": "brief explanation of the decision",
-  "localChecks": [
-    {"name": "check name", "status": "pass|fail|warning", "detail": "specific detail"},
-    ...
-  ]
-}
+Record your analysis by calling the `record_invoice_analysis` tool. Fill in every field; set walletAddress to null only if the invoice contains no wallet address.
 
 Be thorough but remember: low amounts are acceptable for testing. Focus on real fraud indicators."""
 
-        yield {"type": "progress", "message": "Sending to Claude AI for analysis...", "step": 2}
 
-        # Build content
-        if media_type == "application/pdf":
-            file_content = {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": media_type,
-                    "data": image_data,
-                },
-            }
-        else:
-            file_content = {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": media_type,
-                    "data": image_data,
-                },
-            }
+ANALYSIS_TOOL_NAME = "record_invoice_analysis"
 
-        yield {"type": "progress", "message": "AI is analyzing the invoice...", "step": 3}
+ANALYSIS_INSTRUCTION = f"Analyze this invoice and record the result with the {ANALYSIS_TOOL_NAME} tool."
 
-        # Stream Claude API response
-        full_response = ""
-        with self.client.messages.stream(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2048,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        file_content,
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
-                }
-            ],
-        ) as stream:
-            for text in stream.text_stream:
-                full_response += text
-                yield {"type": "stream", "text": text}
-
-        yield {"type": "progress", "message": "Parsing analysis results...", "step": 4}
-
-        # Parse the JSON response
-        import json
-        response_text = full_response
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-
-        analysis_data = json.loads(response_text)
+# Fields Claude fills in; ShieldNet adds networkSignals and currency itself.
+# Streamed tool input follows this order, so the decision fields come before
+# the long explanation and local checks.
+ANALYSIS_TOOL_FIELDS = (
+    "invoiceId", "vendor", "amount", "walletAddress",
+    "fraudScore", "confidence", "status", "explanation", "localChecks",
+)
 
-        yield {"type": "progress", "message": "Checking ShieldNet threat database...", "step": 5}
+# Rough input-token costs used to admit calls before Claude reports the real count
+IMAGE_INPUT_TOKENS = 1600  # An image at the 1568px preprocessing limit
+PDF_PAGE_INPUT_TOKENS = 2100  # Page image plus its extracted text
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?!s)")
 
-        # Generate network signals
-        network_signals = self._generate_network_signals(
-            analysis_data["vendor"],
-            analysis_data["fraudScore"]
-        )
+# Attempts per model before an unusable reply becomes an error
+MAX_PARSE_ATTEMPTS = 2
 
-        # Convert local checks
-        local_checks = [
-            LocalCheck(**check) for check in analysis_data["localChecks"]
-        ]
+# Blocked-invoice reasons quoted in the template context are cut to this length
+TEMPLATE_REASON_CHARS = 200
 
-        # Extract wallet address
-        wallet_address = analysis_data.get("walletAddress")
-        print(f"\n{'='*60}")
-        print(f"EXTRACTED WALLET ADDRESS: {wallet_address}")
-        print(f"{'='*60}\n")
 
-        # Create the result
-        result = InvoiceAnalysisResult(
-            invoiceId=analysis_data["invoiceId"],
-            status=analysis_data["status"],
-            confidence=analysis_data["confidence"],
-            fraudScore=analysis_data["fraudScore"],
-            vendor=analysis_data["vendor"],
-            amount=float(analysis_data["amount"]),
-            currency="USDC",
-            walletAddress=wallet_address,
-            explanation=analysis_data["explanation"],
-            localChecks=local_checks,
-            networkSignals=network_signals
-        )
+class AnalysisParseError(ValueError):
+    """Claude's reply did not contain a valid analysis tool call"""
 
-        yield {"type": "complete", "result": result.model_dump()}
 
-    def analyze_invoice(self, file_path: str) -> InvoiceAnalysisResult:
-        """Analyze an invoice using Claude's vision API
+class AnalysisSuperseded(Exception):
+    """Thrown into analyze_invoice_streaming when the caller has settled the
+    invoice itself, e.g. by a pre-screen rule on the fields streamed so far"""
 
-        Args:
-            file_path: Path to the uploaded invoice file
 
-        Returns:
-            InvoiceAnalysisResult with comprehensive fraud analysis
-        """
-        # Read and encode the file
-        image_data = encode_image(file_path)
-        media_type = get_file_media_type(file_path)
+def _inline_schema(node: Any, defs: dict) -> Any:
+    """Resolve $refs and drop pydantic's titles from a JSON schema"""
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_schema(defs[node["$ref"].split("/")[-1]], defs)
+        return {
+            key: _inline_schema(value, defs)
+            for key, value in node.items()
+            if key not in ("title", "$defs")
+        }
+    if isinstance(node, list):
+        return [_inline_schema(item, defs) for item in node]
+    return node
 
-        # Construct the prompt for invoice analysis
-        prompt = """You are an AI fraud detection agent for ShieldNet, analyzing invoices for potential fraud.
 
-**IMPORTANT: This system is in testing mode. Low amounts (under $1) are acceptable for mainnet testing and should NOT be flagged as fraud simply because they are low. Focus on actual fraud indicators like suspicious vendor names, duplicate charges, or inflated quantities - not the amount itself.**
+def build_analysis_tool() -> dict:
+    """Tool definition whose input schema is generated from InvoiceAnalysisResult"""
+    schema = InvoiceAnalysisResult.model_json_schema()
+    defs = schema.get("$defs", {})
+    properties = {
+        name: _inline_schema(schema["properties"][name], defs)
+        for name in ANALYSIS_TOOL_FIELDS
+    }
+    for name in ("fraudScore", "confidence"):
+        properties[name].update(minimum=0, maximum=100)
+    return {
+        "name": ANALYSIS_TOOL_NAME,
+        "description": "Record the fraud analysis of the invoice.",
+        "input_schema": {
+            "type": "object",
+            "properties": properties,
+            "required": list(ANALYSIS_TOOL_FIELDS),
+        },
+    }
 
-Analyze this invoice thoroughly and extract the following information:
 
-1. **Basic Information:**
-   - Invoice ID
-   - Vendor name
-   - Total amount
-   - Currency (usually USDC)
-   - **Wallet Address** (REQUIRED - Extract the payment/recipient wallet address from the invoice. Look for Ethereum/Base address starting with "0x" followed by 40 hexadecimal characters. This is where the payment will be sent.)
+ANALYSIS_TOOL = build_analysis_tool()
 
-2. **Fraud Detection Analysis:**
-   - Calculate a fraud score (0-100, where 100 is definitely fraud)
-   - Determine if this should be: APPROVED, HOLD, or BLOCKED
-   - Your confidence level (0-100)
+# Everything about the request that shapes the result, for cache keys
+ANALYSIS_SIGNATURE = ANALYSIS_PROMPT + json.dumps(ANALYSIS_TOOL, sort_keys=True)
 
-3. **Local Security Checks** (create 3-5 checks):
-   - PO Match: Does this match purchase orders? (pass/fail/warning)
-   - Hours Verification: Are hours reasonable? (pass/fail/warning)
-   - Vendor Trust: Is this a trusted vendor? (pass/fail/warning)
-   - Line Item Review: Do line items look legitimate? (pass/fail/warning)
-   - Format Validity: Does the invoice format look legitimate? (pass/fail/warning)
 
-4. **Fraud Indicators** to check for (IGNORE low amounts):
-   - Duplicate charges
-   - Suspicious or fake vendor names
-   - Missing or invalid invoice numbers
-   - Template similarities to known fraud
-   - Inconsistent information
+def encode_bytes(data: bytes) -> str:
+    """Encode raw file bytes to base64"""
+    return base64.standard_b64encode(data).decode("utf-8")
 
-5. **Decision Rules:**
-   - APPROVED: fraud_score < 30, no critical red flags
-   - HOLD: fraud_score 30-70, or warning flags present
-   - BLOCKED: fraud_score > 70, or clear fraud indicators
 
-   **Note: Low amounts alone are NOT a reason to block or hold. Approve low-amount invoices if they otherwise look legitimate.**
+def encode_image(image_path: str) -> str:
+    """Encode image to base64"""
+    with open(image_path, "rb") as image_file:
+        return encode_bytes(image_file.read())
 
-Return your analysis in this EXACT JSON format:
-{
-  "invoiceId": "extracted invoice number",
-  "vendor": "vendor name",
-  "amount": total_amount_as_number,
-  "walletAddress": "0x...",
-  "fraudScore": score_0_to_100,
-  "confidence": confidence_0_to_100,
-  "status": "approved|hold|blocked",
-  "explanation": "brief explanation of the decision",
-  "localChecks": [
-    {"name": "check name", "status": "pass|fail|warning", "detail": "specific detail"},
-    ...
-  ]
-}
 
-Be thorough but remember: low amounts are acceptable for testing. Focus on real fraud indicators."""
+def get_file_media_type(file_path: str) -> str:
+    """Get media type from file extension"""
+    ext = Path(file_path).suffix.lower()
+    media_types = {
+        ".pdf": "application/pdf",
+        ".png": "image/png",
+        ".jpg": "image/jpeg",
+        ".jpeg": "image/jpeg",
+    }
+    return media_types.get(ext, "application/pdf")
+
+
+def build_file_block(file_bytes: bytes, media_type: str) -> dict:
+    """Build the Claude content block for an invoice file
 
-        # Build content - use document for PDF, image for images
-        if media_type == "application/pdf":
-            file_content = {
-                "type": "document",
-                "source": {
-                    "type": "base64",
-                    "media_type": media_type,
-                    "data": image_data,
-                },
+    PDFs are sent as document blocks, images as image blocks.
+    """
+    block_type = "document" if media_type == "application/pdf" else "image"
+    return {
+        "type": block_type,
+        "source": {
+            "type": "base64",
+            "media_type": media_type,
+            "data": encode_bytes(file_bytes),
+        },
+    }
+
+
+def build_template_context(matches: List[Tuple[ThreatRecord, int]]) -> Optional[str]:
+    """Describe known-fraud invoices sharing this invoice's layout, for Claude
+
+    Args:
+        matches: (threat, Hamming distance) pairs from find_threats_by_template
+
+    Returns:
+        The context text, or None if there are no matches
+    """
+    if not matches:
+        return None
+    lines = [
+        f"- \"{threat.vendor}\" ({1 - distance / HASH_BITS:.0%} similar layout), "
+        f"blocked because: {threat.reason[:TEMPLATE_REASON_CHARS]}"
+        for threat, distance in matches
+    ]
+    return (
+        "ShieldNet template check: this invoice's first-page layout matches "
+        "invoices already blocked as fraud in the network:\n"
+        + "\n".join(lines)
+        + "\n\nWeigh this under \"Template similarities to known fraud\". Unrelated "
+        "vendors can share a plain layout, so a match alone is not proof of fraud."
+    )
+
+
+def build_analysis_request(
+    file_bytes: bytes,
+    media_type: str,
+    model: str = ANALYSIS_MODEL,
+    text_layer: Optional[InvoiceTextLayer] = None,
+    template_context: Optional[str] = None
+) -> dict:
+    """Build the Messages API arguments for analyzing one invoice
+
+    The static fraud instructions go in a system block marked for prompt
+    caching, so repeat calls read them (and the tool definition before them)
+    from cache instead of paying for them as fresh input tokens. Only the
+    invoice itself varies per request: the PDF's extracted text when it has
+    a text layer, else the file itself, plus any known-fraud template
+    matches (see build_template_context).
+
+    Claude is forced to answer through the analysis tool, so the result
+    arrives as schema-shaped JSON rather than free text.
+    """
+    if text_layer is not None:
+        invoice_block = {"type": "text", "text": build_text_prompt(text_layer)}
+    else:
+        invoice_block = build_file_block(file_bytes, media_type)
+    content = [invoice_block]
+    if template_context:
+        content.append({"type": "text", "text": template_context})
+    content.append({"type": "text", "text": ANALYSIS_INSTRUCTION})
+
+    return {
+        "model": model,
+        "max_tokens": 2048,
+        "tools": [ANALYSIS_TOOL],
+        "tool_choice": {"type": "tool", "name": ANALYSIS_TOOL_NAME},
+        "system": [
+            {
+                "type": "text",
+                "text": ANALYSIS_PROMPT,
+                "cache_control": {"type": "ephemeral"},
             }
-        else:
-            file_content = {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": media_type,
-                    "data": image_data,
-                },
+        ],
+        "messages": [
+            {
+                "role": "user",
+                "content": content,
             }
+        ],
+    }
+
+
+def estimate_input_tokens(
+    file_bytes: bytes,
+    media_type: str,
+    text_layer: Optional[InvoiceTextLayer] = None,
+    template_context: Optional[str] = None
+) -> int:
+    """Approximate uncached input tokens of an analysis request
+
+    The system prompt is left out: after the first call it is a prompt-cache
+    read, which doesn't count towards the input tokens/minute limit.
+    """
+    context_tokens = len(template_context or "") // 4
+    if text_layer is not None:
+        return (len(build_text_prompt(text_layer)) + len(ANALYSIS_INSTRUCTION)) // 4 + context_tokens
+    if media_type.startswith("image/"):
+        return IMAGE_INPUT_TOKENS + context_tokens
+    # Pages inside compressed object streams aren't visible; assume at least one
+    pages = max(1, len(PDF_PAGE_PATTERN.findall(file_bytes)))
+    return pages * PDF_PAGE_INPUT_TOKENS + context_tokens
+
+
+def parse_analysis_tool_call(message) -> dict:
+    """Extract and validate the analysis from Claude's forced tool call
+
+    Raises:
+        AnalysisParseError: if there is no tool call or its input does not
+            match the InvoiceAnalysisResult schema
+    """
+    for block in message.content:
+        if block.type == "tool_use" and block.name == ANALYSIS_TOOL_NAME:
+            try:
+                validated = InvoiceAnalysisResult.model_validate({**block.input, "networkSignals": []})
+            except ValidationError as e:
+                raise AnalysisParseError(f"Invalid analysis from Claude: {e}") from e
+            return validated.model_dump(include=set(ANALYSIS_TOOL_FIELDS))
+
+    raise AnalysisParseError(f"Claude did not call {ANALYSIS_TOOL_NAME} (stop reason: {message.stop_reason})")
 
-        # Call Claude API with newest model
-        message = self.client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2048,
-            messages=[
+
+def _parse_band(value: str) -> Tuple[int, int]:
+    """Parse an ESCALATION_BAND value like "25,75" into (low, high)"""
+    low, high = (int(part) for part in value.split(","))
+    return low, high
+
+
+class InvoiceAnalyzer:
+    """Analyzes invoices using Claude SDK
+
+    Uses the async Anthropic client so a long vision call never blocks the
+    event loop; a single uvicorn worker can keep many analyses in flight.
+
+    Invoices go through a model cascade: the fast model answers first and
+    only borderline results - a fraud score inside the escalation band or a
+    failing local check - are re-analyzed by the full model.
+    """
+
+    def __init__(self, api_key: str):
+        # Honors ANTHROPIC_BASE_URL, so load tests can point at a fake server
+        self.client = AsyncAnthropic(api_key=api_key)
+        # Interactive calls are admitted and retried by the shared limiter
+        # instead of the SDK's own retry loop
+        self.limiter = AnthropicRateLimiter.from_env()
+        self.limited_client = self.client.with_options(max_retries=0)
+        self.cache = AnalysisCache.from_env()
+        # Queue for non-urgent invoices, analyzed through Message Batches
+        self.deferred = DeferredBatcher.from_env(self.client)
+
+        self.model = os.getenv("ANALYZER_MODEL", ANALYSIS_MODEL)
+        # An empty ANALYZER_FAST_MODEL disables the cascade
+        self.fast_model = os.getenv("ANALYZER_FAST_MODEL", FAST_ANALYSIS_MODEL) or None
+        self.escalation_band = _parse_band(os.getenv("ESCALATION_BAND", "25,75"))
+        if self.fast_model and self.fast_model != self.model:
+            self.tiers = [self.fast_model, self.model]
+        else:
+            self.tiers = [self.model]
+        # Cache entries depend on the whole cascade, not just the final model
+        self.model_signature = "->".join(self.tiers) + f"@{self.escalation_band}"
+        self.tier_stats = {
+            model: {"calls": 0, "totalSeconds": 0.0} for model in self.tiers
+        }
+        self.first_pass_count = 0
+        self.escalation_count = 0
+        # Analyses served from a PDF text layer vs. sent to the vision model
+        self.path_stats = {
+            path: {"count": 0, "totalSeconds": 0.0} for path in ("text", "vision")
+        }
+        self.image_stats = {"images": 0, "bytesIn": 0, "bytesOut": 0, "totalSeconds": 0.0}
+        # End streaming generation as soon as the model commits to BLOCKED
+        self.stop_on_blocked = os.getenv("STREAM_STOP_ON_BLOCKED", "false").lower() == "true"
+        self.early_stop_count = 0
+        # Streamed replies abandoned mid-generation - by the client, or superseded
+        # by a pre-screen rule - and the output they didn't produce
+        self.cancel_counts = {"cancelled": 0, "preScreenStops": 0, "outputTokensSaved": 0}
+        # Tool calls that validated vs. had to be re-requested
+        self.parse_counts = {"parsed": 0, "failures": 0, "retries": 0}
+        # Token usage across all Claude calls, including prompt-cache reads/writes
+        self.usage = {
+            "calls": 0,
+            "inputTokens": 0,
+            "outputTokens": 0,
+            "cacheReadInputTokens": 0,
+            "cacheCreationInputTokens": 0,
+        }
+
+    async def _create_message(self, request: dict, estimated_tokens: int):
+        """messages.create through the rate limiter"""
+        async def send():
+            response = await self.limited_client.messages.with_raw_response.create(**request)
+            return await response.parse(), response.headers
+
+        return await self.limiter.run(send, estimated_tokens)
+
+    async def _open_stream(self, request: dict, estimated_tokens: int):
+        """Start messages.stream through the rate limiter
+
+        Rate-limit errors surface when the request is sent, before any event
+        has been read, so a retry never repeats output. Close the returned
+        stream with `async with`.
+        """
+        async def send():
+            stream = await self.limited_client.messages.stream(**request).__aenter__()
+            return stream, stream.response.headers
+
+        return await self.limiter.run(send, estimated_tokens)
+
+    def _record_usage(self, usage) -> None:
+        """Accumulate the usage block of a Claude response"""
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        self.usage["calls"] += 1
+        self.usage["inputTokens"] += usage.input_tokens
+        self.usage["outputTokens"] += usage.output_tokens
+        self.usage["cacheReadInputTokens"] += cache_read
+        self.usage["cacheCreationInputTokens"] += cache_write
+        print(
+            f"Claude usage: {usage.input_tokens} input, {usage.output_tokens} output, "
+            f"{cache_read} cache read, {cache_write} cache write"
+        )
+
+    def usage_stats(self) -> dict:
+        """Token usage counters for the metrics endpoint"""
+        cached = self.usage["cacheReadInputTokens"]
+        total_input = self.usage["inputTokens"] + cached + self.usage["cacheCreationInputTokens"]
+        return {
+            **self.usage,
+            "cacheReadRatio": cached / total_input if total_input else 0.0,
+        }
+
+    def _parse_reply(self, model: str, message, attempt: int) -> Optional[dict]:
+        """Validate a reply's tool call, or return None if it should be retried
+
+        Raises:
+            AnalysisParseError: on the last attempt for this model
+        """
+        try:
+            analysis_data = parse_analysis_tool_call(message)
+        except AnalysisParseError as e:
+            self.parse_counts["failures"] += 1
+            if attempt + 1 >= MAX_PARSE_ATTEMPTS:
+                raise
+            self.parse_counts["retries"] += 1
+            print(f"Retrying {model} after unusable reply: {e}")
+            return None
+        self.parse_counts["parsed"] += 1
+        return analysis_data
+
+    def parse_stats(self) -> dict:
+        """Schema validation counters for the metrics endpoint"""
+        replies = self.parse_counts["parsed"] + self.parse_counts["failures"]
+        return {
+            **self.parse_counts,
+            "retryRate": self.parse_counts["retries"] / replies if replies else 0.0,
+        }
+
+    def _record_tier(self, model: str, seconds: float) -> None:
+        stats = self.tier_stats[model]
+        stats["calls"] += 1
+        stats["totalSeconds"] += seconds
+
+    def _needs_escalation(self, model: str, analysis_data: dict) -> bool:
+        """Whether a first-pass result is too uncertain to accept"""
+        if model == self.tiers[-1]:
+            return False
+
+        self.first_pass_count += 1
+        low, high = self.escalation_band
+        failing_checks = any(
+            check.get("status") == "fail" for check in analysis_data.get("localChecks", [])
+        )
+        escalate = low <= analysis_data["fraudScore"] <= high or failing_checks
+        if escalate:
+            self.escalation_count += 1
+            print(f"Escalating from {model}: fraud score {analysis_data['fraudScore']}, failing checks: {failing_checks}")
+        return escalate
+
+    def _record_path(self, text_layer: Optional[InvoiceTextLayer], seconds: float) -> None:
+        stats = self.path_stats["text" if text_layer is not None else "vision"]
+        stats["count"] += 1
+        stats["totalSeconds"] += seconds
+
+    async def _prepare_image(self, file_bytes: bytes, media_type: str) -> Tuple[bytes, str]:
+        """Shrink an image upload before it is base64-encoded"""
+        started = time.perf_counter()
+        processed, media_type = await preprocess_image_async(file_bytes, media_type)
+        self.image_stats["images"] += 1
+        self.image_stats["bytesIn"] += len(file_bytes)
+        self.image_stats["bytesOut"] += len(processed)
+        self.image_stats["totalSeconds"] += time.perf_counter() - started
+        return processed, media_type
+
+    def preprocessing_stats(self) -> dict:
+        stats = self.image_stats
+        return {
+            "images": stats["images"],
+            "bytesIn": stats["bytesIn"],
+            "bytesOut": stats["bytesOut"],
+            "reduction": 1 - stats["bytesOut"] / stats["bytesIn"] if stats["bytesIn"] else 0.0,
+            "avgSeconds": stats["totalSeconds"] / stats["images"] if stats["images"] else 0.0,
+        }
+
+    def input_path_stats(self) -> dict:
+        """Share of invoices served by the text path and per-path latency"""
+        total = sum(stats["count"] for stats in self.path_stats.values())
+        return {
+            "textPathShare": self.path_stats["text"]["count"] / total if total else 0.0,
+            **{
+                path: {
+                    "count": stats["count"],
+                    "avgSeconds": stats["totalSeconds"] / stats["count"] if stats["count"] else 0.0,
+                }
+                for path, stats in self.path_stats.items()
+            },
+        }
+
+    def routing_stats(self) -> dict:
+        """Per-tier latency and escalation rate for the metrics endpoint"""
+        return {
+            "tiers": [
                 {
-                    "role": "user",
-                    "content": [
-                        file_content,
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ],
+                    "model": model,
+                    "calls": stats["calls"],
+                    "avgSeconds": stats["totalSeconds"] / stats["calls"] if stats["calls"] else 0.0,
                 }
+                for model, stats in self.tier_stats.items()
             ],
-        )
+            "escalationBand": list(self.escalation_band),
+            "escalations": self.escalation_count,
+            "earlyStops": self.early_stop_count,
+            "escalationRate": (
+                self.escalation_count / self.first_pass_count if self.first_pass_count else 0.0
+            ),
+        }
 
-        # Extract the response
-        response_text = message.content[0].text
+    def _record_cancellation(self, streamed_chars: int, reason: str = "cancelled") -> None:
+        """Count a closed stream and estimate the output tokens it saved
 
-        # Parse the JSON response
-        import json
-        # Find JSON in the response (Claude sometimes wraps it in markdown)
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
+        The saving is the average reply length so far minus what had already
+        streamed (about four characters per token of JSON).
 
-        analysis_data = json.loads(response_text)
+        Args:
+            streamed_chars: Tool input characters received before the stream closed
+            reason: "cancelled" when the caller gave up, "preScreenStops" when
+                a pre-screen rule settled the invoice
+        """
+        self.cancel_counts[reason] += 1
+        calls = self.usage["calls"]
+        if calls:
+            expected = self.usage["outputTokens"] / calls
+            self.cancel_counts["outputTokensSaved"] += max(0, round(expected - streamed_chars / 4))
+
+    def cancellation_stats(self) -> dict:
+        """Cancelled and pre-screen-stopped streams and estimated output tokens saved, for the metrics endpoint"""
+        return dict(self.cancel_counts)
+
+    def _should_stop_early(self, fields: dict) -> bool:
+        """Whether a streamed BLOCKED verdict already has enough to act on"""
+        return (
+            self.stop_on_blocked
+            and fields.get("status") == "blocked"
+            and all(name in fields for name in EARLY_STOP_REQUIRED_FIELDS)
+        )
 
+    def _early_stop_analysis(self, fields: dict) -> dict:
+        """Complete a partially streamed analysis that was cut off after BLOCKED
+
+        Blocked is already the most conservative decision, so the result is
+        neither escalated nor cached.
+        """
+        return {
+            **fields,
+            "explanation": fields.get("explanation") or (
+                f"Blocked with fraud score {fields['fraudScore']}; generation was stopped "
+                "as soon as the verdict was reached, so no detailed explanation is available."
+            ),
+            "localChecks": fields.get("localChecks") or [],
+        }
+
+    def _analysis_key(
+        self, content_hash: str, template_hash: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        """Cache key and known-fraud template context of an analysis
+
+        Template matches are looked up before Claude is called so the model
+        weighs them. They are part of the cache key: a layout that matches a
+        newly blocked invoice gets a fresh analysis rather than a cached one
+        made without that context.
+        """
+        template_context = None
+        if template_hash:
+            template_context = build_template_context(find_threats_by_template(template_hash))
+        cache_key = make_cache_key(
+            content_hash, ANALYSIS_SIGNATURE + (template_context or ""), self.model_signature
+        )
+        return cache_key, template_context
+
+    def _from_cache(
+        self, cache_key: str, template_hash: Optional[str] = None
+    ) -> InvoiceAnalysisResult | None:
+        """Look up a cached analysis and refresh its network signals"""
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        # Persisted entries may predate the current template hash
+        cached.templateHash = template_hash
+        cached.networkSignals = self._generate_network_signals(
+            cached.vendor,
+            cached.fraudScore,
+            template_hash
+        )
+        return cached
+
+    def _build_result(
+        self, analysis_data: dict, template_hash: Optional[str] = None
+    ) -> InvoiceAnalysisResult:
+        """Turn Claude's parsed analysis into an InvoiceAnalysisResult"""
         # Generate network signals based on threat database
         network_signals = self._generate_network_signals(
             analysis_data["vendor"],
-            analysis_data["fraudScore"]
+            analysis_data["fraudScore"],
+            template_hash
         )
 
         # Convert local checks to LocalCheck objects
@@ -346,8 +624,7 @@ Be thorough but remember: low amounts are acceptable for testing. Focus on real
         print(f"EXTRACTED WALLET ADDRESS: {wallet_address}")
         print(f"{'='*60}\n")
 
-        # Create the result
-        result = InvoiceAnalysisResult(
+        return InvoiceAnalysisResult(
             invoiceId=analysis_data["invoiceId"],
             status=analysis_data["status"],
             confidence=analysis_data["confidence"],
@@ -358,31 +635,261 @@ Be thorough but remember: low amounts are acceptable for testing. Focus on real
             walletAddress=wallet_address,
             explanation=analysis_data["explanation"],
             localChecks=local_checks,
-            networkSignals=network_signals
+            networkSignals=network_signals,
+            templateHash=template_hash
+        )
+
+    async def analyze_invoice_streaming(
+        self,
+        file_bytes: bytes,
+        media_type: str,
+        text_layer: Optional[InvoiceTextLayer] = None,
+        content_hash: Optional[str] = None,
+        template_hash: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Analyze invoice with streaming progress updates
+
+        Yields progress updates as the analysis happens. Takes the same
+        arguments as analyze_invoice.
+
+        `field` events name the model that produced them. Only those with
+        `final` set come from the last tier (or a BLOCKED verdict that ends
+        the analysis); the others may be replaced by an escalated pass, so
+        act on `final` fields or on the `complete` event. When a BLOCKED
+        verdict ends a first pass, the fields streamed before it are sent
+        again with `final` set.
+
+        Throw AnalysisSuperseded into the generator (athrow) to stop it
+        because the invoice was settled otherwise; it closes the stream and
+        returns, and is counted apart from client cancellations.
+        """
+        yield {"type": "progress", "message": "File uploaded successfully", "step": 1}
+
+        content_hash = content_hash or hashlib.sha256(file_bytes).hexdigest()
+        cache_key, template_context = self._analysis_key(content_hash, template_hash)
+        cached = self._from_cache(cache_key, template_hash)
+        if cached is not None:
+            yield {"type": "progress", "message": "Matched a previous analysis of this file", "step": 5}
+            yield {"type": "complete", "result": cached.model_dump(), "cached": True}
+            return
+
+        if text_layer is None and media_type.startswith("image/"):
+            file_bytes, media_type = await self._prepare_image(file_bytes, media_type)
+
+        yield {"type": "progress", "message": "Sending to Claude AI for analysis...", "step": 2}
+
+        analysis_started = time.perf_counter()
+        estimated_tokens = estimate_input_tokens(file_bytes, media_type, text_layer, template_context)
+        for model in self.tiers:
+            request = build_analysis_request(file_bytes, media_type, model, text_layer, template_context)
+            # A borderline first pass is escalated, so its fields may be streamed again
+            final_tier = model == self.tiers[-1]
+
+            for attempt in range(MAX_PARSE_ATTEMPTS):
+                yield {"type": "progress", "message": "AI is analyzing the invoice...", "step": 3}
+
+                # Stream the tool input JSON, surfacing each field as it completes
+                started = time.perf_counter()
+                parser = IncrementalJSONParser()
+                stopped_early = False
+                streamed_chars = 0
+                stream = await self._open_stream(request, estimated_tokens)
+                try:
+                    async with stream:
+                        async for event in stream:
+                            if event.type != "input_json":
+                                continue
+                            streamed_chars += len(event.partial_json)
+                            yield {"type": "stream", "text": event.partial_json}
+                            for name, value in parser.feed(event.partial_json):
+                                if name == "status":
+                                    stopped_early = self._should_stop_early(parser.fields)
+                                    if stopped_early and not final_tier:
+                                        # The verdict ends the analysis, so the
+                                        # provisional fields before it are final
+                                        for earlier, earlier_value in parser.fields.items():
+                                            if earlier == "status":
+                                                continue
+                                            yield {
+                                                "type": "field",
+                                                "name": earlier,
+                                                "value": earlier_value,
+                                                "model": model,
+                                                "final": True,
+                                            }
+                                yield {
+                                    "type": "field",
+                                    "name": name,
+                                    "value": value,
+                                    "model": model,
+                                    "final": final_tier or stopped_early,
+                                }
+                            if stopped_early:
+                                # Leaving the context closes the stream and ends generation
+                                break
+                        if stopped_early:
+                            final_message = stream.current_message_snapshot
+                        else:
+                            final_message = await stream.get_final_message()
+                except AnalysisSuperseded:
+                    # Leaving the context above has already closed the stream
+                    self._record_cancellation(streamed_chars, "preScreenStops")
+                    return
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The caller gave up mid-reply; leaving the context above
+                    # has already closed the stream
+                    self._record_cancellation(streamed_chars)
+                    raise
+                self._record_tier(model, time.perf_counter() - started)
+                self._record_usage(final_message.usage)
+
+                if stopped_early:
+                    break
+
+                yield {"type": "progress", "message": "Parsing analysis results...", "step": 4}
+
+                analysis_data = self._parse_reply(model, final_message, attempt)
+                if analysis_data is not None:
+                    break
+                yield {"type": "progress", "message": "Analysis was incomplete - retrying...", "step": 3}
+
+            if stopped_early:
+                self.early_stop_count += 1
+                analysis_data = self._early_stop_analysis(parser.fields)
+                yield {"type": "progress", "message": "BLOCKED verdict reached - stopped generation early", "step": 4}
+                break
+
+            if not self._needs_escalation(model, analysis_data):
+                break
+
+            yield {
+                "type": "progress",
+                "message": f"Borderline result (fraud score {analysis_data['fraudScore']}) - escalating to a deeper review...",
+                "step": 3
+            }
+
+        self._record_path(text_layer, time.perf_counter() - analysis_started)
+
+        yield {"type": "progress", "message": "Checking ShieldNet threat database...", "step": 5}
+
+        result = self._build_result(analysis_data, template_hash)
+        if not stopped_early:
+            self.cache.set(cache_key, result)
+
+        yield {"type": "complete", "result": result.model_dump()}
+
+    async def analyze_invoice(
+        self,
+        file_bytes: bytes,
+        media_type: str,
+        text_layer: Optional[InvoiceTextLayer] = None,
+        content_hash: Optional[str] = None,
+        template_hash: Optional[str] = None
+    ) -> InvoiceAnalysisResult:
+        """Analyze an invoice using Claude's vision API
+
+        Args:
+            file_bytes: Contents of the uploaded invoice file
+            media_type: MIME type of the file (see get_file_media_type)
+            text_layer: Extracted PDF text to send instead of the document
+            content_hash: SHA-256 of file_bytes, if the caller already has it
+            template_hash: Layout hash of the first page (app/template_hash.py),
+                matched against known-fraud templates for Claude's context and
+                the network signals
+
+        Returns:
+            InvoiceAnalysisResult with comprehensive fraud analysis
+        """
+        content_hash = content_hash or hashlib.sha256(file_bytes).hexdigest()
+        cache_key, template_context = self._analysis_key(content_hash, template_hash)
+        cached = self._from_cache(cache_key, template_hash)
+        if cached is not None:
+            return cached
+
+        if text_layer is None and media_type.startswith("image/"):
+            file_bytes, media_type = await self._prepare_image(file_bytes, media_type)
+
+        analysis_started = time.perf_counter()
+        estimated_tokens = estimate_input_tokens(file_bytes, media_type, text_layer, template_context)
+        for model in self.tiers:
+            request = build_analysis_request(file_bytes, media_type, model, text_layer, template_context)
+            for attempt in range(MAX_PARSE_ATTEMPTS):
+                started = time.perf_counter()
+                message = await self._create_message(request, estimated_tokens)
+                self._record_tier(model, time.perf_counter() - started)
+                self._record_usage(message.usage)
+
+                analysis_data = self._parse_reply(model, message, attempt)
+                if analysis_data is not None:
+                    break
+
+            if not self._needs_escalation(model, analysis_data):
+                break
+        self._record_path(text_layer, time.perf_counter() - analysis_started)
+
+        result = self._build_result(analysis_data, template_hash)
+        self.cache.set(cache_key, result)
+
+        return result
+
+    async def analyze_invoice_deferred(
+        self,
+        file_bytes: bytes,
+        media_type: str,
+        text_layer: Optional[InvoiceTextLayer] = None,
+        content_hash: Optional[str] = None,
+        template_hash: Optional[str] = None
+    ) -> InvoiceAnalysisResult:
+        """Analyze an invoice through the batch queue instead of interactively
+
+        Takes the same arguments as analyze_invoice. The invoice goes
+        straight to the full model - escalating would mean waiting for a
+        second batch - and may take minutes to hours to come back.
+
+        Raises:
+            DeferredAnalysisError: if the batch request failed or expired
+        """
+        content_hash = content_hash or hashlib.sha256(file_bytes).hexdigest()
+        # The full model's answer is what the cascade would escalate to, so
+        # it serves interactive lookups of the same file too
+        cache_key, template_context = self._analysis_key(content_hash, template_hash)
+        cached = self._from_cache(cache_key, template_hash)
+        if cached is not None:
+            return cached
+
+        if text_layer is None and media_type.startswith("image/"):
+            file_bytes, media_type = await self._prepare_image(file_bytes, media_type)
+
+        message = await self.deferred.submit(
+            build_analysis_request(file_bytes, media_type, self.model, text_layer, template_context)
         )
+        self._record_usage(message.usage)
+        # A reply can't be retried without queueing another batch
+        analysis_data = self._parse_reply(self.model, message, MAX_PARSE_ATTEMPTS - 1)
 
+        result = self._build_result(analysis_data, template_hash)
+        self.cache.set(cache_key, result)
         return result
 
     def _generate_network_signals(
-        self, vendor: str, fraud_score: int
+        self, vendor: str, fraud_score: int, template_hash: Optional[str] = None
     ) -> List[NetworkSignal]:
         """Generate network signals based on threat database
 
         Args:
             vendor: Vendor name from invoice
             fraud_score: Calculated fraud score
+            template_hash: Layout hash of the invoice's first page, if any
 
         Returns:
             List of network signals
         """
         signals = []
-        threats = get_all_threats()
 
-        # Check if vendor is in threat database
-        vendor_threats = [t for t in threats if t.vendor.lower() == vendor.lower()]
+        # Check if vendor is in threat database (indexed by normalized name)
+        threat = find_threat_by_vendor(vendor)
 
-        if vendor_threats:
-            threat = vendor_threats[0]
+        if threat:
             signals.append(
                 NetworkSignal(
                     type="flagged",
@@ -397,7 +904,38 @@ Be thorough but remember: low amounts are acceptable for testing. Focus on real
             )
             # Update the seen count
             update_threat_seen_count(vendor)
-        else:
+
+        # Look-alike names of known fraudulent vendors (typosquats, added suffixes)
+        similar_threats = [
+            (similar, similarity)
+            for similar, similarity in find_similar_threats(vendor, limit=VENDOR_MATCH_LIMIT + 1)
+            if not threat or similar.id != threat.id
+        ]
+        for similar, similarity in similar_threats[:VENDOR_MATCH_LIMIT]:
+            signals.append(
+                NetworkSignal(
+                    type="seen",
+                    description=f"Name resembles known fraudulent vendor \"{similar.vendor}\" "
+                                f"({similarity:.0%} similar)",
+                    similarity=similarity
+                )
+            )
+
+        # Layouts reused from known fraudulent invoices. Unrelated invoices can
+        # share a plain layout, so this informs the verdict but never sets it
+        if template_hash:
+            for match, distance in find_threats_by_template(template_hash):
+                if threat and match.id == threat.id:
+                    continue
+                signals.append(
+                    NetworkSignal(
+                        type="seen",
+                        description=f"Layout matches a blocked invoice from \"{match.vendor}\"",
+                        similarity=round(1 - distance / HASH_BITS, 3)
+                    )
+                )
+
+        if not signals:
             # Vendor is clean in network
             if fraud_score < 30:
                 signals.append(
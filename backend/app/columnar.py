@@ -0,0 +1,308 @@
+"""Compact column storage for transactions and invoices
+
+A pydantic model costs several hundred bytes per record before its nested
+lists: an instance dict, a fields-set and its own copy of every string -
+"USDC", "paid", the vendor name, the ISO date. The memory backend instead
+keeps each field in its own column: amounts in float arrays, statuses as
+one-byte codes, vendors, currencies and other repeated text as IDs into a
+shared StringTable, timestamps as seconds, and free text packed into one
+buffer per column. A record is just a row number; models are only built
+when storage hands records to the API.
+
+Columns also make aggregates cheap: sums by status or vendor are bincounts
+over the arrays with NumPy, without creating an object per record.
+"""
+import math
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, get_args
+from app.models import InvoiceAnalysisResult, LocalCheck, NetworkSignal, Transaction
+from app.vendor_match import normalize_vendor
+
+try:
+    import numpy
+except ImportError:  # numpy is optional - without it aggregates are summed in Python
+    numpy = None
+
+TRANSACTION_STATUSES = get_args(Transaction.model_fields["status"].annotation)
+INVOICE_STATUSES = get_args(InvoiceAnalysisResult.model_fields["status"].annotation)
+CHECK_STATUSES = get_args(LocalCheck.model_fields["status"].annotation)
+SIGNAL_TYPES = get_args(NetworkSignal.model_fields["type"].annotation)
+
+# Status code of a replaced transaction, skipped by aggregates
+DISCARDED = -1
+
+_EPOCH = datetime(1970, 1, 1)
+# Marks a date kept as text because seconds wouldn't give it back exactly
+_TEXT_DATE = -(2 ** 63)
+
+
+class StringTable:
+    """Interned strings: each distinct value is stored once and referred to by ID"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._values: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, string_id: int) -> str:
+        return self._values[string_id]
+
+    def id(self, value: str) -> int:
+        """ID of `value`, adding it if it's new"""
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return string_id
+
+    def find(self, value: str) -> Optional[int]:
+        """ID of `value`, or None if it was never added"""
+        return self._ids.get(value)
+
+
+class TextColumn:
+    """Append-only column of strings (or None) packed into one UTF-8 buffer"""
+
+    def __init__(self):
+        self._data = bytearray()
+        self._ends = array("Q")
+        self._nulls = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        if self._nulls[row]:
+            return None
+        start = self._ends[row - 1] if row else 0
+        return self._data[start:self._ends[row]].decode()
+
+    def append(self, value: Optional[str]) -> None:
+        if value is not None:
+            self._data += value.encode()
+        self._ends.append(len(self._data))
+        self._nulls.append(value is None)
+
+
+def _date_seconds(value: str) -> int:
+    """Seconds since 1970 for a naive ISO timestamp to the second, else _TEXT_DATE"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return _TEXT_DATE
+    if moment.tzinfo is not None or moment.isoformat(timespec="seconds") != value:
+        return _TEXT_DATE
+    return (moment - _EPOCH) // timedelta(seconds=1)
+
+
+def _sum_by(
+    groups: array, amounts: array, statuses: array, size: int
+) -> List[Tuple[float, int]]:
+    """(total amount, count) per group ID in 0..size-1, skipping discarded rows"""
+    if numpy is not None and len(amounts):
+        # Zero-copy views of the arrays; they must be gone before the next append
+        live = numpy.frombuffer(statuses, dtype=numpy.int8) != DISCARDED
+        codes = numpy.frombuffer(groups, dtype=groups.typecode)[live]
+        totals = numpy.bincount(
+            codes, weights=numpy.frombuffer(amounts, dtype=numpy.float64)[live], minlength=size
+        )
+        counts = numpy.bincount(codes, minlength=size)
+        return list(zip(totals.tolist(), counts.tolist()))
+    sums = [0.0] * size
+    counts = [0] * size
+    for group, amount, status in zip(groups, amounts, statuses):
+        if status != DISCARDED:
+            sums[group] += amount
+            counts[group] += 1
+    return list(zip(sums, counts))
+
+
+class TransactionColumns:
+    """Transactions stored by column; rows are numbered in save order"""
+
+    def __init__(self, strings: Optional[StringTable] = None):
+        self._strings = strings if strings is not None else StringTable()
+        self._ids = TextColumn()
+        self._statuses = array("b")
+        self._vendors = array("I")
+        self._vendor_keys = array("I")
+        self._amounts = array("d")
+        self._currencies = array("I")
+        self._dates = array("q")
+        self._text_dates: Dict[int, str] = {}
+        self._reasons = TextColumn()
+        self._invoice_ids = TextColumn()
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    def append(self, transaction: Transaction) -> int:
+        """Store a transaction and return its row"""
+        row = len(self._amounts)
+        strings = self._strings
+        self._ids.append(transaction.id)
+        self._statuses.append(TRANSACTION_STATUSES.index(transaction.status))
+        self._vendors.append(strings.id(transaction.vendor))
+        self._vendor_keys.append(strings.id(normalize_vendor(transaction.vendor)))
+        self._amounts.append(transaction.amount)
+        self._currencies.append(strings.id(transaction.currency))
+        seconds = _date_seconds(transaction.date)
+        if seconds == _TEXT_DATE:
+            self._text_dates[row] = transaction.date
+        self._dates.append(seconds)
+        self._reasons.append(transaction.reason)
+        self._invoice_ids.append(transaction.invoiceId)
+        return row
+
+    def discard(self, row: int) -> None:
+        """Leave a replaced row out of aggregates; its values stay readable"""
+        self._statuses[row] = DISCARDED
+
+    def get(self, row: int) -> Transaction:
+        strings = self._strings
+        return Transaction(
+            id=self._ids[row],
+            status=self.status(row),
+            vendor=strings[self._vendors[row]],
+            amount=self._amounts[row],
+            currency=strings[self._currencies[row]],
+            date=self.date(row),
+            reason=self._reasons[row],
+            invoiceId=self._invoice_ids[row],
+        )
+
+    def status(self, row: int) -> str:
+        return TRANSACTION_STATUSES[self._statuses[row]]
+
+    def vendor_key(self, row: int) -> str:
+        """normalize_vendor() of the row's vendor"""
+        return self._strings[self._vendor_keys[row]]
+
+    def amount(self, row: int) -> float:
+        return self._amounts[row]
+
+    def date(self, row: int) -> str:
+        seconds = self._dates[row]
+        if seconds == _TEXT_DATE:
+            return self._text_dates[row]
+        return (_EPOCH + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+    def totals_by_status(self) -> Dict[str, Tuple[float, int]]:
+        """(total amount, count) of the current transactions per status"""
+        sums = _sum_by(self._statuses, self._amounts, self._statuses, len(TRANSACTION_STATUSES))
+        return {status: sums[code] for code, status in enumerate(TRANSACTION_STATUSES) if sums[code][1]}
+
+    def totals_by_vendor(self) -> Dict[str, Tuple[float, int]]:
+        """(total amount, count) of the current transactions per vendor name"""
+        sums = _sum_by(self._vendors, self._amounts, self._statuses, len(self._strings))
+        return {self._strings[vendor]: total for vendor, total in enumerate(sums) if total[1]}
+
+
+class InvoiceColumns:
+    """Invoice analysis results stored by column; rows are numbered in save order
+
+    Each invoice's local checks and network signals are consecutive rows of
+    their own columns, up to the invoice's entry in the *_ends arrays.
+    """
+
+    def __init__(self, strings: Optional[StringTable] = None):
+        self._strings = strings if strings is not None else StringTable()
+        self._invoice_ids = TextColumn()
+        self._statuses = array("b")
+        self._confidences = array("i")
+        self._fraud_scores = array("i")
+        self._vendors = array("I")
+        self._vendor_keys = array("I")
+        self._amounts = array("d")
+        self._currencies = array("I")
+        self._explanations = TextColumn()
+        self._wallet_addresses = TextColumn()
+        self._template_hashes = TextColumn()
+
+        self._check_ends = array("I")
+        self._check_names = array("I")
+        self._check_statuses = array("b")
+        self._check_details = TextColumn()
+
+        self._signal_ends = array("I")
+        self._signal_types = array("b")
+        self._signal_descriptions = TextColumn()
+        self._signal_similarities = array("d")  # NaN when there is none
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    def append(self, invoice: InvoiceAnalysisResult) -> int:
+        """Store an invoice and return its row"""
+        row = len(self._amounts)
+        strings = self._strings
+        self._invoice_ids.append(invoice.invoiceId)
+        self._statuses.append(INVOICE_STATUSES.index(invoice.status))
+        self._confidences.append(invoice.confidence)
+        self._fraud_scores.append(invoice.fraudScore)
+        self._vendors.append(strings.id(invoice.vendor))
+        self._vendor_keys.append(strings.id(normalize_vendor(invoice.vendor)))
+        self._amounts.append(invoice.amount)
+        self._currencies.append(strings.id(invoice.currency))
+        self._explanations.append(invoice.explanation)
+        self._wallet_addresses.append(invoice.walletAddress)
+        self._template_hashes.append(invoice.templateHash)
+
+        for check in invoice.localChecks:
+            self._check_names.append(strings.id(check.name))
+            self._check_statuses.append(CHECK_STATUSES.index(check.status))
+            self._check_details.append(check.detail)
+        self._check_ends.append(len(self._check_names))
+
+        for signal in invoice.networkSignals:
+            self._signal_types.append(SIGNAL_TYPES.index(signal.type))
+            self._signal_descriptions.append(signal.description)
+            self._signal_similarities.append(
+                math.nan if signal.similarity is None else signal.similarity
+            )
+        self._signal_ends.append(len(self._signal_types))
+        return row
+
+    def get(self, row: int) -> InvoiceAnalysisResult:
+        strings = self._strings
+        checks = range(self._check_ends[row - 1] if row else 0, self._check_ends[row])
+        signals = range(self._signal_ends[row - 1] if row else 0, self._signal_ends[row])
+        return InvoiceAnalysisResult(
+            invoiceId=self._invoice_ids[row],
+            status=self.status(row),
+            confidence=self._confidences[row],
+            fraudScore=self._fraud_scores[row],
+            localChecks=[
+                LocalCheck(
+                    name=strings[self._check_names[i]],
+                    status=CHECK_STATUSES[self._check_statuses[i]],
+                    detail=self._check_details[i],
+                )
+                for i in checks
+            ],
+            networkSignals=[
+                NetworkSignal(
+                    type=SIGNAL_TYPES[self._signal_types[i]],
+                    description=self._signal_descriptions[i],
+                    similarity=None if math.isnan(self._signal_similarities[i])
+                    else self._signal_similarities[i],
+                )
+                for i in signals
+            ],
+            explanation=self._explanations[row],
+            vendor=strings[self._vendors[row]],
+            amount=self._amounts[row],
+            currency=strings[self._currencies[row]],
+            walletAddress=self._wallet_addresses[row],
+            templateHash=self._template_hashes[row],
+        )
+
+    def status(self, row: int) -> str:
+        return INVOICE_STATUSES[self._statuses[row]]
+
+    def vendor_key(self, row: int) -> str:
+        """normalize_vendor() of the row's vendor"""
+        return self._strings[self._vendor_keys[row]]
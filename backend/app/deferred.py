@@ -0,0 +1,172 @@
+"""Deferred invoice analysis through the Anthropic Message Batches API
+
+Invoices that are not time-critical are queued instead of analyzed right
+away. The queue is submitted as one batch once it is full or has waited
+long enough, at batch pricing (half the interactive rate). The batch is
+then polled until it ends, and each caller is handed its own result.
+"""
+import asyncio
+import os
+import uuid
+from typing import List, Set
+
+
+class DeferredAnalysisError(Exception):
+    """A queued request failed inside its batch"""
+
+
+class _QueuedRequest:
+    """A request waiting in the queue or in a running batch"""
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.custom_id = uuid.uuid4().hex
+        self.attempts = 0
+
+
+class DeferredBatcher:
+    """Collects Messages requests and runs them as Message Batches
+
+    Requests whose batch expired or was canceled before they ran are
+    re-queued into the next batch, up to max_attempts submissions.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_batch_size: int = 100,
+        flush_seconds: float = 60.0,
+        poll_seconds: float = 30.0,
+        max_attempts: int = 2
+    ):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.flush_seconds = flush_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+
+        self._queue: List[_QueuedRequest] = []
+        self._timer: asyncio.TimerHandle | None = None
+        # Strong references to running batches so they aren't garbage collected
+        self._batches: Set[asyncio.Task] = set()
+        self.counts = {
+            "queued": 0,
+            "batches": 0,
+            "succeeded": 0,
+            "errored": 0,
+            "expired": 0,
+            "canceled": 0,
+            "resubmitted": 0,
+        }
+
+    @classmethod
+    def from_env(cls, client) -> "DeferredBatcher":
+        """Create a batcher configured from DEFERRED_* environment variables"""
+        return cls(
+            client,
+            max_batch_size=int(os.getenv("DEFERRED_BATCH_SIZE", "100")),
+            flush_seconds=float(os.getenv("DEFERRED_FLUSH_SECONDS", "60")),
+            poll_seconds=float(os.getenv("DEFERRED_POLL_SECONDS", "30")),
+            max_attempts=int(os.getenv("DEFERRED_MAX_ATTEMPTS", "2"))
+        )
+
+    async def submit(self, params: dict):
+        """Queue a Messages request and wait for its batch to finish
+
+        Returns:
+            The Message produced for the request
+
+        Raises:
+            DeferredAnalysisError: if the request errored, or expired on
+                every attempt
+        """
+        request = _QueuedRequest(params)
+        self.counts["queued"] += 1
+        self._enqueue(request)
+        return await request.future
+
+    def _enqueue(self, request: _QueuedRequest) -> None:
+        self._queue.append(request)
+        if len(self._queue) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self.flush)
+
+    def flush(self) -> None:
+        """Submit everything queued so far as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+
+        requests, self._queue = self._queue[:self.max_batch_size], self._queue[self.max_batch_size:]
+        task = asyncio.create_task(self._run_batch(requests))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+        if self._queue:
+            self.flush()
+
+    async def _run_batch(self, requests: List[_QueuedRequest]) -> None:
+        by_id = {request.custom_id: request for request in requests}
+        for request in requests:
+            request.attempts += 1
+
+        try:
+            batch = await self.client.messages.batches.create(requests=[
+                {"custom_id": request.custom_id, "params": request.params}
+                for request in requests
+            ])
+            self.counts["batches"] += 1
+            print(f"Submitted deferred batch {batch.id} with {len(requests)} invoice(s)")
+
+            while batch.processing_status != "ended":
+                await asyncio.sleep(self.poll_seconds)
+                batch = await self.client.messages.batches.retrieve(batch.id)
+
+            async for entry in await self.client.messages.batches.results(batch.id):
+                request = by_id.pop(entry.custom_id, None)
+                if request is not None:
+                    self._settle(request, entry.result)
+        except Exception as e:
+            print(f"Deferred batch failed: {type(e).__name__}: {e}")
+            for request in by_id.values():
+                if not request.future.done():
+                    request.future.set_exception(DeferredAnalysisError(f"Batch failed: {e}"))
+            return
+
+        # Requests the results file did not mention
+        for request in by_id.values():
+            if not request.future.done():
+                request.future.set_exception(DeferredAnalysisError("No result returned for request"))
+
+    def _settle(self, request: _QueuedRequest, result) -> None:
+        """Resolve one request from its batch result"""
+        if request.future.done():
+            # The caller stopped waiting
+            return
+
+        self.counts[result.type] += 1
+        if result.type == "succeeded":
+            request.future.set_result(result.message)
+        elif result.type == "errored":
+            request.future.set_exception(
+                DeferredAnalysisError(f"Request errored: {result.error.error.message}")
+            )
+        elif request.attempts < self.max_attempts:
+            # Expired or canceled before it ran - try again in the next batch
+            self.counts["resubmitted"] += 1
+            self._enqueue(request)
+        else:
+            request.future.set_exception(
+                DeferredAnalysisError(f"Request {result.type} after {request.attempts} attempt(s)")
+            )
+
+    def stats(self) -> dict:
+        """Queue and outcome counters for the metrics endpoint"""
+        return {
+            **self.counts,
+            "pending": len(self._queue),
+            "batchesRunning": len(self._batches),
+        }
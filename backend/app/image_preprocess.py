@@ -0,0 +1,108 @@
+"""Shrink PNG/JPG invoice uploads before they are sent to Claude
+
+Phone photos arrive at up to 10MB and full camera resolution, far more than
+the vision model can use. Each image is auto-rotated from its EXIF
+orientation, downscaled to the model's useful resolution, converted to
+grayscale when it carries no real color and recompressed as JPEG.
+
+The work is CPU-bound, so it runs in a process pool off the event loop.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+from PIL import Image, ImageOps, ImageStat
+
+# Claude downsamples anything with a longer edge than this, so larger
+# images only cost bandwidth and memory
+MAX_LONG_EDGE = 1568
+JPEG_QUALITY = 85
+# Mean HSV saturation (0-255) below which an image is treated as black and white
+GRAYSCALE_SATURATION = 16
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _is_effectively_grayscale(image: Image.Image) -> bool:
+    """True when color adds nothing - scanned or photographed black-on-white paper"""
+    sample = image.convert("RGB")
+    sample.thumbnail((64, 64))
+    saturation = sample.convert("HSV").getchannel("S")
+    return ImageStat.Stat(saturation).mean[0] < GRAYSCALE_SATURATION
+
+
+def preprocess_image(file_bytes: bytes, media_type: str) -> Tuple[bytes, str]:
+    """Rotate, downscale, desaturate and recompress an invoice image
+
+    Returns:
+        The processed bytes and media type, or the originals if processing
+        would not make the upload any smaller
+    """
+    with Image.open(io.BytesIO(file_bytes)) as original:
+        image = ImageOps.exif_transpose(original)
+        resized = max(image.size) > MAX_LONG_EDGE
+        if resized:
+            image.thumbnail((MAX_LONG_EDGE, MAX_LONG_EDGE), Image.LANCZOS)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha; flatten transparent areas onto white paper
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+
+        image = image.convert("L" if _is_effectively_grayscale(image) else "RGB")
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    processed = output.getvalue()
+    if len(processed) >= len(file_bytes) and not resized:
+        return file_bytes, media_type
+    return processed, "image/jpeg"
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """Lazily start the preprocessing pool; IMAGE_PREPROCESS_WORKERS=0 disables it"""
+    global _pool
+    workers = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "2"))
+    if workers <= 0:
+        return None
+    if _pool is None:
+        # spawn, not fork: the server process has live threads and an event loop
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def preprocess_image_async(file_bytes: bytes, media_type: str) -> Tuple[bytes, str]:
+    """Run preprocess_image in the process pool
+
+    Falls back to the original bytes if preprocessing is disabled, the
+    image can't be decoded - Claude may still be able to read it - or a
+    worker died (e.g. killed for running out of memory). A broken pool is
+    replaced, so the next upload gets a fresh one.
+    """
+    global _pool
+    pool = _get_pool()
+    if pool is None:
+        return file_bytes, media_type
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, preprocess_image, file_bytes, media_type)
+    except BrokenProcessPool as e:
+        print(f"Image preprocessing pool broke, sending original and restarting it: {e}")
+        # Concurrent failures share one broken pool; only the first replaces it
+        if _pool is pool:
+            _pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        return file_bytes, media_type
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Image preprocessing failed, sending original: {e}")
+        return file_bytes, media_type
@@ -0,0 +1,144 @@
+"""Single-flight coordination of concurrent identical invoice analyses
+
+The first request for a given content hash starts the analysis as a
+background task; identical requests arriving while it runs attach to that
+task instead of starting their own Claude call (and their own payment).
+
+Each analysis counts the requests currently waiting on it, so the stream
+endpoint can tell when its last client has disconnected. Once the analysis
+has published its `complete` event it is committed: the result is being
+recorded (saved, paid, reported) and must run to the end.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.models import InvoiceAnalysisResult
+
+
+class InflightAnalysis:
+    """A running analysis that any number of requests can follow
+
+    Every progress event is recorded, so a request that attaches late
+    replays what it missed and then follows the live stream.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[dict] = []
+        self.done = False
+        # Set by the complete event; from then on nobody may cancel the analysis
+        self.committed = False
+        self.followers = 0
+        # Requests currently subscribed to or awaiting this analysis
+        self.watchers = 0
+        self.task: asyncio.Task | None = None
+        self._updated = asyncio.Event()
+
+    def publish(self, event: dict) -> None:
+        """Record an event and wake every subscriber"""
+        if event["type"] == "complete":
+            self.committed = True
+        self.events.append(event)
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def subscribe(
+        self,
+        idle_timeout: Optional[Callable[[], Optional[float]]] = None
+    ) -> AsyncIterator[Optional[dict]]:
+        """Yield every event published so far, then new ones until finished
+
+        Args:
+            idle_timeout: Called before each wait; if it returns a number of
+                seconds, None is yielded once they pass without a new event
+        """
+        position = 0
+        self.watchers += 1
+        try:
+            while True:
+                while position < len(self.events):
+                    yield self.events[position]
+                    position += 1
+                if self.done:
+                    return
+                timeout = idle_timeout() if idle_timeout else None
+                if timeout is None:
+                    await self._updated.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self._updated.wait(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.watchers -= 1
+
+    async def result(self) -> InvoiceAnalysisResult:
+        """Wait for the analysis without tying its lifetime to the caller"""
+        self.watchers += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.watchers -= 1
+
+    def hold(self) -> None:
+        """Mark the analysis as wanted by someone who isn't waiting on it, e.g. a deferred job"""
+        self.watchers += 1
+
+    @property
+    def abandoned(self) -> bool:
+        """Still running and not yet committed, but nobody is waiting for it any more"""
+        return not self.done and not self.committed and self.watchers == 0
+
+
+class InflightRegistry:
+    """Tracks running analyses by content hash"""
+
+    def __init__(self):
+        self._inflight: Dict[str, InflightAnalysis] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def get_or_start(
+        self,
+        key: str,
+        run: Callable[[InflightAnalysis], Awaitable[InvoiceAnalysisResult]]
+    ) -> Tuple[InflightAnalysis, bool]:
+        """Attach to the analysis running for `key`, or start it with `run`
+
+        Returns:
+            The in-flight analysis and whether this call started it
+        """
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            inflight.followers += 1
+            self.coalesced += 1
+            return inflight, False
+
+        inflight = InflightAnalysis(key)
+        self._inflight[key] = inflight
+        self.started += 1
+
+        async def runner() -> InvoiceAnalysisResult:
+            try:
+                return await run(inflight)
+            finally:
+                inflight.finish()
+                self._inflight.pop(key, None)
+
+        inflight.task = asyncio.create_task(runner())
+        # Followers may never await the task; keep failures from going unreported
+        inflight.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return inflight, True
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
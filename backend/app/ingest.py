@@ -0,0 +1,206 @@
+"""Streaming ingestion of invoice uploads
+
+Reads an upload in chunks, enforcing the size limit and hashing as it goes,
+then stores it under a content-addressed name. The caller gets the bytes
+back so nothing has to re-read the file from disk.
+
+Batch uploads (several files and/or ZIP archives) are spooled to temporary
+files and unpacked one invoice at a time, so only the invoices currently
+being analyzed are held in memory.
+"""
+import asyncio
+import hashlib
+import shutil
+import tempfile
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel
+from app.analyzer import get_file_media_type
+
+ALLOWED_EXTENSIONS = {".pdf", ".png", ".jpg", ".jpeg"}
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10MB
+CHUNK_SIZE = 256 * 1024
+
+
+class IngestedUpload(BaseModel):
+    """An upload read into memory and stored on disk"""
+    filename: str
+    data: bytes
+    contentHash: str  # SHA-256 of data
+    mediaType: str
+    path: Path
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    """Write atomically so concurrent identical uploads never see a partial file"""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
+
+
+def _check_extension(filename: str) -> str:
+    file_ext = Path(filename or "").suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Allowed: PDF, PNG, JPG, JPEG"
+        )
+    return file_ext
+
+
+def _size_error(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File size exceeds {max_size // (1024 * 1024)}MB limit"
+    )
+
+
+async def _store(filename: str, data: bytes, content_hash: str, upload_dir: Path) -> IngestedUpload:
+    """Save hashed upload bytes under their content-addressed name"""
+    file_ext = Path(filename).suffix.lower()
+
+    # Identical uploads share one file, and different ones can never collide
+    path = upload_dir / f"{content_hash}{file_ext}"
+    if not path.exists():
+        try:
+            await asyncio.to_thread(_write_file, path, data)
+        except OSError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to save file: {str(e)}"
+            )
+
+    return IngestedUpload(
+        filename=filename,
+        data=data,
+        contentHash=content_hash,
+        mediaType=get_file_media_type(filename),
+        path=path
+    )
+
+
+async def ingest_upload(
+    file: UploadFile,
+    upload_dir: Path,
+    max_size: int = MAX_UPLOAD_BYTES
+) -> IngestedUpload:
+    """Read, size-check, hash and store an uploaded invoice in one pass
+
+    Raises:
+        HTTPException: 400 for an unsupported type or an oversized file
+    """
+    _check_extension(file.filename)
+
+    hasher = hashlib.sha256()
+    chunks = []
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise _size_error(max_size)
+        hasher.update(chunk)
+        chunks.append(chunk)
+
+    return await _store(file.filename, b"".join(chunks), hasher.hexdigest(), upload_dir)
+
+
+async def ingest_bytes(
+    filename: str,
+    data: bytes,
+    upload_dir: Path,
+    max_size: int = MAX_UPLOAD_BYTES
+) -> IngestedUpload:
+    """ingest_upload for an invoice already read into memory, e.g. from a batch
+
+    Raises:
+        HTTPException: 400 for an unsupported type or an oversized file
+    """
+    _check_extension(filename)
+    if len(data) > max_size:
+        raise _size_error(max_size)
+    content_hash = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    return await _store(filename, data, content_hash, upload_dir)
+
+
+def _spool(source: BinaryIO) -> BinaryIO:
+    spooled = tempfile.TemporaryFile()
+    source.seek(0)
+    shutil.copyfileobj(source, spooled, CHUNK_SIZE)
+    spooled.seek(0)
+    return spooled
+
+
+async def spool_batch(files: List[UploadFile]) -> List[Tuple[str, BinaryIO]]:
+    """Copy a batch's uploads into temporary files that outlive the request
+
+    FastAPI closes uploaded files once the endpoint returns, before a
+    streaming response has read them; the caller owns (and must close) the
+    returned files.
+    """
+    spooled = []
+    for file in files:
+        spooled.append((file.filename or "", await asyncio.to_thread(_spool, file.file)))
+    return spooled
+
+
+def _read_limited(source: BinaryIO, max_size: int) -> bytes:
+    """Read a file in chunks, stopping once it exceeds max_size
+
+    Sizes are checked while reading rather than trusted from ZIP headers.
+    """
+    chunks = []
+    size = 0
+    while chunk := source.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise _size_error(max_size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class BatchEntry(BaseModel):
+    """One invoice unpacked from a batch upload, or why it couldn't be read"""
+    filename: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+def iter_batch_entries(
+    spooled: List[Tuple[str, BinaryIO]],
+    max_size: int = MAX_UPLOAD_BYTES
+) -> Iterator[BatchEntry]:
+    """Read the invoices of a spooled batch one at a time
+
+    ZIP archives are expanded member by member, skipping directories and
+    macOS resource forks. Blocking - call next() from a worker thread.
+    """
+    for filename, source in spooled:
+        if Path(filename).suffix.lower() != ".zip":
+            try:
+                yield BatchEntry(filename=filename, data=_read_limited(source, max_size))
+            except HTTPException as e:
+                yield BatchEntry(filename=filename, error=e.detail)
+            continue
+
+        try:
+            archive = zipfile.ZipFile(source)
+        except zipfile.BadZipFile:
+            yield BatchEntry(filename=filename, error="Not a valid ZIP archive")
+            continue
+        with archive:
+            for member in archive.infolist():
+                if member.is_dir() or member.filename.startswith("__MACOSX/"):
+                    continue
+                name = Path(member.filename).name
+                try:
+                    with archive.open(member) as entry:
+                        yield BatchEntry(filename=name, data=_read_limited(entry, max_size))
+                except HTTPException as e:
+                    yield BatchEntry(filename=name, error=e.detail)
+                except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                    # Corrupt, truncated, encrypted or unsupported-compression members
+                    yield BatchEntry(filename=name, error=f"Unreadable archive member: {e}")
@@ -0,0 +1,119 @@
+"""Incremental parser for the JSON object Claude streams back
+
+Claude's analysis arrives a few characters at a time. Rather than waiting
+for the whole reply and then calling json.loads, IncrementalJSONParser
+consumes the text as it streams and reports each top-level field of the
+object the moment its value is complete - so "status" and "fraudScore" are
+known long before the explanation and local checks finish generating.
+
+Text before the opening brace (prose, a ```json fence) is ignored.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """Emit (field, value) pairs of a streamed JSON object as they complete"""
+
+    def __init__(self):
+        self._buf: List[str] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # What the top level of the object expects next:
+        # key -> colon -> value -> in_value -> comma -> key ...
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._start = 0
+        self.fields: dict = {}
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of streamed text
+
+        Returns:
+            The (field, value) pairs completed by this chunk, in order
+        """
+        completed: List[Tuple[str, Any]] = []
+        for char in text:
+            if self.done:
+                break
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                continue
+
+            self._buf.append(char)
+            index = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_string(index, completed)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect in ("key", "value"):
+                    self._start = index
+                    if self._expect == "value":
+                        self._expect = "in_value"
+            elif char in "{[":
+                if self._depth == 1 and self._expect == "value":
+                    self._start = index
+                    self._expect = "in_value"
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    # End of the object; flush a trailing number/literal
+                    self._finish_scalar(index, completed)
+                    self._depth = 0
+                    self.done = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 1 and self._expect == "in_value":
+                        self._emit(self._slice(self._start, index + 1), completed)
+            elif self._depth == 1:
+                if char == ":" and self._expect == "colon":
+                    self._expect = "value"
+                elif char == ",":
+                    self._finish_scalar(index, completed)
+                    self._expect = "key"
+                elif self._expect == "value" and not char.isspace():
+                    # Start of a number, true, false or null
+                    self._start = index
+                    self._expect = "in_value"
+
+        return completed
+
+    def _slice(self, start: int, end: int) -> str:
+        return "".join(self._buf[start:end])
+
+    def _close_string(self, index: int, completed: List[Tuple[str, Any]]) -> None:
+        raw = self._slice(self._start, index + 1)
+        if self._expect == "key":
+            self._key = json.loads(raw)
+            self._expect = "colon"
+        elif self._expect == "in_value":
+            self._emit(raw, completed)
+
+    def _finish_scalar(self, index: int, completed: List[Tuple[str, Any]]) -> None:
+        if self._expect == "in_value":
+            self._emit(self._slice(self._start, index).strip(), completed)
+
+    def _emit(self, raw: str, completed: List[Tuple[str, Any]]) -> None:
+        self._expect = "comma"
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            # Malformed value; the full parse at the end will report it
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
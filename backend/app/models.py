@@ -13,6 +13,7 @@ class LocalCheck(BaseModel):
 class NetworkSignal(BaseModel):
     type: Literal["flagged", "seen", "clean"]
     description: str
+    similarity: Optional[float] = None  # 0-1, for look-alike vendor matches
 
 
 class InvoiceAnalysisResult(BaseModel):
@@ -27,6 +28,16 @@ class InvoiceAnalysisResult(BaseModel):
     amount: float
     currency: str = "USDC"
     walletAddress: Optional[str] = None  # Wallet address extracted from invoice
+    templateHash: Optional[str] = None  # Perceptual hash of the first page (app/template_hash.py)
+
+
+class DeferredJob(BaseModel):
+    jobId: str  # SHA-256 of the uploaded file
+    filename: str
+    status: Literal["queued", "completed", "failed"]
+    submittedAt: str  # ISO datetime string
+    result: Optional[InvoiceAnalysisResult] = None
+    error: Optional[str] = None
 
 
 class ThreatRecord(BaseModel):
@@ -38,6 +49,14 @@ class ThreatRecord(BaseModel):
     reason: str
     amountBlocked: float
     templateHash: Optional[str] = None
+    walletAddress: Optional[str] = None  # Payout address of the blocked invoice
+
+
+class RollupBucket(BaseModel):
+    key: str  # ISO day or normalized vendor name; "" for the overall total
+    blockedAmount: float = 0.0
+    blockedInvoices: int = 0
+    threatsDetected: int = 0
 
 
 class ThreatAnalytics(BaseModel):
@@ -45,7 +64,8 @@ class ThreatAnalytics(BaseModel):
     totalBlockedInvoices: int
     totalThreatsDetected: int
     rewardsEarned: float
-    threats: List[ThreatRecord]
+    threats: List[ThreatRecord]  # Top threats by amount blocked, one page
+    daily: List[RollupBucket] = []  # Latest days with activity, newest first
 
 
 class ThreatReportRequest(BaseModel):
@@ -54,6 +74,8 @@ class ThreatReportRequest(BaseModel):
     fraudScore: int
     reason: str
     amount: float
+    walletAddress: Optional[str] = None
+    templateHash: Optional[str] = None
 
 
 class ThreatReportResponse(BaseModel):
@@ -67,7 +89,7 @@ class Transaction(BaseModel):
     vendor: str
     amount: float
     currency: str = "USDC"
-    date: str  # ISO date string
+    date: str  # ISO timestamp (older records: ISO date)
     reason: str
     invoiceId: str
 
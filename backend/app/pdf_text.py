@@ -0,0 +1,138 @@
+"""Local text-layer extraction for machine-generated PDF invoices
+
+Most invoices are generated PDFs with a text layer. Reading that text
+locally lets the analyzer send a compact text prompt instead of the whole
+document to the vision model. Scanned PDFs have no usable text layer and
+fall back to the vision path.
+"""
+import io
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is optional - without it every PDF uses the vision path
+    PdfReader = None
+
+# Fewer characters than this means a scanned or image-only PDF
+MIN_TEXT_CHARS = 80
+MAX_PAGES = 10
+# Keep the text prompt compact even for long statements
+MAX_TEXT_CHARS = 20000
+MAX_LINE_ITEMS = 50
+
+WALLET_PATTERN = re.compile(r"0x[0-9a-fA-F]{40}(?![0-9a-fA-F])")
+INVOICE_ID_PATTERN = re.compile(
+    r"invoice[ \t]*(?:no\.?|number|num|#|id)?[ \t]*[:#]?[ \t]*([A-Z0-9][A-Z0-9\-_/]*\d[A-Z0-9\-_/]*)",
+    re.IGNORECASE
+)
+VENDOR_PATTERN = re.compile(r"^[ \t]*(?:from|vendor|supplier|bill[ \t]+from)[ \t]*:[ \t]*(.+)$", re.IGNORECASE | re.MULTILINE)
+TOTAL_PATTERN = re.compile(
+    r"(?:grand[ \t]+total|total[ \t]+due|amount[ \t]+due|balance[ \t]+due|total)[ \t]*(?:\(?USDC?\)?)?[ \t]*[:\-]?[ \t]*"
+    r"(?:\$|USDC?[ \t]*)?[ \t]*([\d,]*\d(?:\.\d+)?)",
+    re.IGNORECASE
+)
+MONEY_AT_END_PATTERN = re.compile(r"\$?\s*[\d,]*\d\.\d{2}\s*(?:USDC?)?\s*$", re.IGNORECASE)
+NOT_LINE_ITEM_PATTERN = re.compile(r"total|tax|balance|amount due|discount|shipping", re.IGNORECASE)
+
+
+class InvoiceTextLayer(BaseModel):
+    """Text and pre-parsed fields read from a PDF's text layer"""
+    text: str
+    pageCount: int
+    invoiceId: Optional[str] = None
+    vendor: Optional[str] = None
+    total: Optional[float] = None
+    walletAddresses: List[str] = []
+    lineItems: List[str] = []
+
+
+def _parse_amount(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _first_content_line(lines: List[str]) -> Optional[str]:
+    """Generated invoices usually open with the vendor's name"""
+    for line in lines[:5]:
+        if len(line) > 2 and not re.search(r"invoice|^\d", line, re.IGNORECASE):
+            return line
+    return None
+
+
+def parse_invoice_text(text: str, page_count: int = 1) -> InvoiceTextLayer:
+    """Pull invoice ID, vendor, total, wallets and line items out of plain text"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    invoice_id = INVOICE_ID_PATTERN.search(text)
+    vendor = VENDOR_PATTERN.search(text)
+    # The last "total" on an invoice is the grand total
+    totals = [_parse_amount(match) for match in TOTAL_PATTERN.findall(text)]
+    totals = [total for total in totals if total is not None]
+
+    wallets: List[str] = []
+    for match in WALLET_PATTERN.findall(text):
+        if match.lower() not in wallets:
+            wallets.append(match.lower())
+
+    line_items = [
+        line for line in lines
+        if MONEY_AT_END_PATTERN.search(line) and not NOT_LINE_ITEM_PATTERN.search(line)
+    ][:MAX_LINE_ITEMS]
+
+    return InvoiceTextLayer(
+        text=text[:MAX_TEXT_CHARS],
+        pageCount=page_count,
+        invoiceId=invoice_id.group(1) if invoice_id else None,
+        vendor=vendor.group(1).strip() if vendor else _first_content_line(lines),
+        total=totals[-1] if totals else None,
+        walletAddresses=wallets,
+        lineItems=line_items
+    )
+
+
+def extract_pdf_text(file_bytes: bytes) -> Optional[InvoiceTextLayer]:
+    """Read a PDF's text layer
+
+    Returns:
+        The extracted invoice text, or None for scanned/image-only PDFs,
+        unreadable files, or when pypdf is not installed
+    """
+    if PdfReader is None:
+        return None
+
+    try:
+        reader = PdfReader(io.BytesIO(file_bytes))
+        pages = reader.pages[:MAX_PAGES]
+        text = "\n".join(page.extract_text() or "" for page in pages)
+    except Exception as e:
+        # pypdf raises a wide range of errors on malformed files - any of them
+        # just means the vision path reads this one
+        print(f"PDF text extraction failed, using vision path: {type(e).__name__}: {e}")
+        return None
+
+    if len(re.sub(r"\s", "", text)) < MIN_TEXT_CHARS:
+        return None
+
+    return parse_invoice_text(text, page_count=len(reader.pages))
+
+
+def build_text_prompt(layer: InvoiceTextLayer) -> str:
+    """Compact prompt carrying the extracted text in place of the document"""
+    fields = [
+        f"- Invoice ID: {layer.invoiceId or 'not found'}",
+        f"- Vendor: {layer.vendor or 'not found'}",
+        f"- Total: {layer.total if layer.total is not None else 'not found'}",
+        f"- Wallet addresses: {', '.join(layer.walletAddresses) or 'none found'}",
+        f"- Line items detected: {len(layer.lineItems)}",
+    ]
+    return (
+        "The invoice below was extracted from the PDF's text layer "
+        f"({layer.pageCount} page(s)); the original document is not attached.\n\n"
+        "Pre-parsed fields (verify them against the text):\n"
+        + "\n".join(fields)
+        + f"\n\n<invoice_text>\n{layer.text}\n</invoice_text>"
+    )
@@ -0,0 +1,219 @@
+"""Deterministic pre-screen that runs before the Claude call
+
+Invoices paying a blocklisted wallet, a wallet or vendor already in the
+threat network, or duplicating an invoice we have already processed don't
+need an LLM to decide. The rules here are indexed lookups that settle those
+cases in microseconds and skip the vision call entirely.
+
+Only an exact wallet match blocks. The vendor name is a best-effort parse
+of the text layer, so a vendor match - like a duplicate - puts the invoice
+on hold for a human rather than blocking it.
+"""
+import os
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Set
+from pydantic import BaseModel
+from app.models import InvoiceAnalysisResult, LocalCheck, NetworkSignal, ThreatRecord
+from app.pdf_text import InvoiceTextLayer
+from app.storage import (
+    find_duplicate_invoice,
+    find_threat_by_vendor,
+    find_threat_by_wallet,
+    update_threat_seen_count
+)
+
+WALLET_PATTERN = re.compile(rb"0x[0-9a-fA-F]{40}(?![0-9a-fA-F])")
+PDF_STREAM_PATTERN = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+
+# Don't let a huge PDF turn the pre-screen into a slow path
+MAX_PDF_STREAMS = 32
+
+
+class InvoiceFacts(BaseModel):
+    """What is known about an upload before it reaches Claude"""
+    walletAddresses: List[str] = []
+    vendor: Optional[str] = None
+    invoiceId: Optional[str] = None
+    amount: Optional[float] = None
+    templateHash: Optional[str] = None
+
+
+def extract_invoice_facts(
+    file_bytes: bytes,
+    media_type: str,
+    text_layer: Optional[InvoiceTextLayer] = None,
+    template_hash: Optional[str] = None
+) -> InvoiceFacts:
+    """Cheaply pull what we can out of an upload before calling Claude
+
+    A PDF text layer, when available, supplies the vendor, invoice ID, total
+    and wallets. Otherwise wallets are scanned from the raw bytes and the
+    Flate-compressed content streams. Images yield only their template hash,
+    which is computed by the caller (app/template_hash.py) and passed through.
+    """
+    if text_layer is not None:
+        return InvoiceFacts(
+            walletAddresses=text_layer.walletAddresses,
+            vendor=text_layer.vendor,
+            invoiceId=text_layer.invoiceId,
+            amount=text_layer.total,
+            templateHash=template_hash
+        )
+
+    if media_type != "application/pdf":
+        return InvoiceFacts(templateHash=template_hash)
+
+    chunks = [file_bytes]
+    for match in PDF_STREAM_PATTERN.finditer(file_bytes):
+        if len(chunks) > MAX_PDF_STREAMS:
+            break
+        try:
+            chunks.append(zlib.decompress(match.group(1)))
+        except zlib.error:
+            continue
+
+    wallets: List[str] = []
+    for chunk in chunks:
+        for match in WALLET_PATTERN.finditer(chunk):
+            wallet = match.group().decode("ascii").lower()
+            if wallet not in wallets:
+                wallets.append(wallet)
+
+    return InvoiceFacts(walletAddresses=wallets, templateHash=template_hash)
+
+
+def _load_blocklist() -> Set[str]:
+    """Wallets from WALLET_BLOCKLIST (comma-separated) and WALLET_BLOCKLIST_FILE"""
+    entries = os.getenv("WALLET_BLOCKLIST", "").split(",")
+    blocklist_file = os.getenv("WALLET_BLOCKLIST_FILE")
+    if blocklist_file and os.path.exists(blocklist_file):
+        with open(blocklist_file) as f:
+            entries.extend(f.read().split())
+    return {entry.strip().lower() for entry in entries if entry.strip()}
+
+
+class PreScreenDecision(BaseModel):
+    rule: str
+    result: InvoiceAnalysisResult
+    # False when the vendor or amount wasn't parsed from the invoice itself -
+    # such a verdict mustn't be reported back into the threat network
+    reportable: bool = True
+
+
+class PreScreener:
+    """Rule engine settling clear-cut invoices without an LLM call"""
+
+    def __init__(self, blocklist: Optional[Set[str]] = None):
+        self.blocklist = _load_blocklist() if blocklist is None else blocklist
+        self.screened = 0
+        self.llm_calls_avoided = 0
+        self.rule_hits: Dict[str, int] = {}
+        self._total_seconds = 0.0
+
+    def screen(self, facts: InvoiceFacts, content_hash: str) -> Optional[PreScreenDecision]:
+        """Return a BLOCKED/HOLD decision if a rule fires, else None"""
+        start = time.perf_counter()
+        decision = self._evaluate(facts, content_hash)
+        self._total_seconds += time.perf_counter() - start
+        self.screened += 1
+
+        if decision is not None:
+            self.llm_calls_avoided += 1
+            self.rule_hits[decision.rule] = self.rule_hits.get(decision.rule, 0) + 1
+            print(f"Pre-screen rule '{decision.rule}' fired: {decision.result.status}")
+        return decision
+
+    def _evaluate(self, facts: InvoiceFacts, content_hash: str) -> Optional[PreScreenDecision]:
+        for wallet in facts.walletAddresses:
+            if wallet in self.blocklist:
+                return self._decide(
+                    "blocklisted_wallet", "blocked", facts, content_hash, wallet,
+                    f"Payout wallet {wallet} is on the wallet blocklist"
+                )
+
+        for wallet in facts.walletAddresses:
+            threat = find_threat_by_wallet(wallet)
+            if threat is not None:
+                return self._decide(
+                    "known_threat_wallet", "blocked", facts, content_hash, wallet,
+                    f"Payout wallet {wallet} was used by blocked vendor {threat.vendor}",
+                    vendor=facts.vendor or threat.vendor,
+                    signals=self._threat_signals(threat)
+                )
+
+        if facts.vendor:
+            threat = find_threat_by_vendor(facts.vendor)
+            if threat is not None:
+                return self._decide(
+                    "known_threat_vendor", "hold", facts, content_hash, None,
+                    f"Vendor {facts.vendor} is in the ShieldNet threat database: {threat.reason}",
+                    signals=self._threat_signals(threat)
+                )
+
+        if facts.vendor and facts.invoiceId and facts.amount is not None:
+            duplicate = find_duplicate_invoice(facts.vendor, facts.invoiceId, facts.amount)
+            if duplicate is not None:
+                return self._decide(
+                    "duplicate_invoice", "hold", facts, content_hash, None,
+                    f"Invoice {facts.invoiceId} from {facts.vendor} for "
+                    f"{facts.amount:.2f} was already processed ({duplicate.status})"
+                )
+
+        return None
+
+    def _threat_signals(self, threat: ThreatRecord) -> List[NetworkSignal]:
+        update_threat_seen_count(threat.vendor)
+        return [
+            NetworkSignal(
+                type="flagged",
+                description=f"Vendor flagged by {threat.timesSeen} other companies"
+            ),
+            NetworkSignal(
+                type="flagged",
+                description=f"Previously blocked ${threat.amountBlocked:,.0f} in fraudulent invoices"
+            ),
+        ]
+
+    def _decide(
+        self,
+        rule: str,
+        status: str,
+        facts: InvoiceFacts,
+        content_hash: str,
+        wallet: Optional[str],
+        detail: str,
+        vendor: Optional[str] = None,
+        signals: Optional[List[NetworkSignal]] = None
+    ) -> PreScreenDecision:
+        blocked = status == "blocked"
+        result = InvoiceAnalysisResult(
+            invoiceId=facts.invoiceId or f"UNKNOWN-{content_hash[:8]}",
+            status=status,
+            confidence=100 if blocked else 90,
+            fraudScore=100 if blocked else 60,
+            localChecks=[
+                LocalCheck(name=f"Pre-screen: {rule}", status="fail" if blocked else "warning", detail=detail)
+            ],
+            networkSignals=signals or [],
+            explanation=f"Decided by ShieldNet pre-screen without AI review. {detail}.",
+            vendor=vendor or facts.vendor or "Unknown vendor",
+            amount=facts.amount or 0.0,
+            walletAddress=wallet or (facts.walletAddresses[0] if facts.walletAddresses else None),
+            templateHash=facts.templateHash
+        )
+        return PreScreenDecision(
+            rule=rule,
+            result=result,
+            reportable=bool(facts.vendor) and facts.amount is not None
+        )
+
+    def stats(self) -> dict:
+        return {
+            "screened": self.screened,
+            "llmCallsAvoided": self.llm_calls_avoided,
+            "ruleHits": dict(self.rule_hits),
+            "blocklistSize": len(self.blocklist),
+            "avgMicroseconds": self._total_seconds / self.screened * 1e6 if self.screened else 0.0,
+        }
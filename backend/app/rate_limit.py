@@ -0,0 +1,241 @@
+"""Client-side rate limiting for Anthropic API calls
+
+Every interactive Claude call goes through one shared AnthropicRateLimiter.
+Token buckets for requests/minute and input tokens/minute admit calls in
+FIFO order. The buckets start from configured limits and follow the
+anthropic-ratelimit-* response headers, so they converge on the account's
+real limits. Calls that would wait too long, or arrive when the queue is
+full, are rejected up front. 429, overload and transient errors are
+retried with decorrelated jitter.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+import anthropic
+
+T = TypeVar("T")
+
+# Statuses worth retrying: rate limited, overloaded, or a transient server error
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+class RateLimitExceeded(Exception):
+    """A call could not be admitted or kept hitting rate limits
+
+    Attributes:
+        retry_after: Seconds after which a new attempt may succeed
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling budget of `limit` units per minute"""
+
+    def __init__(self, limit_per_minute: int):
+        self.capacity = float(limit_per_minute)
+        self.rate = limit_per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def observe(self, limit: Optional[str], remaining: Optional[str]) -> None:
+        """Follow the limit and remaining count reported by the API"""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60.0
+        if remaining is not None:
+            self.level = min(self.capacity, float(remaining))
+
+
+class AnthropicRateLimiter:
+    """Shared admission queue and retry policy for Claude calls"""
+
+    def __init__(
+        self,
+        requests_per_minute: int = 50,
+        input_tokens_per_minute: int = 30000,
+        max_queue_depth: int = 100,
+        queue_timeout: float = 60.0,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.input_tokens = TokenBucket(input_tokens_per_minute)
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # asyncio.Lock wakes waiters in FIFO order
+        self._admission = asyncio.Lock()
+        self.waiting = 0
+        self.counts = {
+            "admitted": 0,
+            "rejected": 0,
+            "timedOut": 0,
+            "retries": 0,
+            "exhausted": 0,
+        }
+        self.retries_by_status: dict = {}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth_seen = 0
+
+    @classmethod
+    def from_env(cls) -> "AnthropicRateLimiter":
+        """Create a limiter configured from ANTHROPIC_* / RATE_LIMIT_* environment variables"""
+        return cls(
+            requests_per_minute=int(os.getenv("ANTHROPIC_RPM", "50")),
+            input_tokens_per_minute=int(os.getenv("ANTHROPIC_ITPM", "30000")),
+            max_queue_depth=int(os.getenv("RATE_LIMIT_QUEUE_DEPTH", "100")),
+            queue_timeout=float(os.getenv("RATE_LIMIT_QUEUE_TIMEOUT", "60")),
+            max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+        )
+
+    async def run(
+        self,
+        send: Callable[[], Awaitable[Tuple[T, object]]],
+        estimated_input_tokens: int
+    ) -> T:
+        """Admit and send a call, retrying rate-limit and transient failures
+
+        Args:
+            send: Makes the call and returns (result, response headers)
+            estimated_input_tokens: Input tokens the call is expected to use
+
+        Raises:
+            RateLimitExceeded: if the call was not admitted in time or ran out
+                of retries on 429/overload errors
+        """
+        delay = self.base_delay
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(estimated_input_tokens)
+            try:
+                result, headers = await send()
+            except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                if isinstance(e, anthropic.APIStatusError):
+                    if status not in RETRYABLE_STATUSES:
+                        raise
+                    self._observe(e.response.headers)
+
+                if attempt == self.max_retries:
+                    self.counts["exhausted"] += 1
+                    if status in (429, 529):
+                        raise RateLimitExceeded(
+                            f"Claude is rate limited or overloaded after {attempt + 1} attempts",
+                            retry_after=delay
+                        ) from e
+                    raise
+
+                # Decorrelated jitter: spread retries out without synchronizing them
+                delay = min(self.max_delay, random.uniform(self.base_delay, delay * 3))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.max_delay))
+                self.counts["retries"] += 1
+                key = str(status or "connection")
+                self.retries_by_status[key] = self.retries_by_status.get(key, 0) + 1
+                print(f"Claude call failed ({key}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self._observe(headers)
+            return result
+
+    async def _acquire(self, input_tokens: int) -> None:
+        """Wait in the FIFO queue until both buckets can cover the call"""
+        if self.waiting >= self.max_queue_depth:
+            self.counts["rejected"] += 1
+            raise RateLimitExceeded(
+                "Too many Claude calls queued", retry_after=self.requests.wait_time(self.waiting)
+            )
+
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        self.waiting += 1
+        self.max_depth_seen = max(self.max_depth_seen, self.waiting)
+        try:
+            try:
+                await asyncio.wait_for(self._admission.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.counts["timedOut"] += 1
+                raise RateLimitExceeded("Timed out waiting for a Claude slot", retry_after=self.queue_timeout)
+            try:
+                while True:
+                    wait = max(self.requests.wait_time(1), self.input_tokens.wait_time(input_tokens))
+                    if wait <= 0:
+                        break
+                    if time.monotonic() + wait > deadline:
+                        self.counts["timedOut"] += 1
+                        raise RateLimitExceeded("Timed out waiting for a Claude slot", retry_after=wait)
+                    await asyncio.sleep(wait)
+                self.requests.take(1)
+                self.input_tokens.take(input_tokens)
+            finally:
+                self._admission.release()
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.counts["admitted"] += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _observe(self, headers) -> None:
+        if headers is None:
+            return
+        self.requests.observe(
+            headers.get("anthropic-ratelimit-requests-limit"),
+            headers.get("anthropic-ratelimit-requests-remaining")
+        )
+        self.input_tokens.observe(
+            headers.get("anthropic-ratelimit-input-tokens-limit"),
+            headers.get("anthropic-ratelimit-input-tokens-remaining")
+        )
+
+    def stats(self) -> dict:
+        """Queue, wait and retry counters for the metrics endpoint"""
+        admitted = self.counts["admitted"]
+        return {
+            **self.counts,
+            "queueDepth": self.waiting,
+            "maxQueueDepth": self.max_depth_seen,
+            "avgWaitSeconds": self.total_wait / admitted if admitted else 0.0,
+            "maxWaitSeconds": self.max_wait,
+            "retriesByStatus": self.retries_by_status,
+            "requestsPerMinute": self.requests.capacity,
+            "inputTokensPerMinute": self.input_tokens.capacity,
+        }
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """The retry-after header of an API error, in seconds"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
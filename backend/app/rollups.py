@@ -0,0 +1,116 @@
+"""Running totals behind the threat analytics dashboard
+
+Blocked amounts, blocked invoice counts and threats detected are counted
+in rollup buckets as transactions and threats are saved: one overall
+bucket, one per day and one per normalized vendor. Reading them costs the
+same however much history there is. Threats are also ranked by amount
+blocked, so the dashboard gets its top-N as a page instead of every threat.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+from app.models import RollupBucket, ThreatRecord, Transaction
+from app.transaction_log import decode_cursor, encode_cursor
+from app.vendor_match import normalize_vendor
+
+TOTAL, DAY, VENDOR = "total", "day", "vendor"
+
+# Top threats returned by the analytics endpoint when no limit is given
+TOP_THREATS_LIMIT = 20
+
+
+def transaction_rollups(transaction: Transaction) -> List[Tuple[str, str, float, int, int]]:
+    """(kind, key, blocked amount, blocked invoices, threats) a transaction adds"""
+    if transaction.status != "blocked":
+        return []
+    return [
+        (kind, key, transaction.amount, 1, 0)
+        for kind, key in (
+            (TOTAL, ""),
+            (DAY, transaction.date[:10]),
+            (VENDOR, normalize_vendor(transaction.vendor)),
+        )
+    ]
+
+
+def threat_rollups(threat: ThreatRecord) -> List[Tuple[str, str, float, int, int]]:
+    """(kind, key, blocked amount, blocked invoices, threats) a threat adds"""
+    return [
+        (TOTAL, "", 0.0, 0, 1),
+        (DAY, threat.firstSeen[:10], 0.0, 0, 1),
+        (VENDOR, normalize_vendor(threat.vendor), 0.0, 0, 1),
+    ]
+
+
+def encode_threat_cursor(amount_blocked: float, seq: int) -> str:
+    return encode_cursor(repr(amount_blocked), seq)
+
+
+def decode_threat_cursor(cursor: str) -> Tuple[float, int]:
+    """Raises ValueError if the cursor wasn't made by encode_threat_cursor"""
+    amount, seq = decode_cursor(cursor)
+    try:
+        return float(amount), seq
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+class Rollups:
+    """In-memory rollup buckets"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], RollupBucket] = {}
+        self._days: List[str] = []
+
+    def add(self, changes: List[Tuple[str, str, float, int, int]], sign: int = 1) -> None:
+        """Apply transaction_rollups/threat_rollups output; sign=-1 takes it back out"""
+        for kind, key, amount, invoices, threats in changes:
+            bucket = self._buckets.get((kind, key))
+            if bucket is None:
+                bucket = self._buckets[(kind, key)] = RollupBucket(key=key)
+                if kind == DAY:
+                    insort(self._days, key)
+            bucket.blockedAmount += sign * amount
+            bucket.blockedInvoices += sign * invoices
+            bucket.threatsDetected += sign * threats
+
+    def get(self, kind: str, key: str) -> RollupBucket:
+        bucket = self._buckets.get((kind, key))
+        return bucket.model_copy() if bucket else RollupBucket(key=key)
+
+    def recent_days(self, limit: int) -> List[RollupBucket]:
+        """The latest `limit` days with activity, newest first"""
+        if limit <= 0:
+            return []
+        return [self._buckets[(DAY, day)].model_copy() for day in reversed(self._days[-limit:])]
+
+
+class ThreatRanking:
+    """In-memory threat IDs ordered by amount blocked, newest first on ties"""
+
+    def __init__(self):
+        self._seq = 0
+        self._keys: List[Tuple[float, int]] = []
+        self._keys_by_id: Dict[str, Tuple[float, int]] = {}
+        self._ids: Dict[Tuple[float, int], str] = {}
+
+    def add(self, threat: ThreatRecord) -> None:
+        old_key = self._keys_by_id.pop(threat.id, None)
+        if old_key is not None:
+            del self._keys[bisect_left(self._keys, old_key)]
+            del self._ids[old_key]
+        self._seq += 1
+        key = (threat.amountBlocked, self._seq)
+        self._keys_by_id[threat.id] = key
+        self._ids[key] = threat.id
+        insort(self._keys, key)
+
+    def page(self, cursor: Optional[str], limit: int) -> Tuple[List[str], Optional[str]]:
+        """Threat IDs of one page, and the cursor for the next page or None
+
+        Raises:
+            ValueError: If `cursor` is malformed
+        """
+        upper = bisect_left(self._keys, decode_threat_cursor(cursor)) if cursor else len(self._keys)
+        keys = self._keys[max(0, upper - limit):upper][::-1]
+        next_cursor = encode_threat_cursor(*keys[-1]) if keys and upper > limit else None
+        return [self._ids[key] for key in keys], next_cursor
@@ -1,21 +1,39 @@
 """Invoice analysis router"""
 import os
-import shutil
+import asyncio
 import json
+import math
+import time
+import uuid
 from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from pathlib import Path
-from app.models import InvoiceAnalysisResult, Transaction
-from app.analyzer import InvoiceAnalyzer
+from app.models import DeferredJob, InvoiceAnalysisResult, Transaction
+from app.analyzer import AnalysisSuperseded, InvoiceAnalyzer
+from app.inflight import InflightAnalysis, InflightRegistry
+from app.ingest import (
+    BatchEntry,
+    IngestedUpload,
+    ingest_bytes,
+    ingest_upload,
+    iter_batch_entries,
+    spool_batch
+)
+from app.prescreen import InvoiceFacts, PreScreener, extract_invoice_facts
+from app.pdf_text import extract_pdf_text
+from app.template_hash import compute_template_hash
+from app.rate_limit import RateLimitExceeded
+from app.sse import SSEFrameCoalescer, format_sse
 from app.storage import (
     save_invoice,
     get_invoice,
     save_transaction,
     update_wallet_balance,
-    invoices_db
+    get_invoices_version,
+    query_invoices
 )
-from typing import List
+from typing import Any, Dict, List, Optional
 from app.routers.threats import report_threat
 from app.locus_payment import send_payment_via_locus
 
@@ -26,6 +44,32 @@ UPLOAD_DIR = Path(__file__).parent.parent.parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 print(f"Upload directory: {UPLOAD_DIR.absolute()}")
 
+# Analyses currently running, keyed by the SHA-256 of the uploaded file
+_inflight = InflightRegistry()
+
+# Rule engine that settles clear-cut invoices before any Claude call
+_prescreener = PreScreener()
+
+# What happens to a streamed analysis once every client watching it has
+# disconnected: "cancel" stops generation (nothing is saved or paid),
+# "finish" completes and records it in the background
+STREAM_DISCONNECT_MODE = os.getenv("STREAM_DISCONNECT_MODE", "cancel").lower()
+_disconnects = {"disconnects": 0, "cancelled": 0, "finishedInBackground": 0}
+
+# Analysis events relayed to stream clients and the SSE frames they were merged into
+_sse_counts = {"events": 0, "frames": 0}
+
+# Deferred analyses by job id (the upload's content hash)
+_deferred_jobs: Dict[str, DeferredJob] = {}
+
+# Invoices of one batch upload analyzed at the same time, and the most a batch may hold
+BATCH_CONCURRENCY = max(1, int(os.getenv("BATCH_CONCURRENCY", "4")))
+BATCH_MAX_INVOICES = int(os.getenv("BATCH_MAX_INVOICES", "500"))
+
+# Invoices per history page when the client gives no limit, and the most it may ask for
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
 # Lazy analyzer initialization
 _analyzer = None
 
@@ -40,82 +84,32 @@ def get_analyzer() -> InvoiceAnalyzer:
     return _analyzer
 
 
-@router.post("/analyze", response_model=InvoiceAnalysisResult)
-async def analyze_invoice(file: UploadFile = File(...)):
-    """Analyze an uploaded invoice for fraud detection
+async def _record_result(result: InvoiceAnalysisResult, report_threat: bool = True) -> None:
+    """Persist an analysis result and act on its decision
 
-    Args:
-        file: Invoice file (PDF, PNG, JPG)
+    Saves the invoice and its transaction, updates the wallet, pays approved
+    invoices via Locus and reports blocked ones to the threat network. Runs
+    once per analysis, however many requests share it, and whichever
+    endpoint started it - clients never report analyzed invoices themselves.
 
-    Returns:
-        InvoiceAnalysisResult with comprehensive fraud analysis
+    Args:
+        result: The analysis result
+        report_threat: Whether a blocked result is reported to the threat network
     """
-    # Validate file type - PDF and images
-    allowed_extensions = {".pdf", ".png", ".jpg", ".jpeg"}
-    file_ext = Path(file.filename).suffix.lower()
-
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: PDF, PNG, JPG, JPEG"
-        )
-
-    # Validate file size (10MB max)
-    max_size = 10 * 1024 * 1024  # 10MB in bytes
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail="File size exceeds 10MB limit"
-        )
-
-    # Save the file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = f"{timestamp}_{file.filename}"
-    file_path = UPLOAD_DIR / safe_filename
-
-    try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to save file: {str(e)}"
-        )
-
-    # Analyze the invoice using Claude SDK
-    try:
-        print(f"Starting analysis for file: {file_path}")
-        analyzer = get_analyzer()
-        print("Analyzer initialized, calling analyze_invoice...")
-        result = analyzer.analyze_invoice(str(file_path))
-        print(f"Analysis complete: {result.status}")
-    except Exception as e:
-        # Clean up the file if analysis fails
-        print(f"Analysis error: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        if file_path.exists():
-            file_path.unlink()
-        raise HTTPException(
-            status_code=500,
-            detail=f"Invoice analysis failed: {str(e)}"
-        )
-
     # Save the invoice analysis
     save_invoice(result)
+    print(f"✓ Saved invoice {result.invoiceId} to database")
 
     # Create transaction record
     transaction = Transaction(
-        id=f"TXN-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        # Suffixed so invoices finishing in the same second don't overwrite each other
+        id=f"TXN-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}",
         status="paid" if result.status == "approved" else "held" if result.status == "hold" else "blocked",
         vendor=result.vendor,
         amount=result.amount,
         currency=result.currency,
-        date=datetime.now().strftime("%Y-%m-%d"),
+        # To the second, so listings are ordered within a day
+        date=datetime.now().isoformat(timespec="seconds"),
         reason=result.explanation,
         invoiceId=result.invoiceId
     )
@@ -149,7 +143,9 @@ async def analyze_invoice(file: UploadFile = File(...)):
         update_wallet_balance(result.amount, "block")
 
     # If blocked, automatically report to threat network
-    if result.status == "blocked":
+    if result.status == "blocked" and not report_threat:
+        print(f"Not reporting {result.invoiceId}: pre-screen verdict without a parsed vendor and amount")
+    elif result.status == "blocked":
         try:
             from app.routers.threats import auto_report_threat
             await auto_report_threat(
@@ -157,114 +153,219 @@ async def analyze_invoice(file: UploadFile = File(...)):
                 vendor=result.vendor,
                 fraud_score=result.fraudScore,
                 reason=result.explanation,
-                amount=result.amount
+                amount=result.amount,
+                wallet_address=result.walletAddress,
+                template_hash=result.templateHash
             )
         except Exception as e:
             # Don't fail the request if threat reporting fails
             print(f"Failed to report threat: {e}")
 
-    return result
 
+def _facts_from_fields(fields: dict, template_hash: Optional[str]) -> InvoiceFacts:
+    """Pre-screen facts from analysis fields streamed so far"""
+    wallet = fields.get("walletAddress")
+    amount = fields.get("amount")
+    return InvoiceFacts(
+        walletAddresses=[wallet.lower()] if isinstance(wallet, str) and wallet else [],
+        vendor=fields.get("vendor") if isinstance(fields.get("vendor"), str) else None,
+        invoiceId=str(fields["invoiceId"]) if fields.get("invoiceId") else None,
+        amount=float(amount) if isinstance(amount, (int, float)) else None,
+        templateHash=template_hash
+    )
 
-@router.post("/analyze/stream")
-async def analyze_invoice_stream(file: UploadFile = File(...)):
-    """Analyze invoice with streaming progress updates
 
-    Returns Server-Sent Events stream with real-time analysis progress
+async def _run_analysis(
+    inflight: InflightAnalysis,
+    upload: IngestedUpload,
+    streaming: bool,
+    deferred: bool = False
+) -> InvoiceAnalysisResult:
+    """Analyze an uploaded invoice and record the result
+
+    Publishes progress to every request attached to `inflight`. `streaming`
+    only chooses how Claude is called; recording the result, including the
+    threat report for a blocked invoice, is the same for every endpoint that
+    may join the analysis. Deferred analyses wait in the analyzer's batch
+    queue rather than calling Claude directly.
     """
-    # Validate file type
-    allowed_extensions = {".pdf", ".png", ".jpg", ".jpeg"}
-    file_ext = Path(file.filename).suffix.lower()
+    report_threat = True
+    try:
+        print(f"Starting analysis for file: {upload.path}")
+        text_layer = None
+        if upload.mediaType == "application/pdf":
+            text_layer, template_hash = await asyncio.gather(
+                asyncio.to_thread(extract_pdf_text, upload.data),
+                asyncio.to_thread(compute_template_hash, upload.data, upload.mediaType)
+            )
+        else:
+            template_hash = await asyncio.to_thread(compute_template_hash, upload.data, upload.mediaType)
+        facts = extract_invoice_facts(upload.data, upload.mediaType, text_layer, template_hash)
+        decision = _prescreener.screen(facts, inflight.key)
+        if decision is not None:
+            inflight.publish({
+                "type": "progress",
+                "message": f"Pre-screen rule '{decision.rule}' matched - skipping AI analysis",
+                "step": 5
+            })
+            inflight.publish({"type": "complete", "result": decision.result.model_dump(), "rule": decision.rule})
+            await asyncio.shield(_record_result(decision.result, decision.reportable))
+            return decision.result
 
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: PDF, PNG, JPG, JPEG"
-        )
+        analyzer = get_analyzer()
+        if streaming:
+            result = None
+            streamed_fields = {}
+            screened_models = set()
+            updates = analyzer.analyze_invoice_streaming(
+                upload.data, upload.mediaType, text_layer, upload.contentHash, template_hash
+            )
+            async for update in updates:
+                if update["type"] == "complete":
+                    result = InvoiceAnalysisResult(**update["result"])
+                inflight.publish(update)
+                if update["type"] == "field":
+                    streamed_fields[update["name"]] = update["value"]
+                    # By the time the wallet streams, vendor, ID and amount are known:
+                    # re-run the pre-screen on them before generation finishes, once
+                    # per model (fields are sent again when they become final)
+                    if update["name"] == "walletAddress" and update["model"] not in screened_models:
+                        screened_models.add(update["model"])
+                        decision = _prescreener.screen(
+                            _facts_from_fields(streamed_fields, template_hash), inflight.key
+                        )
+                        if decision is not None:
+                            report_threat = decision.reportable
+                            try:
+                                await updates.athrow(AnalysisSuperseded())
+                            except (StopAsyncIteration, AnalysisSuperseded):
+                                pass
+                            inflight.publish({
+                                "type": "progress",
+                                "message": f"Pre-screen rule '{decision.rule}' matched mid-analysis - stopping AI analysis",
+                                "step": 5
+                            })
+                            result = decision.result
+                            inflight.publish({"type": "complete", "result": result.model_dump(), "rule": decision.rule})
+                            break
+        else:
+            analyze = analyzer.analyze_invoice_deferred if deferred else analyzer.analyze_invoice
+            result = await analyze(
+                upload.data, upload.mediaType, text_layer, upload.contentHash, template_hash
+            )
+            inflight.publish({"type": "complete", "result": result.model_dump()})
+        print(f"Analysis complete: {result.status}")
+    except asyncio.CancelledError:
+        print(f"Analysis cancelled for file: {upload.path}")
+        inflight.publish({"type": "error", "message": "Analysis cancelled"})
+        upload.path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        # Clean up the file if analysis fails
+        print(f"Analysis error: {type(e).__name__}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        error_event = {"type": "error", "message": str(e)}
+        if isinstance(e, RateLimitExceeded):
+            error_event["retryAfter"] = math.ceil(e.retry_after)
+        inflight.publish(error_event)
+        upload.path.unlink(missing_ok=True)
+        raise
+
+    # The complete event has committed the analysis; even if the task is
+    # cancelled anyway (e.g. at shutdown), recording finishes on its own
+    await asyncio.shield(_record_result(result, report_threat))
+    return result
 
-    # Save the file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = f"{timestamp}_{file.filename}"
-    file_path = UPLOAD_DIR / safe_filename
+
+@router.post("/analyze", response_model=InvoiceAnalysisResult)
+async def analyze_invoice(file: UploadFile = File(...)):
+    """Analyze an uploaded invoice for fraud detection
+
+    Args:
+        file: Invoice file (PDF, PNG, JPG)
+
+    Returns:
+        InvoiceAnalysisResult with comprehensive fraud analysis
+    """
+    # Validates type and the 10MB limit while streaming the upload to disk
+    upload = await ingest_upload(file, UPLOAD_DIR)
+
+    # Identical uploads already being analyzed share that analysis
+    inflight, started = _inflight.get_or_start(
+        upload.contentHash,
+        lambda inflight: _run_analysis(inflight, upload, streaming=False)
+    )
+    if not started:
+        print(f"Joining in-flight analysis for {upload.contentHash[:12]}")
 
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return await inflight.result()
+    except RateLimitExceeded as e:
+        # Claude is saturated - tell the client when to come back instead of failing
+        raise HTTPException(
+            status_code=503,
+            detail=f"Invoice analysis is temporarily rate limited: {str(e)}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to save file: {str(e)}"
+            detail=f"Invoice analysis failed: {str(e)}"
         )
 
-    # Stream the analysis
-    async def event_generator():
-        try:
-            print(f"Starting streaming analysis for: {file_path}")
-            analyzer = get_analyzer()
 
-            for update in analyzer.analyze_invoice_streaming(str(file_path)):
-                print(f"Sending update: {update['type']}")
-                # Send Server-Sent Event
-                yield f"data: {json.dumps(update)}\n\n"
+@router.post("/analyze/stream")
+async def analyze_invoice_stream(file: UploadFile = File(...)):
+    """Analyze invoice with streaming progress updates
 
-                # If complete, also save to database
-                if update["type"] == "complete":
-                    result_data = update["result"]
-
-                    # Save invoice
-                    from app.models import InvoiceAnalysisResult
-                    result = InvoiceAnalysisResult(**result_data)
-                    save_invoice(result)
-                    print(f"✓ Saved invoice {result.invoiceId} to database")
-                    print(f"✓ Total invoices in DB: {len(invoices_db)}")
-
-                    # Create transaction
-                    transaction = Transaction(
-                        id=f"TXN-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                        status="paid" if result.status == "approved" else "held" if result.status == "hold" else "blocked",
-                        vendor=result.vendor,
-                        amount=result.amount,
-                        currency=result.currency,
-                        date=datetime.now().strftime("%Y-%m-%d"),
-                        reason=result.explanation,
-                        invoiceId=result.invoiceId
-                    )
-                    save_transaction(transaction)
-
-                    # Update wallet
-                    if result.status == "approved":
-                        update_wallet_balance(result.amount, "pay")
-
-                        # Send payment via Locus MCP
-                        if result.walletAddress:
-                            try:
-                                print(f"📤 Sending payment via Locus for approved invoice {result.invoiceId}")
-                                payment_result = await send_payment_via_locus(
-                                    amount=result.amount,
-                                    invoice_id=result.invoiceId,
-                                    vendor=result.vendor,
-                                    wallet_address=result.walletAddress
-                                )
-                                if payment_result['success']:
-                                    print(f"✓ Locus payment successful: {payment_result['message']}")
-                                else:
-                                    print(f"⚠️ Locus payment failed: {payment_result['message']}")
-                            except Exception as e:
-                                print(f"❌ Locus payment error: {str(e)}")
-                                # Don't fail the request if payment fails
-                        else:
-                            print(f"⚠️ No wallet address found in invoice {result.invoiceId}, skipping payment")
-
-                    elif result.status == "blocked":
-                        update_wallet_balance(result.amount, "block")
+    Returns Server-Sent Events stream with real-time analysis progress
+    """
+    # Validates type and the 10MB limit while streaming the upload to disk
+    upload = await ingest_upload(file, UPLOAD_DIR)
 
-        except Exception as e:
-            print(f"Streaming error: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-            if file_path.exists():
-                file_path.unlink()
+    # Identical uploads already being analyzed share that analysis
+    inflight, started = _inflight.get_or_start(
+        upload.contentHash,
+        lambda inflight: _run_analysis(inflight, upload, streaming=True)
+    )
+
+    # Stream the analysis
+    async def event_generator():
+        coalescer = SSEFrameCoalescer()
+        if not started:
+            print(f"Attaching to in-flight analysis for {upload.contentHash[:12]}")
+            yield format_sse({"type": "progress", "message": "Joined an identical analysis already in progress", "step": 1})
+
+        try:
+            # None means buffered token text is due, with no new event to carry it
+            async for update in inflight.subscribe(idle_timeout=coalescer.idle_timeout):
+                if update is None:
+                    frames = coalescer.flush()
+                else:
+                    if update["type"] != "stream":
+                        print(f"Sending update: {update['type']}")
+                    frames = coalescer.add(update)
+                if frames:
+                    # Send Server-Sent Events
+                    yield "".join(frames)
+            frames = coalescer.flush()
+            if frames:
+                yield "".join(frames)
+        finally:
+            _sse_counts["events"] += coalescer.events
+            _sse_counts["frames"] += coalescer.frames
+            # Starlette cancels this generator when the client disconnects
+            if not inflight.done:
+                _disconnects["disconnects"] += 1
+            if inflight.abandoned:
+                if STREAM_DISCONNECT_MODE == "finish":
+                    _disconnects["finishedInBackground"] += 1
+                    print(f"Client gone, finishing analysis of {upload.contentHash[:12]} in the background")
+                else:
+                    _disconnects["cancelled"] += 1
+                    print(f"Client gone, cancelling analysis of {upload.contentHash[:12]}")
+                    inflight.task.cancel()
 
     return StreamingResponse(
         event_generator(),
@@ -280,11 +381,259 @@ async def analyze_invoice_stream(file: UploadFile = File(...)):
     )
 
 
-@router.get("/history", response_model=List[InvoiceAnalysisResult])
-async def get_invoice_history():
-    """Get all analyzed invoices
+@router.post("/analyze/deferred", response_model=DeferredJob, status_code=202)
+async def analyze_invoice_deferred(file: UploadFile = File(...)):
+    """Queue an invoice for low-cost batch analysis
+
+    The invoice is analyzed through the Message Batches API together with
+    other deferred uploads, then saved, paid or reported like any other.
+    Poll GET /api/invoices/deferred/{jobId} for the outcome.
 
     Returns:
-        List of all invoice analysis results
+        The queued job
     """
-    return list(invoices_db.values())
+    upload = await ingest_upload(file, UPLOAD_DIR)
+    get_analyzer()  # Fail now rather than inside the background task
+
+    job = _deferred_jobs.get(upload.contentHash)
+    if job is not None and job.status == "queued":
+        return job
+
+    job = DeferredJob(
+        jobId=upload.contentHash,
+        filename=upload.filename,
+        status="queued",
+        submittedAt=datetime.now().isoformat()
+    )
+    _deferred_jobs[job.jobId] = job
+
+    # An identical upload already being analyzed interactively settles this job too
+    inflight, _ = _inflight.get_or_start(
+        upload.contentHash,
+        lambda inflight: _run_analysis(inflight, upload, streaming=False, deferred=True)
+    )
+    # Nobody waits on a deferred job, but a stream disconnect mustn't cancel it
+    inflight.hold()
+
+    def settle(task: asyncio.Task) -> None:
+        if task.cancelled():
+            job.status, job.error = "failed", "Analysis was cancelled"
+        elif task.exception() is not None:
+            job.status, job.error = "failed", str(task.exception())
+        else:
+            job.status, job.result = "completed", task.result()
+
+    inflight.task.add_done_callback(settle)
+    return job
+
+
+@router.get("/deferred/{job_id}", response_model=DeferredJob)
+async def get_deferred_job(job_id: str):
+    """Get the status of a deferred analysis
+
+    Raises:
+        HTTPException: 404 if no such job was queued
+    """
+    job = _deferred_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deferred job not found")
+    return job
+
+
+async def _analyze_batch_entry(entry: BatchEntry, index: int) -> dict:
+    """Analyze one invoice of a batch, returning its NDJSON line"""
+    line = {"type": "result", "index": index, "filename": entry.filename}
+    if entry.error is not None:
+        return {**line, "type": "error", "message": entry.error}
+
+    try:
+        upload = await ingest_bytes(entry.filename, entry.data, UPLOAD_DIR)
+        inflight, _ = _inflight.get_or_start(
+            upload.contentHash,
+            lambda inflight: _run_analysis(inflight, upload, streaming=False)
+        )
+        result = await inflight.result()
+    except HTTPException as e:
+        return {**line, "type": "error", "message": e.detail}
+    except RateLimitExceeded as e:
+        return {**line, "type": "error", "message": str(e), "retryAfter": math.ceil(e.retry_after)}
+    except Exception as e:
+        return {**line, "type": "error", "message": f"Invoice analysis failed: {str(e)}"}
+    return {**line, "result": result.model_dump()}
+
+
+@router.post("/analyze/batch")
+async def analyze_invoice_batch(files: List[UploadFile] = File(...)):
+    """Analyze many invoices at once, e.g. a month-end ZIP archive
+
+    Accepts any mix of PDF/PNG/JPG files and ZIP archives of them. Up to
+    BATCH_CONCURRENCY invoices are analyzed at a time, each going through
+    the same pipeline as /analyze (including payment and threat reporting).
+
+    Returns:
+        NDJSON stream with one line per invoice in completion order, then a
+        summary line with overall throughput
+    """
+    spooled = await spool_batch(files)
+
+    async def ndjson_lines():
+        started = time.perf_counter()
+        entries = iter_batch_entries(spooled)
+        running = set()
+        submitted = 0
+        counts = {"result": 0, "error": 0}
+        exhausted = False
+        try:
+            while True:
+                # Unpack the next invoice only once a slot is free, so a large
+                # archive is never held in memory all at once
+                while not exhausted and len(running) < BATCH_CONCURRENCY:
+                    entry = await asyncio.to_thread(next, entries, None)
+                    if entry is None:
+                        exhausted = True
+                    elif submitted >= BATCH_MAX_INVOICES:
+                        exhausted = True
+                        counts["error"] += 1
+                        yield json.dumps({
+                            "type": "error",
+                            "index": submitted,
+                            "filename": entry.filename,
+                            "message": f"Batch limit of {BATCH_MAX_INVOICES} invoices reached; remaining files skipped"
+                        }) + "\n"
+                    else:
+                        running.add(asyncio.create_task(_analyze_batch_entry(entry, submitted)))
+                        submitted += 1
+                if not running:
+                    break
+
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    line = task.result()
+                    counts[line["type"]] += 1
+                    yield json.dumps(line) + "\n"
+
+            elapsed = time.perf_counter() - started
+            yield json.dumps({
+                "type": "summary",
+                "total": submitted,
+                "succeeded": counts["result"],
+                "failed": counts["error"],
+                "concurrency": BATCH_CONCURRENCY,
+                "seconds": round(elapsed, 3),
+                "invoicesPerMinute": round(counts["result"] / elapsed * 60, 2) if elapsed else 0.0
+            }) + "\n"
+        finally:
+            # Client went away: analyses keep running in their single-flight
+            # tasks and are still recorded; only the waiting stops here
+            for task in running:
+                task.cancel()
+            try:
+                entries.close()
+            except ValueError:
+                # Cancelled mid-unpack; the worker thread still holds the generator
+                pass
+            for _, source in spooled:
+                source.close()
+
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/metrics")
+async def get_analysis_metrics():
+    """Get analyzer performance counters
+
+    Returns:
+        Cache, single-flight, pre-screen, token usage, model routing,
+        input path, image preprocessing, schema parsing, deferred batch,
+        rate limiter, stream cancellation and SSE framing statistics
+    """
+    analyzer = get_analyzer()
+    return {
+        "cache": analyzer.cache.stats(),
+        "singleFlight": _inflight.stats(),
+        "preScreen": _prescreener.stats(),
+        "usage": analyzer.usage_stats(),
+        "routing": analyzer.routing_stats(),
+        "inputPath": analyzer.input_path_stats(),
+        "imagePreprocessing": analyzer.preprocessing_stats(),
+        "parsing": analyzer.parse_stats(),
+        "deferred": analyzer.deferred.stats(),
+        "rateLimit": analyzer.limiter.stats(),
+        "streamCancellation": {
+            **_disconnects,
+            "mode": STREAM_DISCONNECT_MODE,
+            **analyzer.cancellation_stats()
+        },
+        "sseFrames": {
+            **_sse_counts,
+            "eventsPerFrame": _sse_counts["events"] / _sse_counts["frames"] if _sse_counts["frames"] else 0.0
+        }
+    }
+
+
+@router.get("/history", response_model=List[Dict[str, Any]])
+async def get_invoice_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    status: Optional[str] = Query(None, description="Filter by status (approved/hold/blocked)"),
+    vendor: Optional[str] = Query(None, description="Filter by vendor name"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return")
+):
+    """Get analyzed invoices, most recent first
+
+    When more invoices match than `limit`, the X-Next-Cursor response header
+    holds the cursor for the next page. Every response carries an ETag that
+    changes whenever an invoice is saved; a request whose If-None-Match
+    holds the current ETag gets 304 Not Modified with no body.
+
+    Args:
+        limit: Maximum number of invoices to return
+        cursor: Continue after the page that returned this cursor
+        status: Filter by invoice status
+        vendor: Filter by vendor, ignoring case, punctuation and legal suffixes
+        fields: Only return these InvoiceAnalysisResult fields
+
+    Returns:
+        List of invoice analysis results
+
+    Raises:
+        HTTPException: 400 for an unknown field or a malformed cursor
+    """
+    include = None
+    if fields:
+        include = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = include - InvoiceAnalysisResult.model_fields.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    # Checked before querying, so an unchanged poll costs one version lookup
+    etag = f'"{get_invoices_version()}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    # Proxies may weaken the ETag, and If-None-Match compares weakly
+    if if_none_match.strip() == "*" or etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    try:
+        invoices, next_cursor = query_invoices(
+            status=status or None,
+            vendor=vendor or None,
+            cursor=cursor,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # no-cache: browsers keep the body but revalidate it with If-None-Match every time
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [invoice.model_dump(include=include) for invoice in invoices]
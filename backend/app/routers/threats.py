@@ -1,46 +1,80 @@
 """Threat analytics and reporting router"""
+import uuid
 from datetime import datetime
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.models import (
+    RollupBucket,
     ThreatAnalytics,
     ThreatRecord,
     ThreatReportRequest,
     ThreatReportResponse
 )
+from app.rollups import TOP_THREATS_LIMIT
 from app.storage import (
     save_threat,
-    get_all_threats,
-    get_all_transactions
+    get_blocked_totals,
+    get_daily_rollups,
+    get_vendor_rollup,
+    query_top_threats
 )
 
 router = APIRouter(prefix="/api/threats", tags=["threats"])
 
+# Rewards formula: $25 per unique threat reported
+REWARD_PER_THREAT = 25.0
+
 
 @router.get("/analytics", response_model=ThreatAnalytics)
-async def get_threat_analytics():
+async def get_threat_analytics(
+    response: Response,
+    limit: int = Query(TOP_THREATS_LIMIT, ge=1, le=500, description="Top threats to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page of threats"),
+    days: int = Query(30, ge=0, le=366, description="Latest days of rollups to return")
+):
     """Get threat analytics dashboard data
 
+    Totals come from running counters (see app/rollups.py), so the cost
+    doesn't grow with history. Threats are ranked by amount blocked; the
+    X-Next-Cursor response header continues the ranking when there are more.
+
+    Args:
+        limit: Number of top threats to return
+        cursor: Continue the threat ranking after this cursor
+        days: Number of daily rollups to return
+
     Returns:
         ThreatAnalytics with aggregated threat intelligence
     """
-    threats = get_all_threats()
-    transactions = get_all_transactions()
+    try:
+        threats, next_cursor = query_top_threats(cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    totals = get_blocked_totals()
+    return ThreatAnalytics(
+        totalBlockedAmount=totals.blockedAmount,
+        totalBlockedInvoices=totals.blockedInvoices,
+        totalThreatsDetected=totals.threatsDetected,
+        rewardsEarned=totals.threatsDetected * REWARD_PER_THREAT,
+        threats=threats,
+        daily=get_daily_rollups(days)
+    )
 
-    # Calculate aggregates
-    blocked_transactions = [t for t in transactions if t.status == "blocked"]
-    total_blocked_amount = sum(t.amount for t in blocked_transactions)
-    total_blocked_invoices = len(blocked_transactions)
 
-    # Calculate rewards (simple formula: $1 per threat reported that helped others)
-    rewards_earned = len(threats) * 25.0  # $25 per unique threat
+@router.get("/vendors/{vendor}", response_model=RollupBucket)
+async def get_vendor_analytics(vendor: str):
+    """Get blocked totals and threats for one vendor
 
-    return ThreatAnalytics(
-        totalBlockedAmount=total_blocked_amount,
-        totalBlockedInvoices=total_blocked_invoices,
-        totalThreatsDetected=len(threats),
-        rewardsEarned=rewards_earned,
-        threats=threats
-    )
+    Args:
+        vendor: Vendor name, matched ignoring case, punctuation and legal suffixes
+
+    Returns:
+        RollupBucket keyed by the normalized vendor name (zeros if never seen)
+    """
+    return get_vendor_rollup(vendor)
 
 
 @router.post("/report", response_model=ThreatReportResponse)
@@ -53,8 +87,9 @@ async def report_threat(threat_data: ThreatReportRequest):
     Returns:
         ThreatReportResponse with success status and threat ID
     """
-    # Generate threat ID
-    threat_id = f"THR-{int(datetime.now().timestamp() * 1000)}"
+    # Generate threat ID - suffixed so reports in the same millisecond (or on
+    # another worker) never replace each other
+    threat_id = f"THR-{int(datetime.now().timestamp() * 1000)}-{uuid.uuid4().hex[:6]}"
 
     # Create threat record
     threat = ThreatRecord(
@@ -65,7 +100,8 @@ async def report_threat(threat_data: ThreatReportRequest):
         timesSeen=1,
         reason=threat_data.reason,
         amountBlocked=threat_data.amount,
-        templateHash=None  # Could generate hash from invoice template
+        templateHash=threat_data.templateHash,
+        walletAddress=threat_data.walletAddress
     )
 
     # Save to threat database
@@ -82,7 +118,9 @@ async def auto_report_threat(
     vendor: str,
     fraud_score: int,
     reason: str,
-    amount: float
+    amount: float,
+    wallet_address: Optional[str] = None,
+    template_hash: Optional[str] = None
 ) -> None:
     """Auto-report a threat when an invoice is blocked
 
@@ -93,6 +131,8 @@ async def auto_report_threat(
         vendor=vendor,
         fraudScore=fraud_score,
         reason=reason,
-        amount=amount
+        amount=amount,
+        walletAddress=wallet_address,
+        templateHash=template_hash
     )
     await report_threat(threat_data)
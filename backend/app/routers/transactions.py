@@ -1,41 +1,59 @@
 """Transactions router"""
+from datetime import date, timedelta
 from typing import List, Optional
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.models import Transaction
-from app.storage import get_all_transactions
+from app.storage import query_transactions
 
 router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 
 
 @router.get("", response_model=List[Transaction])
 async def get_transactions(
-    limit: Optional[int] = Query(None, description="Limit number of results"),
-    offset: Optional[int] = Query(0, description="Offset for pagination"),
-    status: Optional[str] = Query(None, description="Filter by status (paid/held/blocked)")
+    response: Response,
+    limit: Optional[int] = Query(None, ge=0, description="Limit number of results"),
+    offset: Optional[int] = Query(0, ge=0, description="Offset for pagination (prefer cursor)"),
+    status: Optional[str] = Query(None, description="Filter by status (paid/held/blocked)"),
+    vendor: Optional[str] = Query(None, description="Filter by vendor name"),
+    date_from: Optional[date] = Query(None, description="Only transactions on or after this date"),
+    date_to: Optional[date] = Query(None, description="Only transactions on or before this date"),
+    min_amount: Optional[float] = Query(None, description="Only transactions of at least this amount"),
+    max_amount: Optional[float] = Query(None, description="Only transactions of at most this amount"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page")
 ):
-    """Get transaction history
+    """Get transaction history, most recent first
+
+    When more transactions match than `limit`, the X-Next-Cursor response
+    header holds the cursor for the next page.
 
     Args:
         limit: Maximum number of transactions to return
         offset: Number of transactions to skip
         status: Filter by transaction status
+        vendor: Filter by vendor, ignoring case, punctuation and legal suffixes
+        date_from: Earliest transaction date
+        date_to: Latest transaction date
+        min_amount: Smallest transaction amount
+        max_amount: Largest transaction amount
+        cursor: Continue after the page that returned this cursor
 
     Returns:
         List of transactions
     """
-    transactions = get_all_transactions()
-
-    # Filter by status if provided
-    if status:
-        transactions = [t for t in transactions if t.status == status]
-
-    # Sort by date (most recent first)
-    transactions.sort(key=lambda x: x.date, reverse=True)
-
-    # Apply pagination
-    if offset:
-        transactions = transactions[offset:]
-    if limit:
-        transactions = transactions[:limit]
-
-    return transactions
+    try:
+        transactions, next_cursor = query_transactions(
+            status=status or None,
+            vendor=vendor or None,
+            date_from=date_from.isoformat() if date_from else None,
+            date_before=(date_to + timedelta(days=1)).isoformat() if date_to else None,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            cursor=cursor,
+            limit=limit + (offset or 0) if limit else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return transactions[offset:] if offset else transactions
@@ -1,7 +1,7 @@
 """Wallet/Treasury router"""
 from fastapi import APIRouter
 from app.models import WalletBalance
-from app.storage import get_wallet_balance, wallet_state
+from app.storage import get_wallet_balance
 from app.locus_wallet import get_wallet_info_from_locus
 
 router = APIRouter(prefix="/api/wallet", tags=["wallet"])
@@ -18,9 +18,10 @@ async def get_balance():
     locus_info = await get_wallet_info_from_locus()
 
     # Combine real balance from Locus with local transaction tracking
+    local = get_wallet_balance()
     return WalletBalance(
         balance=locus_info['balance'],
         currency=locus_info['currency'],
-        autoPaidThisMonth=wallet_state['autoPaidThisMonth'],
-        blockedThisMonth=wallet_state['blockedThisMonth']
+        autoPaidThisMonth=local.autoPaidThisMonth,
+        blockedThisMonth=local.blockedThisMonth
     )
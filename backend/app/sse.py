@@ -0,0 +1,71 @@
+"""Server-Sent Event framing for analysis streams
+
+Claude's reply arrives a few characters per event. Sending each one as its
+own SSE frame costs a json.dumps and a socket write per token. Instead,
+consecutive `stream` events are merged and flushed once enough text has
+built up or the oldest of it has waited long enough. Every other event
+flushes the buffer and goes out immediately.
+"""
+import json
+import os
+import time
+from typing import List, Optional
+
+# Flush buffered stream text at this many characters (0 sends every token
+# as its own frame) or after this many milliseconds
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+
+
+def format_sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+class SSEFrameCoalescer:
+    """Turns analysis events into SSE frames, merging runs of stream text"""
+
+    def __init__(
+        self,
+        max_chars: int = STREAM_FLUSH_CHARS,
+        max_delay: float = STREAM_FLUSH_MS / 1000
+    ):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._parts: List[str] = []
+        self._chars = 0
+        self._since = 0.0
+        self.events = 0
+        self.frames = 0
+
+    def add(self, event: dict) -> List[str]:
+        """Take one event and return the frames now due to be sent"""
+        self.events += 1
+        if event["type"] != "stream":
+            frames = self.flush()
+            frames.append(format_sse(event))
+            self.frames += 1
+            return frames
+
+        if not self._parts:
+            self._since = time.monotonic()
+        self._parts.append(event["text"])
+        self._chars += len(event["text"])
+        if self._chars >= self.max_chars or time.monotonic() - self._since >= self.max_delay:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[str]:
+        """Frame whatever stream text is buffered"""
+        if not self._parts:
+            return []
+        frame = format_sse({"type": "stream", "text": "".join(self._parts)})
+        self._parts = []
+        self._chars = 0
+        self.frames += 1
+        return [frame]
+
+    def idle_timeout(self) -> Optional[float]:
+        """Seconds until buffered text is due, or None when nothing is buffered"""
+        if not self._parts:
+            return None
+        return max(0.0, self._since + self.max_delay - time.monotonic())
@@ -1,21 +1,46 @@
-"""In-memory storage for all application data"""
-from typing import Dict, List
+"""Storage for all application data
+
+The module-level functions are the storage API the rest of the app uses.
+They delegate to a backend chosen by STORAGE_BACKEND:
+
+- "memory" (default): in-process dictionaries and compact columns (see
+  app/columnar.py), lost on restart
+- "sqlite": a SQLite database in WAL mode at STORAGE_PATH (see
+  app/storage_sqlite.py)
+- "shared": the same database, committing every write so that several
+  processes see one consistent set of threats, transactions and wallet
+  counters
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import uuid
 from app.models import (
     InvoiceAnalysisResult,
+    RollupBucket,
     ThreatRecord,
     Transaction,
     WalletBalance
 )
-
-# In-memory databases
-invoices_db: Dict[str, InvoiceAnalysisResult] = {}
-
-# Threat analytics - NOT PERSISTED, resets every session
-threats_db: Dict[str, ThreatRecord] = {}
-
-transactions_db: Dict[str, Transaction] = {}
+from app.vendor_match import (
+    VENDOR_MATCH_LIMIT,
+    VENDOR_MATCH_THRESHOLD,
+    VendorTrigramIndex,
+    normalize_vendor
+)
+from app.columnar import InvoiceColumns, StringTable
+from app.template_hash import TEMPLATE_MATCH_DISTANCE, TemplateIndex
+from app.rollups import (
+    TOTAL,
+    VENDOR,
+    TOP_THREATS_LIMIT,
+    Rollups,
+    ThreatRanking,
+    threat_rollups,
+    transaction_rollups
+)
+from app.transaction_log import TransactionLog, decode_cursor, encode_cursor
 
 # Wallet state - initialized from environment or defaults to 0
 import os
@@ -27,58 +52,396 @@ def _get_initial_balance() -> float:
     except ValueError:
         return 0.0
 
-# Wallet state - balance from blockchain, stats reset each session
-wallet_state = {
-    "balance": _get_initial_balance(),
-    "currency": "USDC",
-    "autoPaidThisMonth": 0.0,  # Resets every session
-    "blockedThisMonth": 0.0    # Resets every session
-}
+
+def _invoice_fingerprint(vendor: str, invoice_id: str, amount: float) -> Tuple[str, str, float]:
+    return normalize_vendor(vendor), invoice_id.strip().lower(), round(amount, 2)
+
+
+def _invoice_key(invoice: InvoiceAnalysisResult) -> str:
+    """Unique storage key combining invoice ID, timestamp and UUID to prevent overwrites"""
+    return f"{invoice.invoiceId}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:8]}"
+
+
+class MemoryStorage:
+    """In-memory storage backend"""
+
+    def __init__(self):
+        # In-memory databases; invoices and transactions are stored by column,
+        # sharing one table of vendor names, currencies and other repeated text
+        self._strings = StringTable()
+        self.invoices_db = InvoiceColumns(self._strings)
+
+        # Threat analytics - NOT PERSISTED, resets every session
+        self.threats_db: Dict[str, ThreatRecord] = {}
+
+        self.transactions_db = TransactionLog(self._strings)
+
+        # Lookup indexes kept in step with the tables above by the save_* methods
+        self._threat_ids_by_vendor: Dict[str, str] = {}
+        self._threat_ids_by_wallet: Dict[str, str] = {}
+        self._invoice_rows_by_key: Dict[str, int] = {}
+        self._invoice_rows_by_fingerprint: Dict[Tuple[str, str, float], int] = {}
+        self._invoice_rows_by_status: Dict[str, array] = {}
+        self._invoice_rows_by_vendor: Dict[str, array] = {}
+        self._invoice_rows_by_status_vendor: Dict[Tuple[str, str], array] = {}
+        # Bumped by every save_invoice; the instance ID tells restarts apart
+        self._invoices_version = 0
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._vendor_index = VendorTrigramIndex()
+        self._template_index = TemplateIndex()
+        self._threat_ranking = ThreatRanking()
+
+        # Analytics totals, kept up to date by save_transaction and save_threat
+        self._rollups = Rollups()
+
+        # Wallet state - balance from blockchain, stats reset each session
+        self.wallet_state = {
+            "balance": _get_initial_balance(),
+            "currency": "USDC",
+            "autoPaidThisMonth": 0.0,  # Resets every session
+            "blockedThisMonth": 0.0    # Resets every session
+        }
+
+    def save_invoice(self, invoice: InvoiceAnalysisResult) -> None:
+        row = self.invoices_db.append(invoice)
+        self._invoice_rows_by_key[_invoice_key(invoice)] = row
+        fingerprint = _invoice_fingerprint(invoice.vendor, invoice.invoiceId, invoice.amount)
+        self._invoice_rows_by_fingerprint.setdefault(fingerprint, row)
+        self._invoice_rows_by_status.setdefault(invoice.status, array("I")).append(row)
+        vendor_key = normalize_vendor(invoice.vendor)
+        self._invoice_rows_by_vendor.setdefault(vendor_key, array("I")).append(row)
+        self._invoice_rows_by_status_vendor.setdefault((invoice.status, vendor_key), array("I")).append(row)
+        self._invoices_version += 1
+
+    def get_invoice(self, invoice_id: str) -> Optional[InvoiceAnalysisResult]:
+        row = self._invoice_rows_by_key.get(invoice_id)
+        return self.invoices_db.get(row) if row is not None else None
+
+    def get_all_invoices(self) -> List[InvoiceAnalysisResult]:
+        return [self.invoices_db.get(row) for row in range(len(self.invoices_db))]
+
+    def query_invoices(
+        self,
+        status: Optional[str],
+        vendor: Optional[str],
+        cursor: Optional[str],
+        limit: int
+    ) -> Tuple[List[InvoiceAnalysisResult], Optional[str]]:
+        vendor_key = normalize_vendor(vendor) if vendor is not None else None
+        # Every row of the index read matches the filters, so a page is a slice
+        if status is not None and vendor_key is not None:
+            rows = self._invoice_rows_by_status_vendor.get((status, vendor_key), array("I"))
+        elif status is not None:
+            rows = self._invoice_rows_by_status.get(status, array("I"))
+        elif vendor_key is not None:
+            rows = self._invoice_rows_by_vendor.get(vendor_key, array("I"))
+        else:
+            rows = range(len(self.invoices_db))
+
+        upper = bisect_left(rows, decode_cursor(cursor)[1]) if cursor else len(rows)
+        page = [rows[index] for index in range(upper - 1, max(-1, upper - 1 - limit), -1)]
+        next_cursor = encode_cursor("", page[-1]) if page and upper > limit else None
+        return [self.invoices_db.get(row) for row in page], next_cursor
+
+    def get_invoices_version(self) -> str:
+        return f"{self._instance_id}-{self._invoices_version}"
+
+    def find_duplicate_invoice(
+        self, vendor: str, invoice_id: str, amount: float
+    ) -> Optional[InvoiceAnalysisResult]:
+        row = self._invoice_rows_by_fingerprint.get(_invoice_fingerprint(vendor, invoice_id, amount))
+        return self.invoices_db.get(row) if row is not None else None
+
+    def save_threat(self, threat: ThreatRecord) -> None:
+        old = self.threats_db.get(threat.id)
+        if old is not None:
+            self._rollups.add(threat_rollups(old), sign=-1)
+        self.threats_db[threat.id] = threat
+        self._rollups.add(threat_rollups(threat))
+        self._threat_ranking.add(threat)
+        self._threat_ids_by_vendor.setdefault(normalize_vendor(threat.vendor), threat.id)
+        self._vendor_index.add(threat.id, threat.vendor)
+        if threat.templateHash:
+            self._template_index.add(threat.id, threat.templateHash)
+        if threat.walletAddress:
+            self._threat_ids_by_wallet.setdefault(threat.walletAddress.lower(), threat.id)
+
+    def find_threat_by_vendor(self, vendor: str) -> Optional[ThreatRecord]:
+        threat_id = self._threat_ids_by_vendor.get(normalize_vendor(vendor))
+        return self.threats_db.get(threat_id) if threat_id else None
+
+    def find_threat_by_wallet(self, wallet_address: str) -> Optional[ThreatRecord]:
+        threat_id = self._threat_ids_by_wallet.get(wallet_address.lower())
+        return self.threats_db.get(threat_id) if threat_id else None
+
+    def find_similar_threats(
+        self, vendor: str, min_similarity: float, limit: int
+    ) -> List[Tuple[ThreatRecord, float]]:
+        return [
+            (self.threats_db[threat_id], similarity)
+            for threat_id, _, similarity in self._vendor_index.search(vendor, min_similarity, limit)
+        ]
+
+    def find_threats_by_template(
+        self, template_hash: str, max_distance: int, limit: int
+    ) -> List[Tuple[ThreatRecord, int]]:
+        return [
+            (self.threats_db[threat_id], distance)
+            for threat_id, distance in self._template_index.search(template_hash, max_distance, limit)
+        ]
+
+    def get_all_threats(self) -> List[ThreatRecord]:
+        return list(self.threats_db.values())
+
+    def query_top_threats(
+        self, cursor: Optional[str], limit: int
+    ) -> Tuple[List[ThreatRecord], Optional[str]]:
+        threat_ids, next_cursor = self._threat_ranking.page(cursor, limit)
+        return [self.threats_db[threat_id] for threat_id in threat_ids], next_cursor
+
+    def update_threat_seen_count(self, vendor: str) -> None:
+        threat = self.find_threat_by_vendor(vendor)
+        if threat:
+            threat.timesSeen += 1
+
+    def save_transaction(self, transaction: Transaction) -> None:
+        old = self.transactions_db.get(transaction.id)
+        if old is not None:
+            self._rollups.add(transaction_rollups(old), sign=-1)
+        self.transactions_db.add(transaction)
+        self._rollups.add(transaction_rollups(transaction))
+
+    def get_all_transactions(self, status: Optional[str] = None) -> List[Transaction]:
+        return self.transactions_db.all(status or None)
+
+    def query_transactions(self, **filters) -> Tuple[List[Transaction], Optional[str]]:
+        return self.transactions_db.query(**filters)
+
+    def get_blocked_totals(self) -> RollupBucket:
+        return self._rollups.get(TOTAL, "")
+
+    def get_vendor_rollup(self, vendor: str) -> RollupBucket:
+        return self._rollups.get(VENDOR, normalize_vendor(vendor))
+
+    def get_daily_rollups(self, limit: int) -> List[RollupBucket]:
+        return self._rollups.recent_days(limit)
+
+    def get_wallet_balance(self) -> WalletBalance:
+        return WalletBalance(**self.wallet_state)
+
+    def update_wallet_balance(self, amount: float, operation: str) -> None:
+        if operation == "pay":
+            self.wallet_state["balance"] -= amount
+            self.wallet_state["autoPaidThisMonth"] += amount
+        elif operation == "block":
+            self.wallet_state["blockedThisMonth"] += amount
+        elif operation == "add":
+            self.wallet_state["balance"] += amount
+
+    def flush(self) -> None:
+        """Nothing is buffered in memory"""
+
+
+def _create_backend():
+    """Instantiate the backend selected by STORAGE_BACKEND"""
+    backend = os.getenv("STORAGE_BACKEND", "memory").lower()
+    if backend in ("sqlite", "shared"):
+        from app.storage_sqlite import SQLiteStorage
+        return SQLiteStorage.from_env(shared=backend == "shared")
+    if backend != "memory":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return MemoryStorage()
+
+
+_backend = _create_backend()
 
 
 def save_invoice(invoice: InvoiceAnalysisResult) -> None:
     """Save invoice analysis result - uses UUID to ensure unique storage"""
-    # Generate a unique key combining timestamp and UUID to prevent overwrites
-    unique_key = f"{invoice.invoiceId}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:8]}"
-    invoices_db[unique_key] = invoice
+    _backend.save_invoice(invoice)
 
 
 def get_invoice(invoice_id: str) -> InvoiceAnalysisResult | None:
     """Retrieve invoice by ID"""
-    return invoices_db.get(invoice_id)
+    return _backend.get_invoice(invoice_id)
+
+
+def get_all_invoices() -> List[InvoiceAnalysisResult]:
+    """Get all invoice analysis results, oldest first"""
+    return _backend.get_all_invoices()
+
+
+def query_invoices(
+    status: Optional[str] = None,
+    vendor: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> Tuple[List[InvoiceAnalysisResult], Optional[str]]:
+    """One page of analyzed invoices, newest first, by keyset pagination
+
+    Args:
+        status: Only invoices with this status
+        vendor: Only invoices from this vendor, compared by normalize_vendor
+        cursor: Continue after the page that returned this cursor
+        limit: Page size
+
+    Returns:
+        (page, cursor for the next page or None if this is the last)
+
+    Raises:
+        ValueError: If `cursor` is malformed
+    """
+    return _backend.query_invoices(status, vendor, cursor, limit)
+
+
+def get_invoices_version() -> str:
+    """Token that changes whenever an invoice is saved, for HTTP ETags"""
+    return _backend.get_invoices_version()
+
+
+def find_duplicate_invoice(
+    vendor: str, invoice_id: str, amount: float
+) -> Optional[InvoiceAnalysisResult]:
+    """Find an earlier invoice with the same vendor, invoice ID and amount"""
+    return _backend.find_duplicate_invoice(vendor, invoice_id, amount)
 
 
 def save_threat(threat: ThreatRecord) -> None:
     """Save threat record"""
-    threats_db[threat.id] = threat
+    _backend.save_threat(threat)
+
+
+def find_threat_by_vendor(vendor: str) -> Optional[ThreatRecord]:
+    """Find the threat record for a vendor name, compared by normalize_vendor"""
+    return _backend.find_threat_by_vendor(vendor)
+
+
+def find_threat_by_wallet(wallet_address: str) -> Optional[ThreatRecord]:
+    """Find the threat record for a payout wallet address"""
+    return _backend.find_threat_by_wallet(wallet_address)
+
+
+def find_similar_threats(
+    vendor: str,
+    min_similarity: float = VENDOR_MATCH_THRESHOLD,
+    limit: int = VENDOR_MATCH_LIMIT
+) -> List[Tuple[ThreatRecord, float]]:
+    """Find threats whose vendor names resemble `vendor` (see app/vendor_match.py)
+
+    Returns:
+        (threat, similarity) pairs, most similar first. A threat whose
+        normalized vendor equals `vendor`'s comes back with similarity 1.0.
+    """
+    return _backend.find_similar_threats(vendor, min_similarity, limit)
+
+
+def find_threats_by_template(
+    template_hash: str,
+    max_distance: int = TEMPLATE_MATCH_DISTANCE,
+    limit: int = 3
+) -> List[Tuple[ThreatRecord, int]]:
+    """Find threats whose invoice template is within `max_distance` bits of
+    `template_hash` (see app/template_hash.py)
+
+    Returns:
+        (threat, Hamming distance) pairs, closest first
+    """
+    return _backend.find_threats_by_template(template_hash, max_distance, limit)
 
 
 def get_all_threats() -> List[ThreatRecord]:
     """Get all threat records"""
-    return list(threats_db.values())
+    return _backend.get_all_threats()
+
+
+def query_top_threats(
+    cursor: Optional[str] = None,
+    limit: int = TOP_THREATS_LIMIT
+) -> Tuple[List[ThreatRecord], Optional[str]]:
+    """One page of threats ordered by amount blocked, largest first
+
+    Returns:
+        (page, cursor for the next page or None if this is the last)
+
+    Raises:
+        ValueError: If `cursor` is malformed
+    """
+    return _backend.query_top_threats(cursor, limit)
 
 
 def update_threat_seen_count(vendor: str) -> None:
-    """Update times seen for a vendor threat"""
-    for threat in threats_db.values():
-        if threat.vendor == vendor:
-            threat.timesSeen += 1
-            break
+    """Update times seen for a vendor threat (matched like find_threat_by_vendor)"""
+    _backend.update_threat_seen_count(vendor)
 
 
 def save_transaction(transaction: Transaction) -> None:
     """Save transaction record"""
-    transactions_db[transaction.id] = transaction
+    _backend.save_transaction(transaction)
+
 
+def get_all_transactions(status: Optional[str] = None) -> List[Transaction]:
+    """Get all transactions, optionally only those with the given status, oldest first"""
+    return _backend.get_all_transactions(status)
 
-def get_all_transactions() -> List[Transaction]:
-    """Get all transactions"""
-    return list(transactions_db.values())
+
+def query_transactions(
+    status: Optional[str] = None,
+    vendor: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_before: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Tuple[List[Transaction], Optional[str]]:
+    """One page of transactions, newest first, by keyset pagination
+
+    Args:
+        status: Only transactions with this status
+        vendor: Only transactions from this vendor, compared by normalize_vendor
+        date_from: Only transactions dated at or after this ISO date/timestamp
+        date_before: Only transactions dated before this ISO date/timestamp
+        min_amount: Only transactions of at least this amount
+        max_amount: Only transactions of at most this amount
+        cursor: Continue after the page that returned this cursor
+        limit: Page size; None returns every match
+
+    Returns:
+        (page, cursor for the next page or None if this is the last)
+
+    Raises:
+        ValueError: If `cursor` is malformed
+    """
+    return _backend.query_transactions(
+        status=status,
+        vendor=vendor,
+        date_from=date_from,
+        date_before=date_before,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        cursor=cursor,
+        limit=limit
+    )
+
+
+def get_blocked_totals() -> RollupBucket:
+    """Blocked amount, blocked invoices and threats detected over all time (see app/rollups.py)"""
+    return _backend.get_blocked_totals()
+
+
+def get_vendor_rollup(vendor: str) -> RollupBucket:
+    """Rollup of one vendor's blocked transactions and threats, compared by normalize_vendor"""
+    return _backend.get_vendor_rollup(vendor)
+
+
+def get_daily_rollups(limit: int) -> List[RollupBucket]:
+    """Rollups of the latest `limit` days with any blocked transaction or new threat, newest first"""
+    return _backend.get_daily_rollups(limit)
 
 
 def get_wallet_balance() -> WalletBalance:
     """Get current wallet balance"""
-    return WalletBalance(**wallet_state)
+    return _backend.get_wallet_balance()
 
 
 def update_wallet_balance(amount: float, operation: str) -> None:
@@ -90,10 +453,9 @@ def update_wallet_balance(amount: float, operation: str) -> None:
                   'block' (increase blocked),
                   'add' (add to balance)
     """
-    if operation == "pay":
-        wallet_state["balance"] -= amount
-        wallet_state["autoPaidThisMonth"] += amount
-    elif operation == "block":
-        wallet_state["blockedThisMonth"] += amount
-    elif operation == "add":
-        wallet_state["balance"] += amount
+    _backend.update_wallet_balance(amount, operation)
+
+
+def flush_storage() -> None:
+    """Write out anything the backend is still buffering"""
+    _backend.flush()
@@ -0,0 +1,587 @@
+"""SQLite storage backend
+
+Persists invoices, threats, transactions and wallet counters in one SQLite
+database in WAL mode, so history survives restarts and readers never block
+the writer. All statements are fixed parameterized SQL, so sqlite3's
+statement cache prepares each one only once. Lookups the app makes are
+indexed: vendor, status, date and invoiceId on transactions, plus the
+duplicate-invoice fingerprint, invoice status and vendor - on their own and
+together, so combined filters read only matching rows - and threat
+vendor/wallet keys. Vendor keys are normalize_vendor() of the name, so threat
+lookups and timesSeen updates match the same row.
+
+Writes are group-committed: a commit happens every STORAGE_BATCH_SIZE writes
+or, on a timer thread, once the oldest uncommitted write is
+STORAGE_FLUSH_SECONDS old, whichever comes first, and at shutdown. Reads on the same connection always see
+uncommitted writes.
+
+In shared mode (STORAGE_BACKEND=shared) several processes - the server and
+scripts alongside it - use the same database. Every write then commits at
+once, so other processes see it immediately and nobody holds the write lock between requests. Counters
+(wallet totals, threat timesSeen, analytics rollups) are only ever changed by
+single UPDATE or upsert statements that add to the stored value, so
+concurrent increments from different processes never overwrite each other.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.models import (
+    InvoiceAnalysisResult,
+    RollupBucket,
+    ThreatRecord,
+    Transaction,
+    WalletBalance
+)
+from app.storage import (
+    _get_initial_balance,
+    _invoice_fingerprint,
+    _invoice_key,
+    normalize_vendor
+)
+from app.rollups import (
+    DAY,
+    TOTAL,
+    VENDOR,
+    decode_threat_cursor,
+    encode_threat_cursor,
+    threat_rollups,
+    transaction_rollups
+)
+from app.template_hash import TemplateIndex
+from app.transaction_log import decode_cursor, encode_cursor
+from app.vendor_match import VendorTrigramIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    key TEXT PRIMARY KEY,
+    invoiceId TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    status TEXT NOT NULL,
+    amount REAL NOT NULL,
+    fingerprint TEXT NOT NULL,
+    data TEXT NOT NULL,
+    vendorKey TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_invoice_id ON invoices(invoiceId);
+CREATE INDEX IF NOT EXISTS idx_invoices_fingerprint ON invoices(fingerprint);
+CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices(status);
+CREATE INDEX IF NOT EXISTS idx_invoices_vendor_key ON invoices(vendorKey);
+CREATE INDEX IF NOT EXISTS idx_invoices_status_vendor_key ON invoices(status, vendorKey);
+
+CREATE TABLE IF NOT EXISTS threats (
+    id TEXT PRIMARY KEY,
+    vendor TEXT NOT NULL,
+    vendorKey TEXT NOT NULL,
+    fraudScore INTEGER NOT NULL,
+    firstSeen TEXT NOT NULL,
+    timesSeen INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    amountBlocked REAL NOT NULL,
+    templateHash TEXT,
+    walletAddress TEXT,
+    walletKey TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_threats_vendor_key ON threats(vendorKey);
+CREATE INDEX IF NOT EXISTS idx_threats_wallet_key ON threats(walletKey);
+CREATE INDEX IF NOT EXISTS idx_threats_amount ON threats(amountBlocked);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    amount REAL NOT NULL,
+    currency TEXT NOT NULL,
+    date TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    invoiceId TEXT NOT NULL,
+    vendorKey TEXT NOT NULL
+);
+-- SQLite appends the rowid to every index, so each is in (date, rowid) order per key
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_date ON transactions(status, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_vendor_date ON transactions(vendorKey, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_vendor_date ON transactions(status, vendorKey, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_invoice_id ON transactions(invoiceId);
+
+CREATE TABLE IF NOT EXISTS wallet (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    blockedAmount REAL NOT NULL,
+    blockedInvoices INTEGER NOT NULL,
+    threatsDetected INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+"""
+
+# Stored in PRAGMA user_version; bump it and add a step to _migrate() when the schema changes
+SCHEMA_VERSION = 1
+
+THREAT_COLUMNS = (
+    "id, vendor, fraudScore, firstSeen, timesSeen, reason, amountBlocked, templateHash, walletAddress"
+)
+TRANSACTION_COLUMNS = "id, status, vendor, amount, currency, date, reason, invoiceId"
+
+INSERT_INVOICE = (
+    "INSERT INTO invoices (key, invoiceId, vendor, status, amount, fingerprint, data, vendorKey) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_THREAT = (
+    f"INSERT OR REPLACE INTO threats ({THREAT_COLUMNS}, vendorKey, walletKey) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_TRANSACTION = (
+    f"INSERT OR REPLACE INTO transactions ({TRANSACTION_COLUMNS}, vendorKey) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+ADD_TO_WALLET = "UPDATE wallet SET value = value + ? WHERE key = ?"
+ADD_TO_ROLLUP = (
+    "INSERT INTO rollups (kind, key, blockedAmount, blockedInvoices, threatsDetected) "
+    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET "
+    "blockedAmount = blockedAmount + excluded.blockedAmount, "
+    "blockedInvoices = blockedInvoices + excluded.blockedInvoices, "
+    "threatsDetected = threatsDetected + excluded.threatsDetected"
+)
+ROLLUP_COLUMNS = "key, blockedAmount, blockedInvoices, threatsDetected"
+
+
+def _fingerprint_text(vendor: str, invoice_id: str, amount: float) -> str:
+    vendor_key, invoice_key, rounded = _invoice_fingerprint(vendor, invoice_id, amount)
+    return f"{vendor_key}\x1f{invoice_key}\x1f{rounded:.2f}"
+
+
+def _rollup_from_row(row: sqlite3.Row) -> RollupBucket:
+    return RollupBucket(**dict(row))
+
+
+def _threat_from_row(row: sqlite3.Row) -> ThreatRecord:
+    return ThreatRecord(**dict(row))
+
+
+def _transaction_from_row(row: sqlite3.Row) -> Transaction:
+    return Transaction(**dict(row))
+
+
+class SQLiteStorage:
+    """Storage backend on a SQLite database in WAL mode"""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 64,
+        flush_seconds: float = 1.0,
+        busy_timeout: float = 5.0
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+
+        # One connection per process; the lock serializes the event loop and any worker threads.
+        # busy_timeout makes a write wait for another process's commit instead of failing.
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False, cached_statements=128
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can lose the last commits but never corrupts the database
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO wallet (key, value) VALUES (?, ?)",
+            [("balance", _get_initial_balance()), ("autoPaidThisMonth", 0.0), ("blockedThisMonth", 0.0)]
+        )
+        self._conn.commit()
+
+        self._uncommitted = 0
+        # Commits the batch flush_seconds after its first write, even if no more writes come
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+        # Look-alike vendor and template indexes, caught up from the threats
+        # table before each search so threats saved by other workers are found too
+        self._vendor_index = VendorTrigramIndex()
+        self._template_index = TemplateIndex()
+        self._threat_index_rowid = 0
+
+    def _migrate(self) -> None:
+        """Bring a database written by an older version up to SCHEMA_VERSION"""
+        # Take the write lock first so that workers starting together migrate once
+        self._conn.execute("BEGIN IMMEDIATE")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._conn.rollback()
+            raise RuntimeError(
+                f"{self.path} has schema version {version}; this version of ShieldNet reads {SCHEMA_VERSION}"
+            )
+        # Version 1 is the first schema; later versions add their upgrade steps here
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls, shared: bool = False) -> "SQLiteStorage":
+        """Create a backend configured from STORAGE_* environment variables
+
+        Args:
+            shared: Other processes use the same database, so commit every write
+        """
+        return cls(
+            path=os.getenv("STORAGE_PATH", "shieldnet.db"),
+            batch_size=1 if shared else int(os.getenv("STORAGE_BATCH_SIZE", "64")),
+            flush_seconds=float(os.getenv("STORAGE_FLUSH_SECONDS", "1.0")),
+            busy_timeout=float(os.getenv("STORAGE_BUSY_TIMEOUT", "5.0"))
+        )
+
+    def _wrote(self) -> None:
+        """Group-commit: commit once enough writes or time have accumulated"""
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_seconds, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Commit every buffered write"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._uncommitted:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    def save_invoice(self, invoice: InvoiceAnalysisResult) -> None:
+        with self._lock:
+            self._conn.execute(INSERT_INVOICE, (
+                _invoice_key(invoice),
+                invoice.invoiceId,
+                invoice.vendor,
+                invoice.status,
+                invoice.amount,
+                _fingerprint_text(invoice.vendor, invoice.invoiceId, invoice.amount),
+                invoice.model_dump_json(),
+                normalize_vendor(invoice.vendor),
+            ))
+            self._wrote()
+
+    def get_invoice(self, invoice_id: str) -> Optional[InvoiceAnalysisResult]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM invoices WHERE key = ?", (invoice_id,)).fetchone()
+        return InvoiceAnalysisResult.model_validate_json(row["data"]) if row else None
+
+    def get_all_invoices(self) -> List[InvoiceAnalysisResult]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM invoices ORDER BY rowid").fetchall()
+        return [InvoiceAnalysisResult.model_validate_json(row["data"]) for row in rows]
+
+    def query_invoices(
+        self,
+        status: Optional[str],
+        vendor: Optional[str],
+        cursor: Optional[str],
+        limit: int
+    ) -> Tuple[List[InvoiceAnalysisResult], Optional[str]]:
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if vendor is not None:
+            conditions.append("vendorKey = ?")
+            params.append(normalize_vendor(vendor))
+        if cursor:
+            conditions.append("rowid < ?")
+            params.append(decode_cursor(cursor)[1])
+
+        sql = "SELECT rowid, data FROM invoices"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # One extra row tells whether there is a next page
+        sql += " ORDER BY rowid DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor("", rows[-1]["rowid"])
+        return [InvoiceAnalysisResult.model_validate_json(row["data"]) for row in rows], next_cursor
+
+    def get_invoices_version(self) -> str:
+        # Invoices are only ever inserted, so the newest rowid changes with every save
+        with self._lock:
+            row = self._conn.execute("SELECT max(rowid) FROM invoices").fetchone()
+        return str(row[0] or 0)
+
+    def find_duplicate_invoice(
+        self, vendor: str, invoice_id: str, amount: float
+    ) -> Optional[InvoiceAnalysisResult]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM invoices WHERE fingerprint = ? ORDER BY rowid LIMIT 1",
+                (_fingerprint_text(vendor, invoice_id, amount),)
+            ).fetchone()
+        return InvoiceAnalysisResult.model_validate_json(row["data"]) if row else None
+
+    def _add_to_rollups(self, changes: List[Tuple[str, str, float, int, int]], sign: int = 1) -> None:
+        """Apply transaction_rollups/threat_rollups output; sign=-1 takes it back out"""
+        self._conn.executemany(ADD_TO_ROLLUP, [
+            (kind, key, sign * amount, sign * invoices, sign * threats)
+            for kind, key, amount, invoices, threats in changes
+        ])
+
+    def save_threat(self, threat: ThreatRecord) -> None:
+        with self._lock:
+            old = self._conn.execute(
+                f"SELECT {THREAT_COLUMNS} FROM threats WHERE id = ?", (threat.id,)
+            ).fetchone()
+            if old is not None:
+                self._add_to_rollups(threat_rollups(_threat_from_row(old)), sign=-1)
+            self._conn.execute(INSERT_THREAT, (
+                threat.id,
+                threat.vendor,
+                threat.fraudScore,
+                threat.firstSeen,
+                threat.timesSeen,
+                threat.reason,
+                threat.amountBlocked,
+                threat.templateHash,
+                threat.walletAddress,
+                normalize_vendor(threat.vendor),
+                threat.walletAddress.lower() if threat.walletAddress else None,
+            ))
+            self._add_to_rollups(threat_rollups(threat))
+            self._wrote()
+
+    def find_threat_by_vendor(self, vendor: str) -> Optional[ThreatRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {THREAT_COLUMNS} FROM threats WHERE vendorKey = ? ORDER BY rowid LIMIT 1",
+                (normalize_vendor(vendor),)
+            ).fetchone()
+        return _threat_from_row(row) if row else None
+
+    def find_threat_by_wallet(self, wallet_address: str) -> Optional[ThreatRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {THREAT_COLUMNS} FROM threats WHERE walletKey = ? ORDER BY rowid LIMIT 1",
+                (wallet_address.lower(),)
+            ).fetchone()
+        return _threat_from_row(row) if row else None
+
+    def _sync_threat_indexes(self) -> None:
+        """Add threats inserted since the last search to the vendor and template indexes"""
+        rows = self._conn.execute(
+            "SELECT rowid, id, vendor, templateHash FROM threats WHERE rowid > ? ORDER BY rowid",
+            (self._threat_index_rowid,)
+        ).fetchall()
+        for row in rows:
+            self._vendor_index.add(row["id"], row["vendor"])
+            if row["templateHash"]:
+                self._template_index.add(row["id"], row["templateHash"])
+        if rows:
+            self._threat_index_rowid = rows[-1]["rowid"]
+
+    def _threats_by_id(self, threat_ids: List[str]) -> Dict[str, ThreatRecord]:
+        rows = self._conn.execute(
+            f"SELECT {THREAT_COLUMNS} FROM threats WHERE id IN ({', '.join('?' * len(threat_ids))})",
+            threat_ids
+        ).fetchall()
+        return {row["id"]: _threat_from_row(row) for row in rows}
+
+    def find_similar_threats(
+        self, vendor: str, min_similarity: float, limit: int
+    ) -> List[Tuple[ThreatRecord, float]]:
+        with self._lock:
+            self._sync_threat_indexes()
+            matches = self._vendor_index.search(vendor, min_similarity, limit)
+            if not matches:
+                return []
+            threats = self._threats_by_id([threat_id for threat_id, _, _ in matches])
+        return [
+            (threats[threat_id], similarity)
+            for threat_id, _, similarity in matches
+            if threat_id in threats
+        ]
+
+    def find_threats_by_template(
+        self, template_hash: str, max_distance: int, limit: int
+    ) -> List[Tuple[ThreatRecord, int]]:
+        with self._lock:
+            self._sync_threat_indexes()
+            matches = self._template_index.search(template_hash, max_distance, limit)
+            if not matches:
+                return []
+            threats = self._threats_by_id([threat_id for threat_id, _ in matches])
+        return [
+            (threats[threat_id], distance)
+            for threat_id, distance in matches
+            if threat_id in threats
+        ]
+
+    def get_all_threats(self) -> List[ThreatRecord]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {THREAT_COLUMNS} FROM threats ORDER BY rowid").fetchall()
+        return [_threat_from_row(row) for row in rows]
+
+    def query_top_threats(
+        self, cursor: Optional[str], limit: int
+    ) -> Tuple[List[ThreatRecord], Optional[str]]:
+        if cursor:
+            where, params = "WHERE (amountBlocked, rowid) < (?, ?) ", [*decode_threat_cursor(cursor)]
+        else:
+            where, params = "", []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT rowid, {THREAT_COLUMNS} FROM threats {where}"
+                "ORDER BY amountBlocked DESC, rowid DESC LIMIT ?",
+                # One extra row tells whether there is a next page
+                params + [limit + 1]
+            ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_threat_cursor(rows[-1]["amountBlocked"], rows[-1]["rowid"])
+        return [_threat_from_row(row) for row in rows], next_cursor
+
+    def update_threat_seen_count(self, vendor: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE threats SET timesSeen = timesSeen + 1 WHERE rowid = "
+                "(SELECT rowid FROM threats WHERE vendorKey = ? ORDER BY rowid LIMIT 1)",
+                (normalize_vendor(vendor),)
+            )
+            self._wrote()
+
+    def save_transaction(self, transaction: Transaction) -> None:
+        with self._lock:
+            old = self._conn.execute(
+                f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE id = ?", (transaction.id,)
+            ).fetchone()
+            if old is not None:
+                self._add_to_rollups(transaction_rollups(_transaction_from_row(old)), sign=-1)
+            self._conn.execute(INSERT_TRANSACTION, (
+                transaction.id,
+                transaction.status,
+                transaction.vendor,
+                transaction.amount,
+                transaction.currency,
+                transaction.date,
+                transaction.reason,
+                transaction.invoiceId,
+                normalize_vendor(transaction.vendor),
+            ))
+            self._add_to_rollups(transaction_rollups(transaction))
+            self._wrote()
+
+    def get_all_transactions(self, status: Optional[str] = None) -> List[Transaction]:
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    f"SELECT {TRANSACTION_COLUMNS} FROM transactions WHERE status = ? ORDER BY rowid",
+                    (status,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {TRANSACTION_COLUMNS} FROM transactions ORDER BY rowid"
+                ).fetchall()
+        return [_transaction_from_row(row) for row in rows]
+
+    def query_transactions(
+        self,
+        status: Optional[str] = None,
+        vendor: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_before: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Transaction], Optional[str]]:
+        # Each filter adds a fixed clause, so every combination is its own cached statement
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if vendor is not None:
+            conditions.append("vendorKey = ?")
+            params.append(normalize_vendor(vendor))
+        if date_from:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_before:
+            conditions.append("date < ?")
+            params.append(date_before)
+        if cursor:
+            conditions.append("(date, rowid) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        if min_amount is not None:
+            conditions.append("amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            conditions.append("amount <= ?")
+            params.append(max_amount)
+
+        sql = f"SELECT rowid, {TRANSACTION_COLUMNS} FROM transactions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY date DESC, rowid DESC"
+        if limit is not None:
+            # One extra row tells whether there is a next page
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["date"], rows[-1]["rowid"])
+        return [_transaction_from_row(row) for row in rows], next_cursor
+
+    def _get_rollup(self, kind: str, key: str) -> RollupBucket:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {ROLLUP_COLUMNS} FROM rollups WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        return _rollup_from_row(row) if row else RollupBucket(key=key)
+
+    def get_blocked_totals(self) -> RollupBucket:
+        return self._get_rollup(TOTAL, "")
+
+    def get_vendor_rollup(self, vendor: str) -> RollupBucket:
+        return self._get_rollup(VENDOR, normalize_vendor(vendor))
+
+    def get_daily_rollups(self, limit: int) -> List[RollupBucket]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {ROLLUP_COLUMNS} FROM rollups WHERE kind = ? ORDER BY key DESC LIMIT ?",
+                (DAY, max(limit, 0))
+            ).fetchall()
+        return [_rollup_from_row(row) for row in rows]
+
+    def get_wallet_balance(self) -> WalletBalance:
+        with self._lock:
+            values = dict(self._conn.execute("SELECT key, value FROM wallet").fetchall())
+        return WalletBalance(currency="USDC", **values)
+
+    def update_wallet_balance(self, amount: float, operation: str) -> None:
+        changes = {
+            "pay": [(-amount, "balance"), (amount, "autoPaidThisMonth")],
+            "block": [(amount, "blockedThisMonth")],
+            "add": [(amount, "balance")],
+        }.get(operation, [])
+        if not changes:
+            return
+        with self._lock:
+            self._conn.executemany(ADD_TO_WALLET, changes)
+            self._wrote()
@@ -0,0 +1,155 @@
+"""Time-ordered transaction store with status and vendor indexes
+
+Transactions are stored in TransactionColumns and kept sorted by (date,
+row), where the row is the order they were saved in, so transactions with
+the same timestamp keep a stable order. Each status, each normalized vendor
+and each (status, vendor) pair has its own array of rows in that order, so
+any combination of the two filters reads only matching rows, and date
+ranges are binary searches into that array. Transaction models are only
+built for the rows a query returns.
+
+Pages are returned newest first and continued with keyset cursors: a cursor
+holds the key of the last transaction returned, and the next page starts
+just below it. Fetching a page costs O(log n + page) however deep it is,
+where an offset costs O(offset). Amount filters are checked while walking
+the list, so a selective amount range walks further for a full page.
+"""
+import base64
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+from app.columnar import StringTable, TransactionColumns
+from app.models import Transaction
+from app.vendor_match import normalize_vendor
+
+SortKey = Tuple[str, int]
+
+
+def encode_cursor(value: str, seq: int) -> str:
+    """Opaque cursor continuing a listing below the item at (value, seq)
+
+    Transactions use their date as the value; other listings use whatever
+    they are sorted by, or "" when they are in save order.
+    """
+    return base64.urlsafe_b64encode(f"{value}|{seq}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Inverse of encode_cursor
+
+    Raises:
+        ValueError: If the cursor wasn't made by encode_cursor
+    """
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        value, seq = text.rsplit("|", 1)
+        return value, int(seq)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+class TransactionLog:
+    """In-memory transactions in time order, indexed by status and vendor"""
+
+    def __init__(self, strings: Optional[StringTable] = None):
+        self._columns = TransactionColumns(strings)
+        self._rows = array("I")
+        self._rows_by_status: Dict[str, array] = {}
+        self._rows_by_vendor: Dict[str, array] = {}
+        self._rows_by_status_vendor: Dict[Tuple[str, str], array] = {}
+        self._rows_by_id: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _key(self, row: int) -> SortKey:
+        return self._columns.date(row), row
+
+    def _insert(self, rows: array, row: int) -> None:
+        # Transactions are almost always saved in time order
+        if not rows or self._key(row) > self._key(rows[-1]):
+            rows.append(row)
+        else:
+            insort(rows, row, key=self._key)
+
+    def _remove(self, rows: array, row: int) -> None:
+        del rows[bisect_left(rows, self._key(row), key=self._key)]
+
+    def get(self, transaction_id: str) -> Optional[Transaction]:
+        row = self._rows_by_id.get(transaction_id)
+        return self._columns.get(row) if row is not None else None
+
+    def add(self, transaction: Transaction) -> None:
+        """Save a transaction, replacing any earlier one with the same ID"""
+        old_row = self._rows_by_id.get(transaction.id)
+        if old_row is not None:
+            self._remove(self._rows, old_row)
+            self._remove(self._rows_by_status[self._columns.status(old_row)], old_row)
+            self._remove(self._rows_by_vendor[self._columns.vendor_key(old_row)], old_row)
+            self._remove(
+                self._rows_by_status_vendor[(self._columns.status(old_row), self._columns.vendor_key(old_row))],
+                old_row
+            )
+            self._columns.discard(old_row)
+
+        row = self._columns.append(transaction)
+        self._rows_by_id[transaction.id] = row
+        self._insert(self._rows, row)
+        self._insert(self._rows_by_status.setdefault(transaction.status, array("I")), row)
+        vendor_key = normalize_vendor(transaction.vendor)
+        self._insert(self._rows_by_vendor.setdefault(vendor_key, array("I")), row)
+        self._insert(self._rows_by_status_vendor.setdefault((transaction.status, vendor_key), array("I")), row)
+
+    def all(self, status: Optional[str] = None) -> List[Transaction]:
+        """Every transaction (with `status`, if given), oldest first"""
+        rows = self._rows if status is None else self._rows_by_status.get(status, [])
+        return [self._columns.get(row) for row in rows]
+
+    def query(
+        self,
+        status: Optional[str] = None,
+        vendor: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_before: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Transaction], Optional[str]]:
+        """One page of matching transactions, newest first
+
+        See app.storage.query_transactions for the arguments.
+
+        Raises:
+            ValueError: If `cursor` is malformed
+        """
+        columns = self._columns
+        vendor_key = normalize_vendor(vendor) if vendor is not None else None
+        # Every row of the array read matches the status and vendor filters
+        if status is not None and vendor_key is not None:
+            rows = self._rows_by_status_vendor.get((status, vendor_key), array("I"))
+        elif status is not None:
+            rows = self._rows_by_status.get(status, array("I"))
+        elif vendor_key is not None:
+            rows = self._rows_by_vendor.get(vendor_key, array("I"))
+        else:
+            rows = self._rows
+
+        # A bare (date,) sorts before every key with that date
+        lower = bisect_left(rows, (date_from,), key=self._key) if date_from else 0
+        upper = bisect_left(rows, (date_before,), key=self._key) if date_before else len(rows)
+        if cursor:
+            upper = min(upper, bisect_left(rows, decode_cursor(cursor), key=self._key))
+
+        page: List[int] = []
+        for position in range(upper - 1, lower - 1, -1):
+            row = rows[position]
+            if min_amount is not None and columns.amount(row) < min_amount:
+                continue
+            if max_amount is not None and columns.amount(row) > max_amount:
+                continue
+            if limit is not None and len(page) == limit:
+                # One more match exists, so there is a next page
+                return [columns.get(row) for row in page], encode_cursor(*self._key(page[-1]))
+            page.append(row)
+        return [columns.get(row) for row in page], None
@@ -0,0 +1,136 @@
+"""Vendor name normalization and approximate matching
+
+Fraudsters register look-alike vendors: "Acme Supplies" turns into "Acme
+Suppliess" or "Acme-Supplies Inc". Names are first normalized, then compared
+by the Jaccard similarity of their character trigrams. VendorTrigramIndex
+reads the inverted lists of a query's rarest trigrams only and scores just
+the names that appear in enough of them.
+"""
+import math
+import os
+import re
+from collections import Counter
+from itertools import chain
+from typing import Dict, FrozenSet, List, Tuple
+
+# Lowest trigram similarity (0-1] reported as a look-alike, and how many to report
+VENDOR_MATCH_THRESHOLD = float(os.getenv("VENDOR_MATCH_THRESHOLD", "0.6"))
+VENDOR_MATCH_LIMIT = int(os.getenv("VENDOR_MATCH_LIMIT", "3"))
+
+# Legal-form words dropped from the end of a vendor name, after punctuation
+# is removed ("L.L.C." -> "llc")
+LEGAL_SUFFIXES = {
+    "llc", "inc", "incorporated", "ltd", "limited", "corp", "corporation",
+    "co", "company", "plc", "llp", "lp", "gmbh", "ag", "sa", "sarl", "bv",
+    "nv", "pty", "pte", "srl", "oy", "ab", "as",
+}
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def normalize_vendor(vendor: str) -> str:
+    """Key under which vendor names are matched
+
+    Case-folds, removes punctuation, collapses whitespace and drops trailing
+    legal suffixes, so "ACME Corp.", "Acme, Inc" and " acme " all map to "acme".
+    """
+    words = _PUNCTUATION.sub("", vendor.casefold()).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def vendor_trigrams(key: str) -> FrozenSet[str]:
+    """Character trigrams of a normalized name
+
+    Spaces are ignored, so "acme supplies" and "acmesupplies" match fully,
+    and the padding gives the first and last letters their own trigrams.
+    """
+    text = f"  {key.replace(' ', '')} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class VendorTrigramIndex:
+    """Inverted trigram index over normalized vendor names
+
+    Every trigram has a list of the names that contain it. A name with
+    Jaccard similarity >= t to a query of n trigrams shares at least
+    m = ceil(t * n) of them, so it shares at least k = min_shared of the
+    query's n - m + k rarest trigrams (the count filter). A search reads only
+    those lists - rare trigrams have short ones - keeps the names that appear
+    in k of them, and computes the exact similarity for just those.
+
+    Each normalized name is indexed once, under the ID it was first added
+    with - the same record an exact lookup by that name returns.
+    """
+
+    def __init__(self, min_shared: int = 3):
+        self.min_shared = min_shared
+        self._postings: Dict[str, List[int]] = {}
+        self._grams: List[FrozenSet[str]] = []
+        self._keys: List[str] = []
+        self._ids: List[str] = []
+        self._entries_by_key: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, item_id: str, vendor: str) -> None:
+        key = normalize_vendor(vendor)
+        if not key or key in self._entries_by_key:
+            return
+        entry = len(self._ids)
+        grams = vendor_trigrams(key)
+        self._entries_by_key[key] = entry
+        self._ids.append(item_id)
+        self._keys.append(key)
+        self._grams.append(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(entry)
+
+    def search(
+        self,
+        vendor: str,
+        min_similarity: float = VENDOR_MATCH_THRESHOLD,
+        limit: int = VENDOR_MATCH_LIMIT
+    ) -> List[Tuple[str, str, float]]:
+        """Find indexed vendors whose names resemble `vendor`
+
+        Args:
+            vendor: Vendor name as it appears on the invoice
+            min_similarity: Lowest trigram Jaccard similarity to return, in (0, 1]
+            limit: Most matches to return
+
+        Returns:
+            (item ID, normalized name, similarity) tuples, most similar first.
+            An indexed name equal to the query's is included with similarity 1.0.
+        """
+        key = normalize_vendor(vendor)
+        if not key:
+            return []
+        grams = vendor_trigrams(key)
+        size = len(grams)
+
+        needed = max(1, math.ceil(min_similarity * size - 1e-9))
+        shared = min(self.min_shared, needed)
+        lists = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        counts = Counter(chain.from_iterable(lists[:size - needed + shared]))
+
+        # Jaccard similarity can't reach min_similarity if the sizes differ too much
+        min_size, max_size = min_similarity * size, size / min_similarity
+        matches = []
+        for entry, count in counts.items():
+            if count < shared:
+                continue
+            other = self._grams[entry]
+            if not min_size <= len(other) <= max_size:
+                continue
+            common = len(grams & other)
+            similarity = common / (size + len(other) - common)
+            if similarity >= min_similarity - 1e-9:
+                matches.append((similarity, entry))
+
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [
+            (self._ids[entry], self._keys[entry], round(similarity, 3))
+            for similarity, entry in matches[:limit]
+        ]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Benchmark the columnar memory store in app/columnar.py against dicts of models
+
+For each size, fresh processes store N synthetic transactions and N invoices
+(three local checks, one network signal and a 200-character explanation
+each) either as pydantic models in a dict - what the memory backend used to
+keep - or in TransactionColumns / InvoiceColumns, and report the memory they
+hold on to, measured with tracemalloc. Transactions are spread over 1,000
+vendors, 3 statuses and 2 currencies, and each has its own reason of about
+170 characters, as the analysis explanation gives in the app.
+
+Then amounts are summed by status and by vendor: a loop over the models,
+the columns with NumPy (bincount over the arrays) and the columns without
+NumPy. The report checks that all three give the same totals.
+
+Usage:
+    python benchmarks/columnar_store_bench.py                    # 100k
+    python benchmarks/columnar_store_bench.py --sizes 100000,1000000 --kinds transactions
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STORES = ("dicts", "columns")
+AGGREGATES = ("dicts", "numpy", "python")
+
+
+def timed(fn, repeats: int) -> float:
+    """Median milliseconds per call"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def generate_transactions(size: int):
+    from app.models import Transaction
+
+    rng = random.Random(7)
+    start = datetime(2025, 1, 1)
+    for i in range(size):
+        status = rng.choice(("paid", "paid", "held", "blocked"))
+        vendor = f"Vendor {rng.randrange(1000)} Inc"
+        amount = round(rng.uniform(10, 5000), 2)
+        # The reason is the analysis explanation, so every transaction has its own
+        yield Transaction(
+            id=f"TXN-{i:08d}-{rng.getrandbits(24):06x}",
+            status=status,
+            vendor=vendor,
+            amount=amount,
+            currency=rng.choice(("USDC", "USDC", "USDC", "EURC")),
+            date=(start + timedelta(seconds=30 * i)).isoformat(timespec="seconds"),
+            reason=f"Invoice {i} from {vendor} for {amount:.2f} "
+                   + "matches the vendor's usual billing pattern. " * 3,
+            invoiceId=f"INV-{rng.randrange(10 ** 6):06d}",
+        )
+
+
+def generate_invoices(size: int):
+    from app.models import InvoiceAnalysisResult, LocalCheck, NetworkSignal
+
+    rng = random.Random(7)
+    for i in range(size):
+        yield InvoiceAnalysisResult(
+            invoiceId=f"INV-{rng.randrange(10 ** 6):06d}",
+            status=rng.choice(("approved", "approved", "hold", "blocked")),
+            confidence=rng.randint(50, 100),
+            fraudScore=rng.randint(0, 100),
+            localChecks=[
+                LocalCheck(name="Amount check", status="pass", detail=f"Amount {i % 997} within range"),
+                LocalCheck(name="Vendor history", status=rng.choice(("pass", "warning")),
+                           detail="Vendor seen before"),
+                LocalCheck(name="Duplicate check", status="pass", detail="No duplicate found"),
+            ],
+            networkSignals=[NetworkSignal(type="clean", description="No network reports")],
+            explanation=f"Invoice {i} " + "matches the vendor's usual billing pattern. " * 4,
+            vendor=f"Vendor {rng.randrange(1000)} Inc",
+            amount=round(rng.uniform(10, 5000), 2),
+            walletAddress=f"0x{rng.getrandbits(160):040x}" if rng.random() < 0.5 else None,
+        )
+
+
+def dict_totals(records, field: str) -> dict:
+    totals = {}
+    for record in records:
+        amount, count = totals.get(getattr(record, field), (0.0, 0))
+        totals[getattr(record, field)] = (amount + record.amount, count + 1)
+    return totals
+
+
+def same_totals(a: dict, b: dict) -> bool:
+    return a.keys() == b.keys() and all(
+        a[key][1] == b[key][1] and abs(a[key][0] - b[key][0]) < 1e-6 * max(1.0, abs(a[key][0]))
+        for key in a
+    )
+
+
+def run_case(kind: str, store: str, size: int) -> dict:
+    """Runs inside the child process"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app import columnar
+
+    generate = generate_transactions if kind == "transactions" else generate_invoices
+    tracemalloc.start()
+    if store == "dicts":
+        key = "id" if kind == "transactions" else "invoiceId"
+        records = {f"{getattr(record, key)}-{i}": record for i, record in enumerate(generate(size))}
+    else:
+        records = columnar.TransactionColumns() if kind == "transactions" else columnar.InvoiceColumns()
+        for record in generate(size):
+            records.append(record)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    result = {"bytes": held / size}
+    if kind != "transactions":
+        return result
+    if store == "dicts":
+        def aggregate():
+            return [dict_totals(records.values(), field) for field in ("status", "vendor")]
+        result["aggregate"] = timed(aggregate, 5)
+    else:
+        def aggregate():
+            return [records.totals_by_status(), records.totals_by_vendor()]
+        result["numpy"] = columnar.numpy is not None
+        result["aggregate"] = timed(aggregate, 20)
+        numpy, columnar.numpy = columnar.numpy, None
+        result["aggregate python"] = timed(aggregate, 5)
+        columnar.numpy = numpy
+    result["totals"] = aggregate()
+    return result
+
+
+def child(kind: str, store: str, size: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--case", kind, store, str(size)],
+        env=os.environ, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100000")
+    parser.add_argument("--kinds", default="transactions,invoices")
+    parser.add_argument("--case", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        kind, store, size = args.case
+        print(json.dumps(run_case(kind, store, int(size))))
+        return
+
+    print(f"{'records':<12} {'count':>10} {'store':<8} {'bytes/record':>13} {'MB per 1M':>10} {'vs dicts':>9}")
+    aggregates = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for kind in args.kinds.split(","):
+            results = {store: child(kind, store, size) for store in STORES}
+            for store in STORES:
+                per_record = results[store]["bytes"]
+                print(f"{kind:<12} {size:>10,} {store:<8} {per_record:>13,.0f} "
+                      f"{per_record * 10 ** 6 / 2 ** 20:>10,.0f} {per_record / results['dicts']['bytes']:>9.0%}")
+            if kind == "transactions":
+                aggregates.append((size, results))
+
+    if aggregates:
+        print("\nsum amounts by status and by vendor, median ms\n")
+        print(f"{'transactions':>12} " + " ".join(f"{name:>8}" for name in AGGREGATES) + f" {'agrees':>7}")
+        for size, results in aggregates:
+            columns = results["columns"]
+            agrees = all(
+                same_totals(expected, found)
+                for expected, found in zip(results["dicts"]["totals"], columns["totals"])
+            )
+            numpy_ms = f"{columns['aggregate']:>8.2f}" if columns["numpy"] else f"{'-':>8}"
+            print(f"{size:>12,} {results['dicts']['aggregate']:>8.2f} {numpy_ms} "
+                  f"{columns['aggregate python']:>8.2f} {str(agrees):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Run deferred (Message Batches) analyses end to end against the fake server
+
+Starts the fake Anthropic server with some batch requests set to error or
+expire, and a backend that flushes its deferred queue quickly. Then it queues
+distinct invoices through /api/invoices/analyze/deferred and polls until every
+job has completed or failed. Expired requests should be resubmitted, and
+errored ones should fail only their own job.
+
+Usage:
+    python benchmarks/deferred_batch_run.py --invoices 20 --error-rate 0.1 --expire-rate 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+import httpx
+from load_test import start_process, tiny_png, wait_for
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--expire-rate", type=float, default=0.2)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds until a fake batch ends")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--fake-port", type=int, default=8787)
+    parser.add_argument("--app-port", type=int, default=8788)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}"
+    env["ANTHROPIC_API_KEY"] = env.get("ANTHROPIC_API_KEY", "fake-key")
+    env["ANALYSIS_CACHE_SIZE"] = "0"
+    env["DEFERRED_FLUSH_SECONDS"] = "1"
+    env["DEFERRED_POLL_SECONDS"] = "0.5"
+
+    fake = start_process(
+        ["benchmarks/fake_anthropic.py", "--port", str(args.fake_port), "--delay", "0",
+         "--batch-delay", str(args.batch_delay),
+         "--batch-error-rate", str(args.error_rate),
+         "--batch-expire-rate", str(args.expire_rate)],
+        env,
+    )
+    app = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--workers", "1",
+         "--log-level", "warning"],
+        env,
+    )
+    base_url = f"http://127.0.0.1:{args.app_port}"
+
+    try:
+        await wait_for(f"http://127.0.0.1:{args.fake_port}/docs")
+        await wait_for(f"{base_url}/health")
+
+        async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+            started = time.perf_counter()
+            job_ids = []
+            for i in range(args.invoices):
+                # A distinct pixel per invoice, so no two uploads share a hash
+                png = tiny_png(bytes([i % 256, i // 256 % 256, 7]))
+                response = await client.post(
+                    "/api/invoices/analyze/deferred",
+                    files={"file": (f"deferred_{i}.png", png, "image/png")},
+                )
+                response.raise_for_status()
+                job_ids.append(response.json()["jobId"])
+
+            jobs = {}
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline:
+                for job_id in job_ids:
+                    jobs[job_id] = (await client.get(f"/api/invoices/deferred/{job_id}")).json()
+                if all(job["status"] != "queued" for job in jobs.values()):
+                    break
+                await asyncio.sleep(0.5)
+            elapsed = time.perf_counter() - started
+
+            statuses = [job["status"] for job in jobs.values()]
+            print(f"{len(job_ids)} invoices settled in {elapsed:.1f}s")
+            for status in ("completed", "failed", "queued"):
+                print(f"  {status:<10} {statuses.count(status)}")
+            for job in jobs.values():
+                if job["status"] == "failed":
+                    print(f"  - {job['filename']}: {job['error']}")
+
+            metrics = (await client.get("/api/invoices/metrics")).json()
+            print(f"\nDeferred queue: {metrics['deferred']}")
+    finally:
+        app.terminate()
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Local fake Anthropic Messages API for load testing ShieldNet offline
+
+Serves POST /v1/messages (plain and SSE streaming) with a configurable delay
+and a canned invoice analysis, so the backend can be exercised without
+network access or API spend. When the request forces a tool, the analysis
+comes back as that tool's input, as the real API does.
+
+Also serves the Message Batches endpoints. A batch ends --batch-delay seconds
+after it is created, and a random share of its requests can be made to error
+or expire, to exercise the deferred analysis path's failure handling.
+
+With --rpm, /v1/messages enforces a requests/minute limit: it reports
+anthropic-ratelimit-requests-* headers and answers 429 with retry-after once
+the limit is used up, to exercise the backend's rate limiter.
+
+Usage:
+    python benchmarks/fake_anthropic.py --port 8787 --delay 2.0
+    python benchmarks/fake_anthropic.py --rpm 30
+    python benchmarks/fake_anthropic.py --batch-delay 5 --batch-error-rate 0.1 --batch-expire-rate 0.1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 ANTHROPIC_API_KEY=fake python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+app = FastAPI(title="Fake Anthropic API")
+
+# Seconds each request takes, set from the command line
+RESPONSE_DELAY = 2.0
+
+# Requests/minute before /v1/messages answers 429 (0 = unlimited)
+REQUESTS_PER_MINUTE = 0
+_request_times: deque = deque()
+
+# Message Batches behaviour, set from the command line
+BATCH_DELAY = 2.0
+BATCH_ERROR_RATE = 0.0
+BATCH_EXPIRE_RATE = 0.0
+
+# Batches by id: creation time, outcome per custom_id, and each request's body
+_batches: dict = {}
+
+# "hold" keeps the backend from triggering real Locus payments during load tests
+CANNED_ANALYSIS = {
+    "invoiceId": "INV-LOADTEST",
+    "vendor": "Load Test Supplies",
+    "amount": 0.5,
+    "walletAddress": "0x0000000000000000000000000000000000000001",
+    "fraudScore": 45,
+    "confidence": 80,
+    "status": "hold",
+    "explanation": "Canned response from the fake Anthropic server",
+    "localChecks": [
+        {"name": "Format Validity", "status": "pass", "detail": "Fake server"},
+        {"name": "Vendor Trust", "status": "warning", "detail": "Unknown vendor"},
+    ],
+}
+
+
+# Streamed characters per delta, and extra explanation text to lengthen replies
+STREAM_CHUNK_CHARS = 8
+REPLY_PADDING = 0
+
+
+def _analysis() -> dict:
+    """The canned analysis, with a fresh invoice ID so the duplicate pre-screen never fires"""
+    return {
+        **CANNED_ANALYSIS,
+        "invoiceId": f"INV-LOADTEST-{uuid.uuid4().hex[:8]}",
+        "explanation": CANNED_ANALYSIS["explanation"] + " lorem" * (REPLY_PADDING // 6),
+    }
+
+
+def _response_text() -> str:
+    return "```json\n" + json.dumps(_analysis(), indent=2) + "\n```"
+
+
+def _forced_tool(body: dict):
+    """Name of the tool the request forces, if any"""
+    tool_choice = body.get("tool_choice") or {}
+    return tool_choice.get("name") if tool_choice.get("type") == "tool" else None
+
+
+def _usage(output_tokens: int) -> dict:
+    return {"input_tokens": 1500, "output_tokens": output_tokens}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_message(model: str, text: str, tool_name=None):
+    message_id = f"msg_{uuid.uuid4().hex[:24]}"
+    if tool_name:
+        text = json.dumps(_analysis())
+        content_block = {"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:24]}", "name": tool_name, "input": {}}
+    else:
+        content_block = {"type": "text", "text": ""}
+    chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+    per_chunk_delay = RESPONSE_DELAY / max(len(chunks), 1)
+
+    yield _sse("message_start", {
+        "type": "message_start",
+        "message": {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": _usage(1),
+        },
+    })
+    yield _sse("content_block_start", {
+        "type": "content_block_start",
+        "index": 0,
+        "content_block": content_block,
+    })
+    for chunk in chunks:
+        await asyncio.sleep(per_chunk_delay)
+        if tool_name:
+            delta = {"type": "input_json_delta", "partial_json": chunk}
+        else:
+            delta = {"type": "text_delta", "text": chunk}
+        yield _sse("content_block_delta", {
+            "type": "content_block_delta",
+            "index": 0,
+            "delta": delta,
+        })
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": "tool_use" if tool_name else "end_turn", "stop_sequence": None},
+        "usage": {"output_tokens": len(chunks)},
+    })
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+def _message(model: str, text: str, tool_name=None) -> dict:
+    """A complete (non-streaming) Message"""
+    if tool_name:
+        content = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:24]}", "name": tool_name, "input": _analysis()}]
+    else:
+        content = [{"type": "text", "text": text}]
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": content,
+        "stop_reason": "tool_use" if tool_name else "end_turn",
+        "stop_sequence": None,
+        "usage": _usage(len(text) // 4),
+    }
+
+
+def _rate_limit_headers() -> dict:
+    """Admit a request against the sliding-window RPM limit
+
+    Returns:
+        Rate-limit headers, plus retry-after if the request is rejected
+    """
+    if not REQUESTS_PER_MINUTE:
+        return {}
+    now = time.time()
+    while _request_times and now - _request_times[0] >= 60:
+        _request_times.popleft()
+    headers = {"anthropic-ratelimit-requests-limit": str(REQUESTS_PER_MINUTE)}
+    if len(_request_times) >= REQUESTS_PER_MINUTE:
+        headers["anthropic-ratelimit-requests-remaining"] = "0"
+        headers["retry-after"] = str(max(1, int(60 - (now - _request_times[0])) + 1))
+        return headers
+    _request_times.append(now)
+    headers["anthropic-ratelimit-requests-remaining"] = str(REQUESTS_PER_MINUTE - len(_request_times))
+    return headers
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    """Mimic the Messages API for both plain and streaming requests"""
+    headers = _rate_limit_headers()
+    if "retry-after" in headers:
+        return JSONResponse(
+            {"type": "error", "error": {"type": "rate_limit_error", "message": "Fake rate limit exceeded"}},
+            status_code=429,
+            headers=headers
+        )
+
+    body = await request.json()
+    model = body.get("model", "claude-fake")
+    text = _response_text()
+    tool_name = _forced_tool(body)
+
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream_message(model, text, tool_name),
+            media_type="text/event-stream",
+            headers=headers
+        )
+
+    await asyncio.sleep(RESPONSE_DELAY)
+    return JSONResponse(_message(model, text, tool_name), headers=headers)
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _batch_object(batch_id: str, base_url: str) -> dict:
+    batch = _batches[batch_id]
+    ended = time.time() - batch["createdAt"] >= BATCH_DELAY
+    counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    for outcome in batch["outcomes"].values():
+        counts[outcome if ended else "processing"] += 1
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": counts,
+        "created_at": _iso(batch["createdAt"]),
+        "expires_at": _iso(batch["createdAt"] + timedelta(days=1).total_seconds()),
+        "ended_at": _iso(batch["createdAt"] + BATCH_DELAY) if ended else None,
+        "cancel_initiated_at": None,
+        "archived_at": None,
+        "results_url": f"{base_url}v1/messages/batches/{batch_id}/results" if ended else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    """Accept a Message Batch and decide up front how each request will end"""
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+    outcomes = {}
+    for item in body["requests"]:
+        roll = random.random()
+        if roll < BATCH_ERROR_RATE:
+            outcomes[item["custom_id"]] = "errored"
+        elif roll < BATCH_ERROR_RATE + BATCH_EXPIRE_RATE:
+            outcomes[item["custom_id"]] = "expired"
+        else:
+            outcomes[item["custom_id"]] = "succeeded"
+    _batches[batch_id] = {
+        "createdAt": time.time(),
+        "outcomes": outcomes,
+        "params": {item["custom_id"]: item["params"] for item in body["requests"]},
+    }
+    return JSONResponse(_batch_object(batch_id, str(request.base_url)))
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_batch(batch_id: str, request: Request):
+    if batch_id not in _batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return JSONResponse(_batch_object(batch_id, str(request.base_url)))
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def batch_results(batch_id: str):
+    """JSONL results, one line per request"""
+    batch = _batches.get(batch_id)
+    if batch is None or time.time() - batch["createdAt"] < BATCH_DELAY:
+        raise HTTPException(status_code=404, detail="Batch results not available")
+
+    lines = []
+    for custom_id, outcome in batch["outcomes"].items():
+        params = batch["params"][custom_id]
+        if outcome == "succeeded":
+            result = {
+                "type": "succeeded",
+                "message": _message(params.get("model", "claude-fake"), _response_text(), _forced_tool(params)),
+            }
+        elif outcome == "errored":
+            result = {
+                "type": "errored",
+                "error": {"type": "error", "error": {"type": "api_error", "message": "Fake batch error"}},
+            }
+        else:
+            result = {"type": outcome}
+        lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="application/binary")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--delay", type=float, default=2.0, help="Seconds per request")
+    parser.add_argument("--stream-chunk", type=int, default=8, help="Characters per streamed delta")
+    parser.add_argument("--reply-padding", type=int, default=0, help="Extra explanation characters per reply")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests/minute before answering 429 (0 = unlimited)")
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds until a batch ends")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Share of batch requests that error")
+    parser.add_argument("--batch-expire-rate", type=float, default=0.0, help="Share of batch requests that expire")
+    args = parser.parse_args()
+
+    RESPONSE_DELAY = args.delay
+    REQUESTS_PER_MINUTE = args.rpm
+    STREAM_CHUNK_CHARS = args.stream_chunk
+    REPLY_PADDING = args.reply_padding
+    BATCH_DELAY = args.batch_delay
+    BATCH_ERROR_RATE = args.batch_error_rate
+    BATCH_EXPIRE_RATE = args.batch_expire_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
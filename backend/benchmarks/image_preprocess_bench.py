@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark image preprocessing: bytes sent and end-to-end latency
+
+Compares sending invoice photos as-is with sending them through
+app.image_preprocess. End-to-end latency covers preprocessing, base64
+encoding and the request to a local fake Anthropic server (zero model
+delay), so it isolates the cost of the payload itself.
+
+Usage:
+    python benchmarks/image_preprocess_bench.py                 # synthetic 12MP photo
+    python benchmarks/image_preprocess_bench.py photo1.jpg scan.png
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from PIL import Image, ImageDraw, ImageFilter
+from anthropic import AsyncAnthropic
+from app.analyzer import build_analysis_request, get_file_media_type
+from app.image_preprocess import preprocess_image, preprocess_image_async
+
+
+def synthetic_photo() -> bytes:
+    """A 12MP phone-style photo of a printed invoice: warm paper, text, sensor noise"""
+    width, height = 4032, 3024
+    image = Image.new("RGB", (width, height), (236, 228, 212))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(42)
+    for row in range(60):
+        y = 200 + row * 44
+        draw.text((300, y), f"Line item {row:03d}  Widget {rng.randint(1, 99)}  $ {rng.uniform(1, 500):8.2f}",
+                  fill=(30, 30, 30))
+    noise = Image.effect_noise((width, height), 18).convert("RGB")
+    image = Image.blend(image, noise, 0.08).filter(ImageFilter.GaussianBlur(0.6))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+async def time_request(client: AsyncAnthropic, file_bytes: bytes, media_type: str) -> float:
+    started = time.perf_counter()
+    await client.messages.create(**build_analysis_request(file_bytes, media_type))
+    return time.perf_counter() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*", help="Invoice images (default: synthetic photo)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fake-port", type=int, default=8787)
+    args = parser.parse_args()
+
+    samples = [(Path(p).name, Path(p).read_bytes(), get_file_media_type(p)) for p in args.images]
+    if not samples:
+        samples = [("synthetic_12mp.jpg", synthetic_photo(), "image/jpeg")]
+
+    fake = subprocess.Popen(
+        [sys.executable, "benchmarks/fake_anthropic.py", "--port", str(args.fake_port), "--delay", "0"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    client = AsyncAnthropic(api_key="fake-key", base_url=f"http://127.0.0.1:{args.fake_port}")
+    os.environ.setdefault("IMAGE_PREPROCESS_WORKERS", "2")
+
+    try:
+        for _ in range(50):
+            try:
+                await time_request(client, samples[0][1][:64], "image/png")
+                break
+            except Exception:
+                await asyncio.sleep(0.2)
+
+        print(f"{'image':<24} {'mode':<10} {'bytes':>12} {'b64 bytes':>12} {'prep ms':>9} {'e2e ms':>9}")
+        for name, original, media_type in samples:
+            rows = []
+            for mode in ("original", "processed"):
+                prep_total, e2e_total = 0.0, 0.0
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    if mode == "processed":
+                        payload, payload_type = await preprocess_image_async(original, media_type)
+                    else:
+                        payload, payload_type = original, media_type
+                    prep_total += time.perf_counter() - started
+                    await time_request(client, payload, payload_type)
+                    e2e_total += time.perf_counter() - started
+                b64_size = (len(payload) + 2) // 3 * 4
+                rows.append((mode, len(payload), b64_size, prep_total, e2e_total))
+
+            for mode, size, b64_size, prep_total, e2e_total in rows:
+                print(f"{name:<24} {mode:<10} {size:>12,} {b64_size:>12,} "
+                      f"{prep_total / args.repeat * 1000:>9.1f} {e2e_total / args.repeat * 1000:>9.1f}")
+
+        # Single-process cost for reference, without pool overhead
+        started = time.perf_counter()
+        preprocess_image(samples[0][1], samples[0][2])
+        print(f"\nInline preprocess_image: {(time.perf_counter() - started) * 1000:.1f} ms")
+    finally:
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
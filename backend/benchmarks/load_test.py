@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Load test /api/invoices/analyze against the local fake Anthropic server
+
+Starts the fake Anthropic server and a single-worker ShieldNet backend, then
+fires uploads at increasing concurrency. Every upload is a different image
+and the analysis cache is off, so each request really waits on the fake
+Claude call; the rate limiter is raised out of the way. With the async
+analyzer, throughput should scale with concurrency instead of staying at
+one request per delay.
+
+Usage:
+    python benchmarks/load_test.py --delay 1.0 --requests 32
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def tiny_png(rgb: bytes = b"\xff\xff\xff") -> bytes:
+    """Build a valid 1x1 PNG (white by default) - the fake server never reads the pixels"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    pixels = zlib.compress(b"\x00" + rgb)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", pixels) + chunk(b"IEND", b""))
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_for(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def run_level(base_url: str, concurrency: int, total: int, level: int = 0) -> float:
+    """Send `total` distinct uploads with at most `concurrency` in flight, return req/s
+
+    `level` makes the images of each run different from those of earlier runs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        async def one(i: int) -> None:
+            async with semaphore:
+                response = await client.post(
+                    "/api/invoices/analyze",
+                    files={"file": (f"loadtest_{i}.png", tiny_png(bytes([i % 256, i // 256 % 256, level % 256])),
+                                    "image/png")},
+                )
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return total / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay", type=float, default=1.0, help="Fake Claude latency (s)")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per level")
+    parser.add_argument("--levels", default="1,4,16,32", help="Concurrency levels")
+    parser.add_argument("--fake-port", type=int, default=8787)
+    parser.add_argument("--app-port", type=int, default=8788)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}"
+    env["ANTHROPIC_API_KEY"] = env.get("ANTHROPIC_API_KEY", "fake-key")
+    env["ANALYSIS_CACHE_SIZE"] = "0"
+    env["ANTHROPIC_RPM"] = "100000"
+    env["ANTHROPIC_ITPM"] = "100000000"
+
+    fake = start_process(
+        ["benchmarks/fake_anthropic.py", "--port", str(args.fake_port), "--delay", str(args.delay)],
+        env,
+    )
+    app = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--workers", "1",
+         "--log-level", "warning"],
+        env,
+    )
+    base_url = f"http://127.0.0.1:{args.app_port}"
+
+    try:
+        await wait_for(f"http://127.0.0.1:{args.fake_port}/docs")
+        await wait_for(f"{base_url}/health")
+
+        print(f"Fake Claude latency: {args.delay:.2f}s, {args.requests} requests per level\n")
+        print(f"{'concurrency':>12} {'req/s':>8} {'speedup':>8}")
+        baseline = None
+        for run, level in enumerate(int(x) for x in args.levels.split(",")):
+            throughput = await run_level(base_url, level, args.requests, run)
+            baseline = baseline or throughput
+            print(f"{level:>12} {throughput:>8.2f} {throughput / baseline:>7.1f}x")
+    finally:
+        app.terminate()
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Check that shared state stays correct when several processes write at once
+
+Two phases, each run against a fresh database:
+
+1. Storage: W processes import app.storage exactly as the server does and
+   each makes K rounds of writes - a wallet "pay" and "block", a transaction
+   and a timesSeen increment on one seeded threat. Afterwards the wallet
+   totals, transaction count and timesSeen must equal W * K.
+2. Workers: uvicorn is started with --workers W. The server keeps deferred
+   jobs, in-flight analyses and the rate limit budget per process, so it
+   must refuse to start rather than serve from several workers.
+
+With STORAGE_BACKEND=memory each process keeps its own copy, and the
+storage phase fails - run with --backend memory to see it.
+
+Usage:
+    python benchmarks/multi_worker_bench.py --workers 4 --rounds 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from load_test import start_process
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SHARED_VENDOR = "Shared Vendor Ltd"
+
+
+def seed() -> None:
+    """Runs in a child process: create the threat whose timesSeen is counted"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.models import ThreatRecord
+    from app import storage
+
+    storage.save_threat(ThreatRecord(
+        id="THR-SEED",
+        vendor=SHARED_VENDOR,
+        fraudScore=90,
+        firstSeen="2025-01-01",
+        timesSeen=0,
+        reason="Benchmark seed",
+        amountBlocked=0.0,
+    ))
+    storage.flush_storage()
+
+
+def write_rounds(worker: int, rounds: int) -> None:
+    """Runs in a child process: one worker's share of the writes"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.models import Transaction
+    from app import storage
+
+    for i in range(rounds):
+        storage.update_wallet_balance(1.0, "pay")
+        storage.update_wallet_balance(2.0, "block")
+        storage.save_transaction(Transaction(
+            id=f"TXN-W{worker}-{i:06d}",
+            status="blocked",
+            vendor=SHARED_VENDOR,
+            amount=2.0,
+            date="2025-01-01",
+            reason="Benchmark transaction",
+            invoiceId=f"INV-W{worker}-{i:06d}",
+        ))
+        storage.update_threat_seen_count(SHARED_VENDOR)
+    storage.flush_storage()
+
+
+def read_totals() -> None:
+    """Runs in a child process: print what a fresh worker would see"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app import storage
+
+    wallet = storage.get_wallet_balance()
+    threat = storage.find_threat_by_vendor(SHARED_VENDOR)
+    print(json.dumps({
+        "autoPaidThisMonth": wallet.autoPaidThisMonth,
+        "blockedThisMonth": wallet.blockedThisMonth,
+        "transactions": len(storage.get_all_transactions()),
+        "timesSeen": threat.timesSeen if threat else 0,
+    }))
+
+
+def child(role: str, env: dict, *extra: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, __file__, "--role", role, *extra],
+        env=env, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True,
+    )
+
+
+def storage_phase(env: dict, workers: int, rounds: int) -> bool:
+    child("seed", env).wait()
+    started = time.perf_counter()
+    procs = [child("write", env, "--worker", str(w), "--rounds", str(rounds)) for w in range(workers)]
+    for proc in procs:
+        proc.wait()
+    seconds = time.perf_counter() - started
+
+    totals = json.loads(child("read", env).communicate()[0].strip().splitlines()[-1])
+    expected = {
+        "autoPaidThisMonth": 1.0 * workers * rounds,
+        "blockedThisMonth": 2.0 * workers * rounds,
+        "transactions": workers * rounds,
+        "timesSeen": workers * rounds,
+    }
+    ok = totals == expected
+    print(f"storage: {workers} processes x {rounds} rounds in {seconds:.2f}s "
+          f"({workers * rounds * 4 / seconds:,.0f} writes/s)")
+    for key, value in expected.items():
+        print(f"  {key:<18} expected {value:>10,.0f}  got {totals[key]:>10,.0f}")
+    return ok
+
+
+async def worker_phase(env: dict, workers: int, port: int) -> bool:
+    app = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env,
+    )
+    started = time.perf_counter()
+    try:
+        returncode = await asyncio.to_thread(app.wait, 30.0)
+    except subprocess.TimeoutExpired:
+        returncode = None
+    finally:
+        app.terminate()
+        app.wait()
+
+    ok = returncode is not None
+    outcome = f"exited in {time.perf_counter() - started:.1f}s" if ok else "still serving after 30s"
+    print(f"workers: uvicorn --workers {workers} {outcome} (expected to refuse to start)")
+    return ok
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", default="shared")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=500, help="Write rounds per storage process")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--role", choices=("seed", "write", "read"), help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "seed":
+        return seed()
+    if args.role == "write":
+        return write_rounds(args.worker, args.rounds)
+    if args.role == "read":
+        return read_totals()
+
+    results = []
+    for phase in ("storage", "workers"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "STORAGE_BACKEND": args.backend,
+                "STORAGE_PATH": str(Path(tmp) / "bench.db"),
+                "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", "fake"),
+            }
+            if phase == "storage":
+                results.append(storage_phase(env, args.workers, args.rounds))
+            else:
+                results.append(await worker_phase(env, args.workers, args.port))
+
+    print("PASS" if all(results) else "FAIL")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
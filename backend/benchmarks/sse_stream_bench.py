@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Benchmark SSE framing of /api/invoices/analyze/stream
+
+Runs concurrent streamed analyses against a backend backed by the fake
+Anthropic server, once with every token sent as its own frame
+(STREAM_FLUSH_CHARS=0) and once with the default coalescing. Reports the
+backend's CPU time per streamed analysis, read from /proc (Linux only), and
+the SSE frames and events per second delivered to clients.
+
+Usage:
+    python benchmarks/sse_stream_bench.py --streams 16 --analyses 64
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+import httpx
+from load_test import start_process, tiny_png, wait_for
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time of a process"""
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+async def run_streams(base_url: str, streams: int, analyses: int, offset: int) -> dict:
+    """Stream `analyses` distinct invoices, `streams` at a time"""
+    semaphore = asyncio.Semaphore(streams)
+    totals = {"frames": 0, "events": 0}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        events_before = (await client.get("/api/invoices/metrics")).json()["sseFrames"]["events"]
+
+        async def one(i: int) -> None:
+            n = offset + i
+            png = tiny_png(bytes([n % 256, n // 256 % 256, 42]))
+            async with semaphore:
+                async with client.stream(
+                    "POST", "/api/invoices/analyze/stream",
+                    files={"file": (f"sse_{n}.png", png, "image/png")},
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            totals["frames"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(analyses)))
+        totals["seconds"] = time.perf_counter() - started
+
+        metrics = (await client.get("/api/invoices/metrics")).json()
+        totals["events"] = metrics["sseFrames"]["events"] - events_before
+    return totals
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=16, help="Concurrent streams")
+    parser.add_argument("--analyses", type=int, default=64, help="Streamed analyses per mode")
+    parser.add_argument("--delay", type=float, default=1.0, help="Fake generation time per reply (s)")
+    parser.add_argument("--reply-padding", type=int, default=4000, help="Extra reply characters")
+    parser.add_argument("--fake-port", type=int, default=8787)
+    parser.add_argument("--app-port", type=int, default=8788)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}"
+    env["ANTHROPIC_API_KEY"] = env.get("ANTHROPIC_API_KEY", "fake-key")
+    env["ANALYSIS_CACHE_SIZE"] = "0"
+    env["ANALYZER_FAST_MODEL"] = ""
+    env["IMAGE_PREPROCESS_WORKERS"] = "0"
+    env["ANTHROPIC_RPM"] = "100000"
+    env["ANTHROPIC_ITPM"] = "100000000"
+
+    # 4-character deltas approximate one token each
+    fake = start_process(
+        ["benchmarks/fake_anthropic.py", "--port", str(args.fake_port), "--delay", str(args.delay),
+         "--stream-chunk", "4", "--reply-padding", str(args.reply_padding)],
+        env,
+    )
+    try:
+        await wait_for(f"http://127.0.0.1:{args.fake_port}/docs")
+        print(f"{args.analyses} analyses, {args.streams} concurrent streams, "
+              f"{args.delay:.1f}s per reply\n")
+        print(f"{'mode':<12} {'CPU ms/analysis':>16} {'frames/analysis':>16} {'frames/s':>10} {'events/s':>10}")
+
+        for mode, flush_chars in (("per-token", "0"), ("coalesced", os.getenv("STREAM_FLUSH_CHARS", "256"))):
+            app = start_process(
+                ["-m", "uvicorn", "main:app", "--port", str(args.app_port), "--workers", "1",
+                 "--log-level", "warning"],
+                {**env, "STREAM_FLUSH_CHARS": flush_chars},
+            )
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            try:
+                await wait_for(f"{base_url}/health")
+                # Warm up imports and connections outside the measurement
+                await run_streams(base_url, 1, 1, offset=10_000)
+                cpu_before = cpu_seconds(app.pid)
+                totals = await run_streams(base_url, args.streams, args.analyses, offset=0)
+                cpu = cpu_seconds(app.pid) - cpu_before
+            finally:
+                app.terminate()
+                app.wait()
+
+            print(f"{mode:<12} {cpu / args.analyses * 1000:>16.1f} "
+                  f"{totals['frames'] / args.analyses:>16.1f} "
+                  f"{totals['frames'] / totals['seconds']:>10.0f} "
+                  f"{totals['events'] / totals['seconds']:>10.0f}")
+    finally:
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark the memory and SQLite storage backends
+
+For each backend and size, a fresh process writes N transactions through the
+app.storage API and then reads them back: all at once, and filtered by
+status. It reports throughput, peak RSS and, for SQLite, the database size.
+Write throughput includes building each Transaction model.
+The backend is picked through STORAGE_BACKEND, exactly as the server does.
+
+Usage:
+    python benchmarks/storage_bench.py                        # 10k, 100k, 1M
+    python benchmarks/storage_bench.py --sizes 10000,100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STATUSES = ("paid", "held", "blocked")
+
+
+def run_case(size: int) -> dict:
+    """Runs inside the child process with STORAGE_BACKEND already set"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.models import Transaction
+    from app import storage
+
+    # Generated lazily, so peak RSS reflects what the backend keeps
+    transactions = (
+        Transaction(
+            id=f"TXN-{i:08d}",
+            status=STATUSES[i % 3],
+            vendor=f"Vendor {i % 1000}",
+            amount=round(10 + (i % 9973) * 0.37, 2),
+            date=f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            reason="Benchmark transaction",
+            invoiceId=f"INV-{i:08d}",
+        )
+        for i in range(size)
+    )
+
+    started = time.perf_counter()
+    for transaction in transactions:
+        storage.save_transaction(transaction)
+    storage.flush_storage()
+    write_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    read_count = len(storage.get_all_transactions())
+    read_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    blocked_count = len(storage.get_all_transactions("blocked"))
+    filter_seconds = time.perf_counter() - started
+
+    assert read_count == size and blocked_count == size // 3
+    return {
+        "writesPerSecond": size / write_seconds,
+        "readAllSeconds": read_seconds,
+        "filterSeconds": filter_seconds,
+        "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--case", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case)))
+        return
+
+    print(f"{'backend':<8} {'transactions':>12} {'writes/s':>10} {'read all s':>11} "
+          f"{'filter s':>9} {'peak RSS MB':>12} {'db MB':>7}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        for backend in ("memory", "sqlite"):
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = Path(tmp) / "bench.db"
+                env = {**os.environ, "STORAGE_BACKEND": backend, "STORAGE_PATH": str(db_path)}
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", str(size)],
+                    env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                db_mb = sum(p.stat().st_size for p in Path(tmp).iterdir()) / 1e6 if backend == "sqlite" else 0
+            print(f"{backend:<8} {size:>12,} {result['writesPerSecond']:>10,.0f} "
+                  f"{result['readAllSeconds']:>11.2f} {result['filterSeconds']:>9.2f} "
+                  f"{result['peakRssMb']:>12.0f} {db_mb:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
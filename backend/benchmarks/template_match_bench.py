@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Benchmark known-fraud template matching in app/template_hash.py on rendered pages
+
+Draws invoice first pages the way a PDF's text layer is drawn for hashing -
+each text run as a box - with logos, table rules and shaded header rows,
+and hashes every page with phash(). Pages come from random layouts, 5 per
+layout, each with its own text, amounts and a couple of table rows more or
+less. A third of the layouts are plain: no logo, rules or shading.
+
+The report first gives, for Hamming distances k, the share of page pairs
+within k that share a layout (true matches) and that don't (false
+matches). Then all N hashes are indexed in a TemplateIndex, which is
+queried with new pages - half from indexed layouts, half from layouts it
+has never seen - and compared with a linear scan over every hash: latency,
+the share of hashes a lookup checks, and the share of the scan's matches
+it finds.
+
+Usage:
+    python benchmarks/template_match_bench.py                    # 100k pages, k = 36, 44, 52
+    python benchmarks/template_match_bench.py --size 20000 --distances 44
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from PIL import Image, ImageDraw  # noqa: E402
+from app.template_hash import HASH_BITS, HASH_PAGE_WIDTH, TemplateIndex, hamming_distance, phash  # noqa: E402
+
+PAGES_PER_LAYOUT = 5
+PAGE_HEIGHT = round(HASH_PAGE_WIDTH * 11 / 8.5)
+LIMIT = 5
+# Random pairs of pages from different layouts measured for false matches
+UNRELATED_PAIRS = 1000000
+
+
+def random_layout(rng: random.Random, plain: bool) -> dict:
+    width = HASH_PAGE_WIDTH
+    columns = rng.randint(2, 5)
+    return {
+        "seed": rng.getrandbits(32),
+        "margin": rng.randint(24, 66),
+        "font": rng.uniform(5, 9),
+        "logo": None if plain or rng.random() < 0.3 else (
+            rng.choice(("left", "right")), rng.randint(36, 96), rng.randint(24, 60), rng.choice((30, 60, 90))
+        ),
+        "header_align": rng.choice(("left", "right", "center")),
+        "header_lines": rng.randint(2, 6),
+        "title_y": rng.randint(72, 157),
+        "table_y": rng.randint(180, 290),
+        "columns": sorted(rng.sample(range(0, 100), columns)),
+        "row_height": rng.randint(11, 20),
+        "rows": rng.randint(2, 14),
+        "rules": not plain and rng.random() < 0.5,
+        "shaded": not plain and rng.random() < 0.5,
+        "totals_align": rng.choice(("left", "right")),
+        "footer_y": rng.randint(512, width * 6 // 5),
+        "footer_lines": rng.randint(1, 4),
+    }
+
+
+def draw_page(layout: dict, rng: random.Random) -> Image.Image:
+    """One invoice cut from `layout`, with its own text and row count"""
+    page = Image.new("L", (HASH_PAGE_WIDTH, PAGE_HEIGHT), 255)
+    draw = ImageDraw.Draw(page)
+    margin, size = layout["margin"], layout["font"]
+    right = HASH_PAGE_WIDTH - margin
+
+    def run(x: float, y: float, chars: int) -> None:
+        # As app/template_hash.py draws a text run: half an em per character
+        draw.rectangle((x, y - size, x + chars * size * 0.5, y), fill=0)
+
+    if layout["logo"]:
+        side, width, height, shade = layout["logo"]
+        x = margin if side == "left" else right - width
+        draw.rectangle((x, 24, x + width, 24 + height), fill=shade)
+    for line in range(layout["header_lines"]):
+        chars = rng.randint(12, 36)
+        x = {
+            "left": margin,
+            "right": right - chars * size * 0.5,
+            "center": (HASH_PAGE_WIDTH - chars * size * 0.5) / 2,
+        }[layout["header_align"]]
+        run(x, layout["title_y"] - 54 + line * size * 1.4, chars)
+    run(margin, layout["title_y"], rng.randint(11, 14))
+    run(margin, layout["title_y"] + size * 2, rng.randint(14, 18))
+
+    top, row_height = layout["table_y"], layout["row_height"]
+    rows = max(1, layout["rows"] + rng.randint(-2, 2))
+    if layout["shaded"]:
+        draw.rectangle((margin, top, right, top + row_height), fill=200)
+    for row in range(rows + 1):
+        y = top + row * row_height
+        for column, offset in enumerate(layout["columns"]):
+            chars = rng.randint(4, 10) if row == 0 else rng.randint(6, 24) if column == 0 else rng.randint(4, 8)
+            run(margin + offset * (right - margin) / 100 + 2, y + row_height - 3, chars)
+        if layout["rules"]:
+            draw.line((margin, y, right, y), fill=0)
+    totals_x = right - 90 if layout["totals_align"] == "right" else margin
+    run(totals_x, top + (rows + 2) * row_height, rng.randint(12, 16))
+    for line in range(layout["footer_lines"]):
+        run(margin, layout["footer_y"] + line * size * 1.4, rng.randint(20, 70))
+    return page
+
+
+def hash_layout(layout: dict) -> list:
+    """Hashes of PAGES_PER_LAYOUT pages cut from `layout`"""
+    rng = random.Random(layout["seed"])
+    return [phash(draw_page(layout, rng)) for _ in range(PAGES_PER_LAYOUT)]
+
+
+def linear_search(hashes: list, query: int, max_distance: int) -> list:
+    matches = sorted(
+        (distance, entry)
+        for entry, value in enumerate(hashes)
+        if (distance := hamming_distance(query, value)) <= max_distance
+    )
+    return [(f"T{entry}", distance) for distance, entry in matches]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000, help="Pages indexed")
+    parser.add_argument("--distances", default="36,44,52")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--scan-queries", type=int, default=100, help="Queries also run as a linear scan")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    layouts = [random_layout(rng, plain=i % 3 == 0) for i in range(args.size // PAGES_PER_LAYOUT)]
+    started = time.perf_counter()
+    with ProcessPoolExecutor() as pool:
+        pages = list(pool.map(hash_layout, layouts, chunksize=64))
+    hashes = [value for layout_hashes in pages for value in layout_hashes]
+    print(f"{len(hashes):,} pages from {len(layouts):,} layouts drawn and hashed "
+          f"in {time.perf_counter() - started:.0f}s")
+
+    distances = [int(d) for d in args.distances.split(",")]
+    same = [hamming_distance(a, b) for layout_hashes in pages for a, b in combinations(layout_hashes, 2)]
+    unrelated = []
+    while len(unrelated) < min(UNRELATED_PAIRS, len(hashes) ** 2 // 2):
+        a, b = rng.randrange(len(hashes)), rng.randrange(len(hashes))
+        if a // PAGES_PER_LAYOUT != b // PAGES_PER_LAYOUT:
+            unrelated.append(hamming_distance(hashes[a], hashes[b]))
+    print(f"\npages within k bits (of {HASH_BITS}): {len(same):,} same-layout pairs, "
+          f"{len(unrelated):,} unrelated pairs\n")
+    print(f"{'k':>3} {'true match':>11} {'false match':>12}")
+    for max_distance in distances:
+        print(f"{max_distance:>3} {sum(d <= max_distance for d in same) / len(same):>11.1%} "
+              f"{sum(d <= max_distance for d in unrelated) / len(unrelated):>12.4%}")
+
+    # The index keeps each distinct hash once, so the scan does too
+    distinct = list(dict.fromkeys(hashes))
+    index = TemplateIndex()
+    started = time.perf_counter()
+    for entry, value in enumerate(distinct):
+        index.add(f"T{entry}", f"{value:0{HASH_BITS // 4}x}")
+    print(f"\n{len(index):,} distinct hashes indexed in {time.perf_counter() - started:.1f}s")
+
+    # New pages of indexed layouts, then pages of layouts never indexed
+    queries = [
+        phash(draw_page(rng.choice(layouts), rng)) for _ in range(args.queries // 2)
+    ] + [
+        phash(draw_page(random_layout(rng, plain=rng.random() < 1 / 3), rng))
+        for _ in range(args.queries - args.queries // 2)
+    ]
+    order = list(range(len(queries)))
+    rng.shuffle(order)
+    queries = [f"{queries[i]:0{HASH_BITS // 4}x}" for i in order]
+    known = [i < args.queries // 2 for i in order]
+    checked = sorted(len(index.candidates(query)) / len(index) for query in queries)
+    print(f"a lookup checks {percentile(checked, 0.5):.1%} of hashes (p50), "
+          f"{percentile(checked, 0.9):.1%} (p90)\n")
+
+    print(f"{'k':>3} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'scan p50 ms':>12} "
+          f"{'known hit':>10} {'new hit':>8} {'recall':>8}")
+    for max_distance in distances:
+        latencies, hits = [], {True: 0, False: 0}
+        for query, is_known in zip(queries, known):
+            started = time.perf_counter()
+            matches = index.search(query, max_distance, LIMIT)
+            latencies.append(time.perf_counter() - started)
+            hits[is_known] += bool(matches)
+        latencies.sort()
+
+        scan_latencies, expected_matches, found_matches = [], 0, 0
+        for query in queries[:args.scan_queries]:
+            started = time.perf_counter()
+            expected = linear_search(distinct, int(query, 16), max_distance)
+            scan_latencies.append(time.perf_counter() - started)
+            found = set(index.search(query, max_distance, len(distinct)))
+            expected_matches += len(expected)
+            found_matches += sum(match in found for match in expected)
+        scan_latencies.sort()
+
+        recall = f"{found_matches / expected_matches:.1%}" if expected_matches else "-"
+        print(f"{max_distance:>3} {percentile(latencies, 0.5) * 1000:>8.3f} "
+              f"{percentile(latencies, 0.9) * 1000:>8.3f} {percentile(latencies, 0.99) * 1000:>8.3f} "
+              f"{percentile(scan_latencies, 0.5) * 1000:>12.1f} {hits[True] / sum(known):>10.1%} "
+              f"{hits[False] / (len(known) - sum(known)):>8.1%} {recall:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Benchmark paginated transaction queries on both storage backends
+
+For each backend and size, a fresh process saves N transactions, 30 seconds
+apart over 100 vendors, through the app.storage API, then times 50-row
+pages from query_transactions:
+
+- first: the newest page, no filters
+- deep: a page continued from a cursor in the middle of the history
+- status / vendor: the newest page for one status or one vendor
+- dates: a page from a one-week date range
+- amount: the newest page of transactions over 3,000 (about 15% of them)
+- old way: what GET /api/transactions used to do - copy, sort, slice
+
+Page times should stay flat as N grows: O(log n + page), where the old way
+is O(n log n).
+
+Usage:
+    python benchmarks/transaction_query_bench.py                    # 10k, 100k, 1M
+    python benchmarks/transaction_query_bench.py --sizes 1000000 --backends sqlite
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STATUSES = ("paid", "held", "blocked")
+PAGE = 50
+CASES = ("first", "deep", "status", "vendor", "dates", "amount", "old way")
+
+
+def timed(fn, repeats: int) -> float:
+    """Median milliseconds per call"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+
+def run_case(size: int) -> dict:
+    """Runs inside the child process with STORAGE_BACKEND already set"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.models import Transaction
+    from app import storage
+
+    start = datetime(2025, 1, 1)
+    for i in range(size):
+        storage.save_transaction(Transaction(
+            id=f"TXN-{i:08d}",
+            status=STATUSES[i % 3],
+            vendor=f"Vendor {i % 100}",
+            amount=round(10 + (i * 7919 % 10007) * 0.35, 2),
+            date=(start + timedelta(seconds=30 * i)).isoformat(timespec="seconds"),
+            reason="Benchmark transaction",
+            invoiceId=f"INV-{i:08d}",
+        ))
+    storage.flush_storage()
+
+    middle = (start + timedelta(seconds=15 * size)).isoformat(timespec="seconds")
+    _, deep_cursor = storage.query_transactions(date_before=middle, limit=PAGE)
+    week_from = (start + timedelta(seconds=10 * size)).date()
+
+    def old_way():
+        transactions = storage.get_all_transactions()
+        transactions.sort(key=lambda x: x.date, reverse=True)
+        return transactions[:PAGE]
+
+    queries = {
+        "first": lambda: storage.query_transactions(limit=PAGE),
+        "deep": lambda: storage.query_transactions(cursor=deep_cursor, limit=PAGE),
+        "status": lambda: storage.query_transactions(status="blocked", limit=PAGE),
+        "vendor": lambda: storage.query_transactions(vendor="vendor 41", limit=PAGE),
+        "dates": lambda: storage.query_transactions(
+            date_from=week_from.isoformat(),
+            date_before=(week_from + timedelta(days=7)).isoformat(),
+            limit=PAGE
+        ),
+        "amount": lambda: storage.query_transactions(min_amount=3000, limit=PAGE),
+    }
+    for name, query in queries.items():
+        page, _ = query()
+        assert len(page) == PAGE, f"{name}: {len(page)} rows"
+    result = {name: timed(query, 200) for name, query in queries.items()}
+    result["old way"] = timed(old_way, 3)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--backends", default="memory,sqlite")
+    parser.add_argument("--case", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case)))
+        return
+
+    print(f"median ms per {PAGE}-row page\n")
+    print(f"{'backend':<8} {'transactions':>12} " + " ".join(f"{name:>8}" for name in CASES))
+    for size in (int(s) for s in args.sizes.split(",")):
+        for backend in args.backends.split(","):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = {**os.environ, "STORAGE_BACKEND": backend, "STORAGE_PATH": str(Path(tmp) / "bench.db")}
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", str(size)],
+                    env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+                ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{backend:<8} {size:>12,} " + " ".join(f"{result[name]:>8.3f}" for name in CASES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark look-alike vendor search in app/vendor_match.py
+
+Indexes N synthetic vendor names and times searches at the configured
+similarity threshold. The names are deliberately crowded: words come from
+a small syllable alphabet with a skewed frequency, half of them carry one
+of twenty industry words ("supplies", "consulting", ...), so trigram lists
+are long. Half the queries are new names, half are typos (one character
+inserted, dropped or replaced) of indexed names. For the typos the report
+also gives recall: how often the original name is among the top 5 matches.
+
+Usage:
+    python benchmarks/vendor_match_bench.py                     # 10k, 100k, 300k
+    python benchmarks/vendor_match_bench.py --sizes 100000 --threshold 0.7
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.vendor_match import VENDOR_MATCH_THRESHOLD, VendorTrigramIndex  # noqa: E402
+
+INDUSTRY_WORDS = [
+    "supplies", "services", "consulting", "logistics", "solutions", "systems",
+    "trading", "partners", "group", "holdings", "technologies", "media", "labs",
+    "industries", "electric", "construction", "software", "analytics", "freight",
+    "marketing",
+]
+
+
+def name_generator(rng: random.Random):
+    consonants, vowels = "bcdfghjklmnprstvwz", "aeiou"
+    codas = ["", "", "", "n", "r", "s", "l", "t", "ck", "st"]
+
+    def word() -> str:
+        return "".join(
+            rng.choice(consonants) + rng.choice(vowels) + rng.choice(codas)
+            for _ in range(rng.randint(2, 3))
+        )
+
+    vocabulary = [word() for _ in range(30000)]
+    cumulative = list(itertools.accumulate(1 / (i + 1) ** 0.8 for i in range(len(vocabulary))))
+
+    def name() -> str:
+        words = rng.choices(vocabulary, cum_weights=cumulative, k=rng.randint(1, 2))
+        if rng.random() < 0.5:
+            words.append(rng.choice(INDUSTRY_WORDS))
+        return " ".join(words) + rng.choice(["", "", " llc", " inc", " ltd"])
+
+    return name
+
+
+def typo(rng: random.Random, text: str) -> str:
+    i = rng.randrange(len(text))
+    edit = rng.randrange(3)
+    if edit == 0:
+        return text[:i] + text[i] + text[i:]
+    if edit == 1:
+        return text[:i] + text[i + 1:]
+    return text[:i] + rng.choice("aeiou") + text[i + 1:]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,300000")
+    parser.add_argument("--threshold", type=float, default=VENDOR_MATCH_THRESHOLD)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"threshold {args.threshold}\n")
+    print(f"{'names':>8} {'distinct':>9} {'build s':>8} {'p50 ms':>7} {'p90 ms':>7} "
+          f"{'p99 ms':>7} {'typo recall':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        rng = random.Random(7)
+        name = name_generator(rng)
+        names = [name() for _ in range(size)]
+
+        index = VendorTrigramIndex()
+        started = time.perf_counter()
+        for i, vendor in enumerate(names):
+            index.add(f"THR-{i}", vendor)
+        build_seconds = time.perf_counter() - started
+
+        # Typos of indexed names, paired with the ID the original was indexed under
+        typos = []
+        for _ in range(args.queries // 2):
+            original = rng.choice(names)
+            typos.append((index.search(original, 1.0, 1)[0][0], typo(rng, original)))
+        queries = [name() for _ in range(args.queries - len(typos))] + [query for _, query in typos]
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, args.threshold)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+
+        found = sum(
+            any(match[0] == original for match in index.search(query, args.threshold, 5))
+            for original, query in typos
+        )
+        print(f"{size:>8,} {len(index):>9,} {build_seconds:>8.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>7.3f} {percentile(latencies, 0.9) * 1000:>7.3f} "
+              f"{percentile(latencies, 0.99) * 1000:>7.3f} {found / len(typos):>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
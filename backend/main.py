@@ -1,7 +1,14 @@
 """ShieldNet FastAPI Backend"""
 import os
+import sys
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # fcntl is Unix-only - elsewhere a second worker isn't detected
+    fcntl = None
+
 # Load environment variables FIRST (before importing routers)
 load_dotenv()
 
@@ -9,11 +16,49 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import invoices, threats, wallet, transactions
 
+# Held for the life of the server process; see claim_single_worker
+WORKER_LOCK_FILE = invoices.UPLOAD_DIR / ".worker.lock"
+_worker_lock = None
+
+SINGLE_WORKER_MESSAGE = (
+    "ShieldNet runs as a single worker process: deferred jobs, the in-flight "
+    "analysis registry that keeps an invoice from being paid twice, and the "
+    "Anthropic rate limit budget are all kept per process"
+)
+
+
+def claim_single_worker() -> None:
+    """Refuse to start if another server process already runs from this directory
+
+    Raises:
+        RuntimeError: if another worker holds the lock (e.g. uvicorn --workers 4)
+    """
+    global _worker_lock
+    if fcntl is None:
+        return
+    lock = open(WORKER_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        raise RuntimeError(f"Another ShieldNet worker is already running. {SINGLE_WORKER_MESSAGE}.")
+    _worker_lock = lock
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # At startup rather than import: `python main.py` imports this module in
+    # the reloader process too, which never serves requests
+    claim_single_worker()
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title="ShieldNet API",
     description="AI-powered invoice fraud detection with shared threat intelligence",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS - allow all origins for development
@@ -23,6 +68,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Include routers
@@ -55,4 +101,8 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
+
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    if workers > 1:
+        sys.exit(f"UVICORN_WORKERS={workers} is not supported. {SINGLE_WORKER_MESSAGE}; set UVICORN_WORKERS=1.")
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -2,7 +2,7 @@ import { useState } from "react";
 import { Upload, FileText, CheckCircle, XCircle, AlertCircle } from "lucide-react";
 import { Card } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
-import { analyzeInvoiceStreaming, reportThreat } from "@/services/api";
+import { analyzeInvoiceStreaming } from "@/services/api";
 import { useToast } from "@/hooks/use-toast";
 
 interface InvoiceAnalysisProps {
@@ -62,18 +62,7 @@ export const InvoiceAnalysis = ({ onAnalysisComplete }: InvoiceAnalysisProps) =>
 
           console.log("Analysis finished:", analysisResult);
 
-          // If blocked, report to threat network
-          if (analysisResult.status === 'blocked') {
-            console.log("Reporting threat to network...");
-            await reportThreat({
-              invoiceId: analysisResult.invoiceId,
-              vendor: analysisResult.vendor,
-              fraudScore: analysisResult.fraudScore,
-              reason: analysisResult.explanation,
-              amount: analysisResult.amount,
-            });
-            console.log("Threat reported successfully");
-          }
+          // Blocked invoices are reported to the threat network by the backend
 
           successCount++;
 
@@ -142,7 +142,7 @@ export const ThreatAnalytics = () => {
           <div>
             <h2 className="text-2xl font-bold text-white mb-1">Invoice Analysis History</h2>
             <p className="text-sm text-gray-400">
-              All analyzed invoices with AI-powered fraud detection results ({invoiceHistory.length} invoices)
+              Most recently analyzed invoices with AI-powered fraud detection results ({invoiceHistory.length} invoices)
             </p>
           </div>
           <div className="w-12 h-12 rounded-xl bg-badge-blue flex items-center justify-center shadow-lg shadow-blue-500/40">
@@ -312,7 +312,7 @@ export const ThreatAnalytics = () => {
           <div>
             <h2 className="text-2xl font-bold text-white mb-1">Detected Threats</h2>
             <p className="text-sm text-gray-400">
-              Blocked invoices shared with ShieldNet network
+              Top blocked invoices shared with ShieldNet network, by amount blocked
             </p>
           </div>
           <div className="flex items-center gap-2">
@@ -364,7 +364,7 @@ export const ThreatAnalytics = () => {
                     {threat.templateHash && (
                       <div>
                         <p className="text-gray-400 mb-1">Template Hash</p>
-                        <p className="text-white font-mono text-xs">{threat.templateHash}</p>
+                        <p className="text-white font-mono text-xs break-all">{threat.templateHash}</p>
                       </div>
                     )}
                   </div>
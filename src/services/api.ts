@@ -14,6 +14,7 @@ export interface LocalCheck {
 export interface NetworkSignal {
   type: 'flagged' | 'seen' | 'clean';
   description: string;
+  similarity?: number; // 0-1, for look-alike vendor matches
 }
 
 export interface InvoiceAnalysisResult {
@@ -27,6 +28,7 @@ export interface InvoiceAnalysisResult {
   vendor: string;
   amount: number;
   currency: string;
+  templateHash?: string; // perceptual hash of the first page
 }
 
 export interface ThreatRecord {
@@ -40,12 +42,20 @@ export interface ThreatRecord {
   templateHash?: string;
 }
 
+export interface RollupBucket {
+  key: string; // ISO day or normalized vendor name
+  blockedAmount: number;
+  blockedInvoices: number;
+  threatsDetected: number;
+}
+
 export interface ThreatAnalytics {
   totalBlockedAmount: number;
   totalBlockedInvoices: number;
   totalThreatsDetected: number;
   rewardsEarned: number;
-  threats: ThreatRecord[];
+  threats: ThreatRecord[]; // top threats by amount blocked
+  daily: RollupBucket[]; // latest days with activity, newest first
 }
 
 export interface Transaction {
@@ -175,7 +185,7 @@ export const analyzeInvoiceStreaming = async (
 };
 
 /**
- * Get invoice analysis history
+ * Get the most recent page of invoice analysis history (the browser revalidates it by ETag)
  */
 export const getInvoiceHistory = async (): Promise<InvoiceAnalysisResult[]> => {
   const url = `${API_BASE_URL}/api/invoices/history`;
@@ -261,6 +271,7 @@ export const reportThreat = async (threatData: {
   fraudScore: number;
   reason: string;
   amount: number;
+  templateHash?: string;
 }): Promise<{ success: boolean; threatId: string }> => {
   const response = await fetch(`${API_BASE_URL}/api/threats/report`, {
     method: 'POST',